@@ -1,7 +1,17 @@
-from fastapi import APIRouter
+import asyncio
+from dataclasses import asdict
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from ..core import loop_monitor, memory, profiling, tracing
 from ..core.config import settings
+from ..core.registry import reload_registry
+from ..core.services import maintenance, migration, reindex
+from ..core.services.rag_engine import RAGEngine
+from ..core.web.dependencies import get_rag_engine
 from ..models.schemas import TenantInfo, TenantListResponse
+from .embed_ingest import _cost, _rpm
 
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -14,3 +24,234 @@ async def list_tenants() -> TenantListResponse:
         for name, key in settings.embed_api_keys_map.items()
     ]
     return TenantListResponse(tenants=items)
+
+
+@router.post("/config/reload")
+async def reload_config(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """テナントキーと料金表を環境変数から再読み込み（このワーカーのみ）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    try:
+        counts = reload_registry()
+    except ValueError as e:
+        raise HTTPException(400, f"設定の再読み込みに失敗しました: {e}")
+    return {"status": "ok", **counts}
+
+
+@router.post("/maintenance/run")
+async def run_maintenance(
+    task: list[str] | None = Query(None),
+    rag: RAGEngine = Depends(get_rag_engine),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """ベクトルストアの保守タスクを手動実行（task 未指定で全タスク）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    if task:
+        unknown = set(task) - set(maintenance.TASKS)
+        if unknown:
+            raise HTTPException(400, f"unknown task: {', '.join(sorted(unknown))}")
+    report = await asyncio.to_thread(maintenance.run_maintenance, rag, task)
+    if report is None:
+        raise HTTPException(409, "maintenance already running")
+    return {"status": "ok", **report}
+
+
+@router.get("/maintenance")
+async def maintenance_history(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """このワーカーで実行した保守タスクの直近の結果（所要時間を含む）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return {"tasks": list(maintenance.TASKS), "history": list(maintenance.history)}
+
+
+@router.post("/reindex")
+async def start_reindex(
+    tenant: str = Query(..., min_length=1),
+    dimensions: int | None = Query(None, ge=1),
+    model: str | None = Query(None),
+    rag: RAGEngine = Depends(get_rag_engine),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """テナントを新しい埋め込み条件で再インデックス（完了まで現在のインデックスで応答）
+
+    dimensions / model 未指定の場合は現在の設定値（EMBEDDING_DIMENSIONS / EMBEDDING_MODEL）
+    """
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    try:
+        return reindex.start_reindex(rag, tenant, dimensions, model)
+    except reindex.ReindexConflict as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/reindex")
+async def reindex_status(
+    rag: RAGEngine = Depends(get_rag_engine),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """このワーカーで実行した再インデックスの進捗と、テナントごとの現在のインデックス"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return {
+        "jobs": list(reindex.jobs.values()),
+        "indexes": {
+            tenant: asdict(spec)
+            for tenant, spec in rag.index_registry.tenants().items()
+        },
+    }
+
+
+@router.post("/migration")
+async def start_migration(
+    model: str | None = Query(None),
+    dimensions: int | None = Query(None, ge=1),
+    rag: RAGEngine = Depends(get_rag_engine),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """全テナントを新しい埋め込みモデルへ移行（切り替えまで現在のインデックスで応答）
+
+    model / dimensions 未指定の場合は現在の設定値（EMBEDDING_MODEL / EMBEDDING_DIMENSIONS）。
+    同じ条件で再実行すると、前回作りかけた分を引き継いで再開する。
+    """
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    try:
+        return await migration.start_migration(rag, model, dimensions)
+    except reindex.ReindexConflict as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/migration")
+async def migration_status(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """埋め込みモデル移行のテナントごとの進捗（どのワーカーからも参照できる）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return await asyncio.to_thread(migration.load_state)
+
+
+@router.get("/traces")
+async def slow_traces(
+    limit: int = Query(20, ge=1, le=200),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """保存済みのリクエストトレースを遅い順に返す（このワーカーのみ）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return {
+        "traces": tracing.slowest(limit),
+        "buffered": len(tracing.buffer),
+        "seen": tracing.buffer.seen,
+        "slow_ms": settings.trace_slow_ms,
+        "sample_rate": settings.trace_sample_rate,
+    }
+
+
+@router.get("/profiles")
+async def list_profiles(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """保存済みのリクエストプロファイル（新しい順。このワーカーの保存先のみ）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return {"profiles": await asyncio.to_thread(profiling.list_profiles)}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|raw)$"),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls|ncalls)$"),
+    limit: int = Query(40, ge=1, le=500),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+):
+    """プロファイルを pstats のテキスト（format=text）または .prof ファイル（raw）で返す"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    if format == "raw":
+        path = profiling.profile_file(profile_id)
+        if path is None:
+            raise HTTPException(404, "profile not found")
+        return FileResponse(path, media_type="application/octet-stream")
+    text = await asyncio.to_thread(profiling.report, profile_id, sort, limit)
+    if text is None:
+        raise HTTPException(404, "profile not found")
+    return PlainTextResponse(text)
+
+
+@router.get("/memory")
+async def memory_usage(
+    limit: int = Query(20, ge=1, le=200),
+    reset: bool = Query(False),
+    rag: RAGEngine = Depends(get_rag_engine),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """キャッシュ・制限テーブル・インデックスの概算サイズ（このワーカーのみ）
+
+    tracemalloc の実行中は、基準スナップショットからの増加が大きい確保元も返す
+    （reset=true で今回を次の基準にする）。
+    """
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+
+    def collect() -> dict:
+        counter = memory.SizeCounter()
+        report = {
+            "process": memory.process_memory(),
+            "engine": rag.memory_usage(counter),
+            "limiters": [
+                memory.table("rpm", _rpm, counter),
+                memory.table("daily_cost", _cost, counter),
+            ],
+            "trace_buffer": memory.table("traces", tracing.buffer, counter),
+        }
+        report["truncated"] = counter.truncated
+        report["tracemalloc"] = (
+            memory.top_allocations(limit, reset) or memory.tracing_status()
+        )
+        return report
+
+    return await asyncio.to_thread(collect)
+
+
+@router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(1, ge=1, le=25),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """tracemalloc を開始し基準スナップショットを取る（計測中は確保が遅くなる）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return await asyncio.to_thread(memory.start_tracing, frames)
+
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    return memory.stop_tracing()
+
+
+@router.get("/loop")
+async def loop_status(
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict:
+    """イベントループの遅延と、採取したブロッキング時のスタック（このワーカーのみ）"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    monitor = loop_monitor.monitor
+    if monitor is None:
+        return {"running": False}
+    return monitor.status()
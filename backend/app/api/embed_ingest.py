@@ -4,6 +4,7 @@ import json
 import hashlib
 import datetime as dt
 import asyncio
+import logging
 from uuid import uuid4
 import hashlib
 
@@ -27,9 +28,14 @@ from redis import Redis
 import os
 
 from ..core.config import settings
-from ..core.web.dependencies import get_rag_engine
-from ..core.services.rag_engine import RAGEngine
+from ..core import tracing
+from ..core.logs import sampled
+from ..core.metrics import COST_JPY, TOKENS, model_label, stage_timer
+from ..core.registry import jpy_per_token, tenant_from_key
+from ..core.web.dependencies import get_rag_engine, request_timer
+from ..core.services.rag_engine import RAGEngine, count_tokens
 from ..core.services.document_processor import DocumentProcessor
+from ..core.services.report_rollup import day_keys, trim_top
 
 from ..models.schemas import (
     QuestionRequest,
@@ -46,17 +52,14 @@ from ..models.schemas import (
 )
 
 router = APIRouter(prefix="/embed/docs", tags=["EmbedDocs"])
+# 1リクエスト1行のアクセスログ（質問・IP はハッシュのみ）
+access_logger = logging.getLogger("tuukaa.access")
 
 dp = DocumentProcessor()
 
 
 def _tenant_from_key(key: str | None) -> str | None:
-    if not key:
-        return None
-    for tenant, k in settings.embed_api_keys_map.items():
-        if k == key:
-            return tenant
-    return None
+    return tenant_from_key(key)
 
 
 def _normalize(text: str) -> str:
@@ -87,19 +90,6 @@ def _strip_tags(html: str) -> str:
 _rpm: dict[tuple[str, str, str], tuple[int, float]] = {}
 _cost: dict[tuple[str, str], float] = {}
 
-try:
-    # 既定: gpt-4o-mini の実コスト（USD/1M tokens）を為替換算 → JPY/token（in/out 別）
-    DEFAULT_USD_PER_MTOKEN_IN = 0.15
-    DEFAULT_USD_PER_MTOKEN_OUT = 0.60
-    _RATE = float(getattr(settings, "usd_jpy_rate", 150.0))
-    _DEF_PRICE_IN = (float(DEFAULT_USD_PER_MTOKEN_IN) / 1_000_000.0) * _RATE
-    _DEF_PRICE_OUT = (float(DEFAULT_USD_PER_MTOKEN_OUT) / 1_000_000.0) * _RATE
-except Exception:
-    # 例外時も gpt-4o-mini の in/out で換算（単位一貫性を維持）
-    _RATE = float(getattr(settings, "usd_jpy_rate", 150.0))
-    _DEF_PRICE_IN = (0.15 / 1_000_000.0) * _RATE
-    _DEF_PRICE_OUT = (0.60 / 1_000_000.0) * _RATE
-
 _RESP_MAX_TOKENS = 1024
 
 
@@ -124,6 +114,110 @@ def _get_redis() -> Redis | None:
         return None
 
 
+# NOTE
+# ブロッキング処理（ファイル解析・URL取得・Redis・トークン数の計算）は
+# asyncio.to_thread でイベントループの外に出す
+
+
+def _redis_used_today(day: str, tenant: str) -> float | None:
+    """Redis 上の当日の使用額（Redis が使えない場合は None）"""
+    rc = _get_redis()
+    if not rc:
+        return None
+    return float(rc.get(f"cost:{day}:{tenant}") or 0.0)
+
+
+def _charge_redis(rc: Redis, day: str, tenant: str, cost: float, now: dt.datetime):
+    """Redis の当日使用額に加算（上限超過は 402）"""
+    key = f"cost:{day}:{tenant}"
+    used = float(rc.get(key) or 0.0)
+    if settings.daily_budget_jpy > 0 and used + cost > settings.daily_budget_jpy:
+        raise HTTPException(402, "本日の使用上限に達しました")
+    pipe = rc.pipeline()
+    pipe.incrbyfloat(key, cost)
+    pipe.ttl(key)
+    _, ttl = pipe.execute()
+    if ttl == -1:
+        rc.expire(key, _second_until_next_jst_midnight(now))
+
+
+def _record_feedback(
+    day: str, tenant: str, resolved: bool, entry: dict[str, Any]
+) -> None:
+    """フィードバックの集計とログを Redis に記録（Redis が使えない場合は何もしない）"""
+    rc = _get_redis()
+    if not rc:
+        return
+    pipe = rc.pipeline()
+    pipe.hincrby(f"feedback:{day}:{tenant}", "yes" if resolved else "no", 1)
+    pipe.lpush(f"logs:feedback:{tenant}", json.dumps(entry, ensure_ascii=False))
+    pipe.ltrim(f"logs:feedback:{tenant}", 0, 1000)
+    pipe.execute()
+
+
+def _count_tokens(model: str, prompt_text: str, answer_text: str) -> tuple[int, int]:
+    """入力（質問+コンテキスト）と出力（回答）のトークン数"""
+    try:
+        return (
+            max(1, count_tokens(model, prompt_text)),
+            max(1, count_tokens(model, answer_text)),
+        )
+    except Exception:
+        # フォールバック（概算）
+        return max(1, len(prompt_text) // 4), max(1, len(answer_text) // 4)
+
+
+_EXTENSIONS = ("pdf", "md", "markdown", "txt", "docx", "pptx", "xlsx")
+
+
+def _extract_text(ext: str, content: bytes) -> tuple[str, str]:
+    """拡張子に応じて本文を抽出（本文, source_type）"""
+    if ext in ("md", "markdown"):
+        enc = "utf-8-sig" if content.startswith(codecs.BOM_UTF8) else "utf-8"
+        return _normalize(content.decode(enc, errors="replace")), "markdown"
+    if ext == "txt":
+        return _normalize(dp.extract_text_from_txt_bytes(content)), "text"
+    if ext == "docx":
+        return _normalize(dp.extract_text_from_docx_bytes(content)), "docx"
+    if ext == "pptx":
+        return _normalize(dp.extract_text_from_pptx_bytes(content)), "pptx"
+    if ext == "xlsx":
+        return _normalize(dp.extract_text_from_xlsx_bytes(content)), "xlsx"
+    return _normalize(dp.extract_text_from_pdf(content)), "pdf"
+
+
+def _fetch_html(url: str) -> str:
+    try:
+        with urllib.request.urlopen(url, timeout=20) as r:
+            MAX_BYTES = 2 * 1024 * 1024
+            cl = r.headers.get("Content-Length")
+            if cl:
+                try:
+                    if int(cl) > MAX_BYTES:
+                        raise HTTPException(413, "本文が大きすぎます")
+                except ValueError:
+                    pass
+
+            buf = r.read(MAX_BYTES + 1)
+            if len(buf) > MAX_BYTES:
+                raise HTTPException(413, "本文が大きすぎます")
+
+            enc = None
+            try:
+                enc = r.headers.get_content_charset()
+            except Exception:
+                pass
+            if not enc:
+                if buf.startswith(codecs.BOM_UTF8):
+                    enc = "utf-8-sig"
+                else:
+                    enc = "utf-8"
+
+            return bytes(buf).decode(enc, errors="replace")
+    except Exception as e:
+        raise HTTPException(400, f"URL取得に失敗: {e}")
+
+
 # NOTE
 # 汎用アップロード
 # pdf/md/markdown/txt/docx/pptx/xlsx
@@ -159,32 +253,15 @@ async def ingest_any_file(
     cs = chunk_size or settings.max_chunk_size
     co = chunk_overlap or settings.chunk_overlap
 
-    text = None
-    if ext in ("md", "markdown"):
-        enc = "utf-8-sig" if content.startswith(codecs.BOM_UTF8) else "utf-8"
-        text = _normalize(content.decode(enc, errors="replace"))
-        source_type = "markdown"
-    elif ext == "txt":
-        text = _normalize(dp.extract_text_from_txt_bytes(content))
-        source_type = "text"
-    elif ext == "docx":
-        text = _normalize(dp.extract_text_from_docx_bytes(content))
-        source_type = "docx"
-    elif ext == "pptx":
-        text = _normalize(dp.extract_text_from_pptx_bytes(content))
-        source_type = "pptx"
-    elif ext == "xlsx":
-        text = _normalize(dp.extract_text_from_xlsx_bytes(content))
-        source_type = "xlsx"
-    elif ext == "pdf":
-        text = _normalize(dp.extract_text_from_pdf(content))
-        source_type = "pdf"
-    else:
+    if ext not in _EXTENSIONS:
         raise HTTPException(
             400, "未対応の拡張子です（pdf/md/markdown/txt/docx/pptx/xlsx）"
         )
+    text, source_type = await asyncio.to_thread(_extract_text, ext, content)
 
-    chunks = dp.split_text(text, chunk_size=cs, chunk_overlap=co)
+    chunks = await asyncio.to_thread(
+        dp.split_text, text, chunk_size=cs, chunk_overlap=co
+    )
     res = await rag.create_vectorstore_from_chunks(
         chunks,
         filename=file.filename,
@@ -206,43 +283,17 @@ async def ingest_url(
     tenant = _tenant_from_key(x_embed_key)
     if not tenant:
         raise HTTPException(401, "無効な埋め込みキーです")
-    try:
-        with urllib.request.urlopen(p.url, timeout=20) as r:
-            MAX_BYTES = 2 * 1024 * 1024
-            cl = r.headers.get("Content-Length")
-            if cl:
-                try:
-                    if int(cl) > MAX_BYTES:
-                        raise HTTPException(413, "本文が大きすぎます")
-                except ValueError:
-                    pass
-
-            buf = r.read(MAX_BYTES + 1)
-            if len(buf) > MAX_BYTES:
-                raise HTTPException(413, "本文が大きすぎます")
+    html = await asyncio.to_thread(_fetch_html, p.url)
 
-            enc = None
-            try:
-                enc = r.headers.get_content_charset()
-            except Exception:
-                pass
-            if not enc:
-                if buf.startswith(codecs.BOM_UTF8):
-                    enc = "utf-8-sig"
-                else:
-                    enc = "utf-8"
-
-            html = bytes(buf).decode(enc, errors="replace")
-    except Exception as e:
-        raise HTTPException(400, f"URL取得に失敗: {e}")
-
-    text = _strip_tags(html)
+    text = await asyncio.to_thread(_strip_tags, html)
     if not text:
         raise HTTPException(400, "本文抽出に失敗しました")
 
     chunk_size = p.chunk_size or settings.max_chunk_size
     chunk_overlap = p.chunk_overlap or settings.chunk_overlap
-    chunks = dp.split_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = await asyncio.to_thread(
+        dp.split_text, text, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
 
     res = await rag.create_vectorstore_from_chunks(
         chunks, filename=p.url, tenant=tenant, source_type="url", source=p.url
@@ -250,21 +301,31 @@ async def ingest_url(
     return {**res, "tenant": tenant}
 
 
-@router.post("/search", response_model=SearchResponse)
+@router.post(
+    "/search",
+    response_model=SearchResponse,
+    dependencies=[Depends(request_timer("search"))],
+)
 async def docs_search(
     req: QuestionRequest,
     rag: RAGEngine = Depends(get_rag_engine),
     x_embed_key: str | None = Header(default=None, convert_underscores=True),
 ) -> SearchResponse:
-    tenant = _tenant_from_key(x_embed_key)
+    with stage_timer("auth"):
+        tenant = _tenant_from_key(x_embed_key)
     if not tenant:
         raise HTTPException(401, "無効な埋め込みキーです")
+    rag.prefetch(tenant)
     docs = await rag.search_documents(req.question, req.top_k, tenant=tenant)
     items = [DocumentInfo(content=d.page_content, metadata=d.metadata) for d in docs]
     return SearchResponse(documents=items, query=req.question, total_found=len(items))
 
 
-@router.post("/ask", response_model=AnswerResponse)
+@router.post(
+    "/ask",
+    response_model=AnswerResponse,
+    dependencies=[Depends(request_timer("ask"))],
+)
 async def docs_ask(
     question_req: QuestionRequest,
     request: Request,
@@ -273,9 +334,12 @@ async def docs_ask(
     x_admin_api_secret: str | None = Header(default=None, convert_underscores=True),
     x_test_environment: str | None = Header(default=None, convert_underscores=True),
 ) -> AnswerResponse | StreamingResponse:
-    tenant = _tenant_from_key(x_embed_key)
+    with stage_timer("auth"):
+        tenant = _tenant_from_key(x_embed_key)
     if not tenant:
         raise HTTPException(401, "無効な埋め込みキーです")
+    # コールドなテナントのインデックス読み込みをレート制限・予算チェックと並行させる
+    rag.prefetch(tenant)
 
     is_admin = bool(
         x_admin_api_secret
@@ -284,38 +348,31 @@ async def docs_ask(
 
     # テスト環境フラグをチェック（Redis集計をスキップ）
     is_test = x_test_environment == "true"
+    selected_model = (question_req.model or settings.default_model or "").strip()
+    tracing.set_attributes(model=selected_model)
 
     # RPM 制限
     ip = request.client.host if request and request.client else "0.0.0.0"
-    key = (ip, x_embed_key or "", "/embed/docs/ask")
-    now = time.time()
-    cnt, first = _rpm.get(key, (0, now))
-    if now - first >= 60:
-        cnt, first = 0, now
-    cnt += 1
-    _rpm[key] = (cnt, first)
+    with stage_timer("rate_limit", tenant, selected_model) as span:
+        key = (ip, x_embed_key or "", "/embed/docs/ask")
+        now = time.time()
+        cnt, first = _rpm.get(key, (0, now))
+        if now - first >= 60:
+            cnt, first = 0, now
+        cnt += 1
+        _rpm[key] = (cnt, first)
+        span.set(count=cnt)
     if cnt > max(1, settings.rate_limit_rpm):
         raise HTTPException(429, "rate limit exceeded")
 
     # 日次ブレーカ（事前見積り、管理者はバイパス）
+    # 確認は文書の有無の確認・検索と並行して行い、超過時は LLM を呼ばずに 402 を返す
+    budget_check: asyncio.Task | None = None
     if not is_admin:
         jst = dt.datetime.now(dt.timezone(dt.timedelta(hours=9)))
         day = jst.strftime("%Y-%m-%d")
         # MODEL_PRICING: in/out を分離し、RAGの参照文書も入力側に加算
-        selected_model = (question_req.model or settings.default_model or "").strip()
-        inout = settings.model_pricing_inout_map.get(selected_model)
-        if inout is None:
-            usd_in = usd_out = None
-        else:
-            usd_in, usd_out = inout
-        if usd_in is None:
-            jpy_in = _DEF_PRICE_IN
-        else:
-            jpy_in = float(usd_in) * float(getattr(settings, "usd_jpy_rate", 150.0))
-        if usd_out is None:
-            jpy_out = _DEF_PRICE_OUT
-        else:
-            jpy_out = float(usd_out) * float(getattr(settings, "usd_jpy_rate", 150.0))
+        jpy_in, jpy_out = jpy_per_token(selected_model)
 
         max_out = question_req.max_output_tokens or getattr(
             settings, "default_max_output_tokens", _RESP_MAX_TOKENS
@@ -328,28 +385,31 @@ async def docs_ask(
         input_est_tokens = max(1, (qlen + 2 * qlen) // 4)
         output_est_tokens = max_out
         pre_est_cost = input_est_tokens * jpy_in + output_est_tokens * jpy_out
-        rc = _get_redis()
-        if rc:
-            key = f"cost:{day}:{tenant}"
-            used = float(rc.get(key) or 0.0)
-        else:
-            used = _cost.get((day, tenant), 0.0)
-
-        if (
-            settings.daily_budget_jpy > 0
-            and used + pre_est_cost > settings.daily_budget_jpy
-        ):
-            raise HTTPException(402, "本日の使用上限に達しました")
+
+        async def check_budget() -> None:
+            with stage_timer("budget_check", tenant, selected_model):
+                used = await asyncio.to_thread(_redis_used_today, day, tenant)
+                if used is None:
+                    used = _cost.get((day, tenant), 0.0)
+            if (
+                settings.daily_budget_jpy > 0
+                and used + pre_est_cost > settings.daily_budget_jpy
+            ):
+                raise HTTPException(402, "本日の使用上限に達しました")
+
+        budget_check = asyncio.create_task(check_budget())
 
     # 回答生成（テナント分離）
-    result = await rag.generate_answer(
-        question=question_req.question,
-        top_k=question_req.top_k,
-        model=question_req.model,
-        temperature=question_req.temperature,
-        tenant=tenant,
-        max_output_tokens=question_req.max_output_tokens,
-    )
+    with stage_timer("generate", tenant, selected_model):
+        result = await rag.generate_answer(
+            question=question_req.question,
+            top_k=question_req.top_k,
+            model=question_req.model,
+            temperature=question_req.temperature,
+            tenant=tenant,
+            max_output_tokens=question_req.max_output_tokens,
+            precheck=budget_check,
+        )
 
     # 参照文書の情報を構築
     documents_items = [
@@ -360,73 +420,41 @@ async def docs_ask(
     # コスト（日次ブレーカ） 実績: 入力(質問+実際のcontext) と 出力(回答) を分離
     answer_text = result.get("answer", "")
     context_used = result.get("context_used", "")
-    # tiktokenで実測（モデルは指定があればそれを使用、なければ既定）
-    try:
-        import tiktoken
-
-        model_for_encoding = (
-            question_req.model or settings.default_model or ""
-        ).strip() or "gpt-4o-mini"
-        try:
-            enc = tiktoken.encoding_for_model(model_for_encoding)
-        except Exception:
-            enc = tiktoken.get_encoding("cl100k_base")
-        input_tokens = max(
-            1,
-            len(
-                enc.encode((question_req.question or "") + "\n" + (context_used or ""))
-            ),
+    with stage_timer("token_count", tenant, selected_model) as span:
+        # tiktokenで実測（モデルは指定があればそれを使用、なければ既定）
+        input_tokens, output_tokens = await asyncio.to_thread(
+            _count_tokens,
+            selected_model or "gpt-4o-mini",
+            (question_req.question or "") + "\n" + (context_used or ""),
+            answer_text or "",
         )
-        output_tokens = max(1, len(enc.encode(answer_text or "")))
-    except Exception:
-        # フォールバック（概算）
-        input_tokens = max(1, len((question_req.question + "\n" + context_used)) // 4)
-        output_tokens = max(1, len(answer_text) // 4)
+        span.set(input_tokens=input_tokens, output_tokens=output_tokens)
     jst = dt.datetime.now(dt.timezone(dt.timedelta(hours=9)))
     day = jst.strftime("%Y-%m-%d")
     # 事後計上: in/out 単価で合計
-    selected_model = (question_req.model or settings.default_model or "").strip()
-    inout = settings.model_pricing_inout_map.get(selected_model)
-    if inout is None:
-        usd_in = usd_out = None
-    else:
-        usd_in, usd_out = inout
-    if usd_in is None:
-        jpy_in = _DEF_PRICE_IN
-    else:
-        jpy_in = float(usd_in) * float(getattr(settings, "usd_jpy_rate", 150.0))
-    if usd_out is None:
-        jpy_out = _DEF_PRICE_OUT
-    else:
-        jpy_out = float(usd_out) * float(getattr(settings, "usd_jpy_rate", 150.0))
+    jpy_in, jpy_out = jpy_per_token(selected_model)
 
     est_cost = input_tokens * jpy_in + output_tokens * jpy_out
-
-    # コスト記録（管理者またはテスト環境の場合はスキップ）
-    if not is_admin and not is_test:
-        rc = _get_redis()
-        if rc:
-            key = f"cost:{day}:{tenant}"
-            used = float(rc.get(key) or 0.0)
-            if (
-                settings.daily_budget_jpy > 0
-                and used + est_cost > settings.daily_budget_jpy
-            ):
-                raise HTTPException(402, "本日の使用上限に達しました")
-            pipe = rc.pipeline()
-            pipe.incrbyfloat(key, est_cost)
-            pipe.ttl(key)
-            _, ttl = pipe.execute()
-            if ttl == -1:
-                rc.expire(key, _second_until_next_jst_midnight(jst))
-        else:
-            used = _cost.get((day, tenant), 0.0)
-            if (
-                settings.daily_budget_jpy > 0
-                and used + est_cost > settings.daily_budget_jpy
-            ):
-                raise HTTPException(402, "本日の予算を超過しました")
-            _cost[(day, tenant)] = used + est_cost
+    label = model_label(selected_model)
+    TOKENS.inc(input_tokens, tenant=tenant, model=label, direction="input")
+    TOKENS.inc(output_tokens, tenant=tenant, model=label, direction="output")
+    COST_JPY.inc(est_cost, tenant=tenant, model=label)
+
+    with stage_timer("accounting", tenant, selected_model) as span:
+        span.set(cost_jpy=round(est_cost, 4))
+        # コスト記録（管理者またはテスト環境の場合はスキップ）
+        if not is_admin and not is_test:
+            rc = await asyncio.to_thread(_get_redis)
+            if rc:
+                await asyncio.to_thread(_charge_redis, rc, day, tenant, est_cost, jst)
+            else:
+                used = _cost.get((day, tenant), 0.0)
+                if (
+                    settings.daily_budget_jpy > 0
+                    and used + est_cost > settings.daily_budget_jpy
+                ):
+                    raise HTTPException(402, "本日の予算を超過しました")
+                _cost[(day, tenant)] = used + est_cost
 
     # JSON ログ（機密情報マスキング強化）
     def _hash(v: str) -> str:
@@ -442,7 +470,7 @@ async def docs_ask(
         "status": "ok",
         "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
     }
-    print(json.dumps(log, ensure_ascii=False))
+    access_logger.info("ask", extra={"fields": log})
 
     message_id = question_req.message_id or str(uuid4()).replace("-", "")
     client_id = (
@@ -454,42 +482,52 @@ async def docs_ask(
 
     # Redis集計（管理者またはテスト環境の場合はスキップ）
     if not is_admin and not is_test:
-        rc = _get_redis()
         jst = dt.datetime.now(dt.timezone(dt.timedelta(hours=9)))
         day = jst.strftime("%Y-%m-%d")
-        if rc:
-            pipe = rc.pipeline()
-            pipe.incr(f"metrics:{day}:{tenant}:count", 1)
-            pipe.pfadd(f"hll:{day}:{tenant}:clients", client_id)
-            pipe.incrbyfloat(
-                f"tokens:{day}:{tenant}", float(input_tokens + output_tokens)
-            )
-            pipe.hincrby(f"docs:{day}:{tenant}", "zero_hit", zero_hit)
-            pipe.hincrby(f"docs:{day}:{tenant}", "hit", 1 - zero_hit)
-            for d in documents_items[:10]:
-                fid = d.metadata.get("file_id") or d.metadata.get("source") or "unknown"
-                pipe.hincrby(f"docs_top:{day}:{tenant}", fid, 1)
-                cidx = d.metadata.get("chunk_index")
-                if cidx is not None:
-                    pipe.hincrby(f"chunks_top:{day}:{tenant}", f"{fid}:{cidx}", 1)
-            pipe.lpush(
-                f"logs:ask:{tenant}",
-                json.dumps(
-                    {
-                        "ts": int(time.time()),
-                        "tenant": tenant,
-                        "message_id": message_id,
-                        "event": "ask",
-                        "tokens": int(input_tokens + output_tokens),
-                        "cost_jpy": round(est_cost, 4),
-                        "doc_count": doc_count,
-                        "status": "ok",
-                    },
-                    ensure_ascii=False,
-                ),
-            )
-            pipe.ltrim(f"logs:ask:{tenant}", 0, 1000)
-            pipe.execute()
+        with stage_timer("analytics", tenant, selected_model):
+            rc = await asyncio.to_thread(_get_redis)
+            if rc:
+                pipe = rc.pipeline()
+                pipe.incr(f"metrics:{day}:{tenant}:count", 1)
+                pipe.pfadd(f"hll:{day}:{tenant}:clients", client_id)
+                pipe.incrbyfloat(
+                    f"tokens:{day}:{tenant}", float(input_tokens + output_tokens)
+                )
+                pipe.hincrby(f"docs:{day}:{tenant}", "zero_hit", zero_hit)
+                pipe.hincrby(f"docs:{day}:{tenant}", "hit", 1 - zero_hit)
+                # 参照回数はソート済み集合で保持し、一定割合の記録で上位N件に切り詰める
+                top_keys = day_keys(day, tenant)
+                for d in documents_items[:10]:
+                    fid = (
+                        d.metadata.get("file_id")
+                        or d.metadata.get("source")
+                        or "unknown"
+                    )
+                    pipe.zincrby(top_keys["docs_top"], 1, fid)
+                    cidx = d.metadata.get("chunk_index")
+                    if cidx is not None:
+                        pipe.zincrby(top_keys["chunks_top"], 1, f"{fid}:{cidx}")
+                if sampled(settings.report_top_trim_sample_rate):
+                    trim_top(pipe, top_keys["docs_top"])
+                    trim_top(pipe, top_keys["chunks_top"])
+                pipe.lpush(
+                    f"logs:ask:{tenant}",
+                    json.dumps(
+                        {
+                            "ts": int(time.time()),
+                            "tenant": tenant,
+                            "message_id": message_id,
+                            "event": "ask",
+                            "tokens": int(input_tokens + output_tokens),
+                            "cost_jpy": round(est_cost, 4),
+                            "doc_count": doc_count,
+                            "status": "ok",
+                        },
+                        ensure_ascii=False,
+                    ),
+                )
+                pipe.ltrim(f"logs:ask:{tenant}", 0, 1000)
+                await asyncio.to_thread(pipe.execute)
 
     # SSE or JSON
     accept = request.headers.get("accept", "").lower() if request else ""
@@ -596,27 +634,19 @@ async def docs_feedback(
 
     # Redis集計（管理者またはテスト環境の場合はスキップ）
     if not is_admin and not is_test:
-        rc = _get_redis()
         jst = dt.datetime.now(dt.timezone(dt.timedelta(hours=9)))
-        day = jst.strftime("%Y-%m-%d")
-        if rc:
-            rc.hincrby(f"feedback:{day}:{tenant}", "yes" if resolved else "no", 1)
-            rc.lpush(
-                f"logs:feedback:{tenant}",
-                json.dumps(
-                    {
-                        "ts": int(time.time()),
-                        "tenant": tenant,
-                        "message_id": message_id,
-                        "event": "feedback",
-                        "resolved": resolved,
-                        "client_id": payload.client_id,
-                        "session_id": payload.session_id,
-                    },
-                    ensure_ascii=False,
-                ),
-            )
-            rc.ltrim(f"logs:feedback:{tenant}", 0, 1000)
+        entry = {
+            "ts": int(time.time()),
+            "tenant": tenant,
+            "message_id": message_id,
+            "event": "feedback",
+            "resolved": resolved,
+            "client_id": payload.client_id,
+            "session_id": payload.session_id,
+        }
+        await asyncio.to_thread(
+            _record_feedback, jst.strftime("%Y-%m-%d"), tenant, resolved, entry
+        )
     return {"status": "ok"}
 
 
@@ -1,5 +1,9 @@
 from __future__ import annotations
+import asyncio
 import datetime as dt
+import hashlib
+import json
+import logging
 
 from fastapi import APIRouter, HTTPException, Query, Header
 from typing import Any
@@ -8,11 +12,31 @@ from pydantic import BaseModel, Field
 from sqlalchemy import exc
 
 from ..core.config import settings
+from ..core.registry import has_tenant
+from ..core.services.report_rollup import (
+    fetch_chunks_top,
+    fetch_summary,
+    migrate_legacy_top,
+    plan_buckets,
+    retained_range,
+    rollup_tenant,
+)
 from .embed_ingest import _get_redis
 
 
 router = APIRouter(prefix="/admin/reports", tags=["Reports"])
 
+logger = logging.getLogger(__name__)
+
+# ロールアップジョブの多重実行防止（複数ワーカー間）
+_ROLLUP_LOCK_KEY = "rollup:lock"
+_ROLLUP_LOCK_TTL = 600
+# 推定質問のバックグラウンド計算の多重実行防止
+_INFERENCE_LOCK_TTL = 120
+# 起動時の旧形式移行で、他のワーカーがロックを持っている場合の再試行
+_MIGRATION_ATTEMPTS = 10
+_MIGRATION_RETRY_SECONDS = 30
+
 
 class InferredQuestions(BaseModel):
     """LLMが推定した質問のリスト"""
@@ -24,13 +48,6 @@ class InferredQuestions(BaseModel):
     )
 
 
-def _daterange(start: dt.date, end: dt.date):
-    cur = start
-    while cur <= end:
-        yield cur
-        cur = cur + dt.timedelta(days=1)
-
-
 @router.get("/summary")
 async def summary(
     tenant: str = Query(...),
@@ -40,7 +57,7 @@ async def summary(
 ):
     if x_admin_api_secret != settings.admin_api_secret:
         raise HTTPException(401, "unauthorized")
-    if tenant not in settings.embed_api_keys_map:
+    if not has_tenant(tenant):
         raise HTTPException(400, "unknown tenant")
     try:
         d0 = dt.datetime.strptime(start, "%Y-%m-%d").date()
@@ -50,7 +67,7 @@ async def summary(
     if d1 < d0:
         raise HTTPException(400, "end before start")
 
-    rc = _get_redis()
+    rc = await asyncio.to_thread(_get_redis)
     if not rc:
         return {
             "questions": 0,
@@ -64,32 +81,13 @@ async def summary(
             "tenant": tenant,
         }
 
-    total_q = 0
-    total_tokens = 0.0
-    total_cost = 0.0
-    total_hit = 0
-    total_zero = 0
-    dau = 0
-    fb_yes = 0
-    fb_no = 0
-    docs_top: dict[str, int] = {}
-
-    for d in _daterange(d0, d1):
-        # 日付オブジェトを文字列に変換
-        day = d.strftime("%Y-%m-%d")
-        total_q += int(rc.get(f"metrics:{day}:{tenant}:count") or 0)
-        dau += int(rc.pfcount(f"hll:{day}:{tenant}:clients") or 0)
-        total_tokens = float(rc.get(f"tokens:{day}:{tenant}") or 0)
-        total_cost += float(rc.get(f"cost:{day}:{tenant}") or 0)
-        h = rc.hgetall(f"docs:{day}:{tenant}") or {}
-        total_hit += int(h.get("hit", 0) or 0)
-        total_zero += int(h.get("zero_hit", 0) or 0)
-        fb = rc.hgetall(f"feedback:{day}:{tenant}") or {}
-        fb_yes += int(fb.get("yes", 0) or 0)
-        fb_no += int(fb.get("no", 0) or 0)
-        top = rc.hgetall(f"docs_top:{day}:{tenant}") or {}
-        for k, v in top.items():
-            docs_top[k] = docs_top.get(k, 0) + int(v or 0)
+    d0, d1, period = await _retained_period(rc, tenant, d0, d1)
+
+    # ロールアップ済みの月・週はまとめて読み、残りの日だけ日次キーを読む
+    buckets = await asyncio.to_thread(plan_buckets, rc, tenant, d0, d1)
+    agg = await asyncio.to_thread(fetch_summary, rc, tenant, buckets)
+    fb_yes, fb_no = agg["feedback_yes"], agg["feedback_no"]
+    total_hit, total_zero = agg["hit"], agg["zero_hit"]
 
     resolved_rate = None
     if fb_yes + fb_no > 0:
@@ -98,21 +96,17 @@ async def summary(
     if (total_hit + total_zero) > 0:
         zero_hit_rate = total_zero / (total_hit + total_zero)
 
-    top_docs = sorted(
-        [{"id": k, "count": v} for k, v in docs_top.items()],
-        key=lambda x: x["count"],
-        reverse=True,
-    )[:5]
+    top_docs = [{"id": k, "count": v} for k, v in agg["docs_top"]]
 
     return {
-        "questions": total_q,
-        "unique_users": dau,
+        "questions": agg["questions"],
+        "unique_users": agg["unique_users"],
         "resolved_rate": resolved_rate,
         "zero_hit_rate": zero_hit_rate,
-        "tokens": total_tokens,
-        "cost_jpy": total_cost,
+        "tokens": agg["tokens"],
+        "cost_jpy": agg["cost_jpy"],
         "top_docs": top_docs,
-        "period": {"from": start, "to": end},
+        **period,
         "tenant": tenant,
     }
 
@@ -122,12 +116,15 @@ async def summary_evidence(
     tenant: str = Query(...),
     start: str = Query(..., description="YYYY-MM-DD"),
     end: str = Query(..., description="YYYY-MM-DD"),
+    background: bool = Query(
+        False, description="推定質問が未キャッシュなら裏で計算し、即座に返す"
+    ),
     x_admin_api_secret: str = Header(default="", convert_underscores=True),
 ) -> dict[str, Any]:
     """上位チャンクに基づきエビデンスカードと推定質問"""
     if x_admin_api_secret != settings.admin_api_secret:
         raise HTTPException(401, "unauthorized")
-    if tenant not in settings.embed_api_keys_map:
+    if not has_tenant(tenant):
         raise HTTPException(400, "unknown tenant")
     try:
         d0 = dt.datetime.strptime(start, "%Y-%m-%d").date()
@@ -137,7 +134,7 @@ async def summary_evidence(
     if d1 < d0:
         raise HTTPException(400, "end before start")
 
-    rc = _get_redis()
+    rc = await asyncio.to_thread(_get_redis)
     if not rc:
         return {
             "tenant": tenant,
@@ -148,24 +145,20 @@ async def summary_evidence(
             "common_keywords": [],
         }
 
-    # 期間内のチャンクトップを集計
-    chunks_top: dict[str, int] = {}
-    for d in _daterange(d0, d1):
-        day = d.strftime("%Y-%m-%d")
-        h = rc.hgetall(f"chunks_top:{day}:{tenant}") or {}
-        for k, v in h.items():
-            chunks_top[k] = chunks_top.get(k, 0) + int(v or 0)
-
-    # 上位10件（keyは"{file_id}:{chunk_index}"）
-    pairs: list[tuple[str, int, int]] = []
-    for key, cnt in chunks_top.items():
+    d0, d1, period = await _retained_period(rc, tenant, d0, d1)
+
+    # 期間内の上位10チャンク（keyは"{file_id}:{chunk_index}"）をサーバー側で集計
+    buckets = await asyncio.to_thread(plan_buckets, rc, tenant, d0, d1)
+    chunks_top = await asyncio.to_thread(
+        fetch_chunks_top, rc, tenant, buckets, top_n=10
+    )
+    top_pairs: list[tuple[str, int, int]] = []
+    for key, cnt in chunks_top:
         try:
             fid, cidx = key.rsplit(":", 1)
-            pairs.append((fid, int(cidx), int(cnt)))
+            top_pairs.append((fid, int(cidx), int(cnt)))
         except Exception:
             continue
-    pairs.sort(key=lambda x: x[2], reverse=True)
-    top_pairs = pairs[:10]
 
     # RAG から内容取得
     from ..core.web.dependencies import get_rag_engine
@@ -217,35 +210,231 @@ async def summary_evidence(
     all_text = "\n".join([e["fulltext"] for e in evidences])
     common_keywords = _keywords(all_text, 10)
 
-    # LLMで推定質問（Structured Output使用）
-    inferred_question: list[str] = []
-    try:
-        rag2 = get_rag_engine()
-        llm, _ = rag2._get_llm(None, None, None)
-
-        # Structured Outputを使用してLLMに構造化された出力を強制
-        llm_with_structure = llm.with_structured_output(InferredQuestions)
-
-        prompt = (
-            "以下のチャンク抜粋はRAG AIチャットボットのコンテキストとして利用されたチャンクを、"
-            "利用された回数の多い順に並べたものです。\n\n"
-            "これらのチャンク抜粋から、RAG AIチャットボットの利用者が入力したと推測される質問を"
-            "日本語で正確に3つ考えてください。\n\n"
-            "チャンク抜粋:\n---\n"
-            + "\n\n".join(["\n".join(e["excerpt"]) for e in evidences])
-        )
-
-        result = await llm_with_structure.ainvoke(prompt)
-        inferred_question = result.questions
-    except Exception as e:
-        # ログ出力して、デバッグを容易にする
-        print(f"Failed to infer questions: {e}")
-        pass
+    # LLMで推定質問（上位チャンクの並びが変わらない限りキャッシュを返す）
+    cache_key = _inference_cache_key(
+        tenant, [(fid, cidx) for fid, cidx, _ in top_pairs]
+    )
+    inferred_question, inference_status = await _cached_inferred_questions(
+        rc, cache_key, evidences, background=background
+    )
 
     return {
         "tenant": tenant,
-        "period": {"from": start, "to": end},
+        **period,
         "evidences": evidences,
         "inferred_question": inferred_question,
+        "inference_status": inference_status,
         "common_keywords": common_keywords,
     }
+
+
+async def _retained_period(
+    rc: Any, tenant: str, d0: dt.date, d1: dt.date
+) -> tuple[dt.date, dt.date, dict[str, Any]]:
+    """日次キーが失効した部分を除いた期間と、応答に含める期間の情報
+
+    縮めた場合は period に実際に集計した期間を、requested_period に指定された期間を返す。
+    何も集計できない場合は 400。
+    """
+    requested = {"from": d0.isoformat(), "to": d1.isoformat()}
+    span = await asyncio.to_thread(retained_range, rc, tenant, d0, d1)
+    if span is None:
+        raise HTTPException(
+            400, "period is no longer retained (daily data has expired)"
+        )
+    r0, r1 = span
+    period = {"from": r0.isoformat(), "to": r1.isoformat()}
+    return (
+        r0,
+        r1,
+        {
+            "period": period,
+            "requested_period": requested,
+            "clamped": (r0, r1) != (d0, d1),
+        },
+    )
+
+
+# バックグラウンド推定タスクの参照保持（GC による途中破棄を防ぐ）
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _inference_cache_key(tenant: str, pairs: list[tuple[str, int]]) -> str:
+    """テナントと上位チャンクIDの並び順から推定質問のキャッシュキーを作る"""
+    ids = ",".join(f"{fid}:{cidx}" for fid, cidx in pairs)
+    digest = hashlib.sha256(ids.encode("utf-8")).hexdigest()[:32]
+    return f"evidence_q:{tenant}:{digest}"
+
+
+async def _infer_questions(evidences: list[dict[str, Any]]) -> list[str]:
+    """上位チャンクの抜粋からLLMで利用者の質問を推定（Structured Output使用）"""
+    from ..core.web.dependencies import get_rag_engine
+
+    llm, _ = get_rag_engine()._get_llm(None, None, None)
+
+    # Structured Outputを使用してLLMに構造化された出力を強制
+    llm_with_structure = llm.with_structured_output(InferredQuestions)
+
+    prompt = (
+        "以下のチャンク抜粋はRAG AIチャットボットのコンテキストとして利用されたチャンクを、"
+        "利用された回数の多い順に並べたものです。\n\n"
+        "これらのチャンク抜粋から、RAG AIチャットボットの利用者が入力したと推測される質問を"
+        "日本語で正確に3つ考えてください。\n\n"
+        "チャンク抜粋:\n---\n"
+        + "\n\n".join(["\n".join(e["excerpt"]) for e in evidences])
+    )
+
+    result = await llm_with_structure.ainvoke(prompt)
+    return list(result.questions)
+
+
+async def _infer_and_store(
+    rc: Any, cache_key: str, evidences: list[dict[str, Any]]
+) -> list[str]:
+    """推定質問を計算してキャッシュに保存"""
+    questions = await _infer_questions(evidences)
+    await asyncio.to_thread(
+        rc.set,
+        cache_key,
+        json.dumps(questions, ensure_ascii=False),
+        ex=max(1, settings.report_inference_cache_ttl_seconds),
+    )
+    return questions
+
+
+async def _infer_in_background(
+    rc: Any, cache_key: str, evidences: list[dict[str, Any]]
+) -> None:
+    lock_key = f"{cache_key}:lock"
+    try:
+        await _infer_and_store(rc, cache_key, evidences)
+    except Exception as e:
+        logger.warning(f"Failed to infer questions: {e}")
+    finally:
+        await asyncio.to_thread(rc.delete, lock_key)
+
+
+async def _cached_inferred_questions(
+    rc: Any,
+    cache_key: str,
+    evidences: list[dict[str, Any]],
+    background: bool = False,
+) -> tuple[list[str], str]:
+    """推定質問をキャッシュ優先で取得
+
+    Returns:
+        (推定質問, 状態) 状態は cached / computed / pending / empty / failed
+    """
+    if not evidences:
+        return [], "empty"
+
+    cached = await asyncio.to_thread(rc.get, cache_key)
+    if cached is not None:
+        try:
+            return list(json.loads(cached)), "cached"
+        except Exception:
+            pass
+
+    if background:
+        # 同じ上位チャンクに対する推定はワーカー間で1つだけ走らせる
+        locked = await asyncio.to_thread(
+            rc.set, f"{cache_key}:lock", "1", nx=True, ex=_INFERENCE_LOCK_TTL
+        )
+        if locked:
+            task = asyncio.create_task(_infer_in_background(rc, cache_key, evidences))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return [], "pending"
+
+    try:
+        return await _infer_and_store(rc, cache_key, evidences), "computed"
+    except Exception as e:
+        # ログ出力して、デバッグを容易にする
+        logger.warning(f"Failed to infer questions: {e}")
+        return [], "failed"
+
+
+def _rollup_all(
+    tenants: list[str], migrate: bool = False
+) -> dict[str, list[str]] | None:
+    """全テナントのロールアップを実行（ロック取得できなければ None）
+
+    migrate=True（管理APIからの手動実行）では、先に旧形式の参照回数を全期間分移行する。
+    定期実行では走査しない（起動時の移行で完了しているため）。
+    """
+    rc = _get_redis()
+    if not rc:
+        return {}
+    if not rc.set(_ROLLUP_LOCK_KEY, "1", nx=True, ex=_ROLLUP_LOCK_TTL):
+        return None
+    try:
+        if migrate:
+            migrate_legacy_top(rc)
+        return {tenant: rollup_tenant(rc, tenant) for tenant in tenants}
+    finally:
+        rc.delete(_ROLLUP_LOCK_KEY)
+
+
+def _migrate_legacy() -> int | None:
+    """旧形式の参照回数を移行（ロック取得できなければ None）"""
+    rc = _get_redis()
+    if not rc:
+        return 0
+    if not rc.set(_ROLLUP_LOCK_KEY, "1", nx=True, ex=_ROLLUP_LOCK_TTL):
+        return None
+    try:
+        return migrate_legacy_top(rc)
+    finally:
+        rc.delete(_ROLLUP_LOCK_KEY)
+
+
+async def migrate_legacy_reports() -> None:
+    """旧形式の参照回数を全期間分移行する（lifespan から起動）
+
+    ロールアップの定期実行を無効にしていても、過去の期間の上位ドキュメントと
+    エビデンスを読めるようにする。
+    """
+    for _ in range(_MIGRATION_ATTEMPTS):
+        try:
+            migrated = await asyncio.to_thread(_migrate_legacy)
+        except Exception as e:
+            logger.warning(f"レポートの旧形式キーの移行に失敗しました: {e}")
+            return
+        if migrated is not None:
+            if migrated:
+                logger.info(f"レポートの旧形式キーを移行しました: {migrated}件")
+            return
+        await asyncio.sleep(_MIGRATION_RETRY_SECONDS)
+
+
+async def run_rollup_loop() -> None:
+    """週次・月次ロールアップを定期実行する（lifespan から起動）"""
+    interval = max(60, settings.report_rollup_interval_seconds)
+    while True:
+        try:
+            tenants = list(settings.embed_api_keys_map)
+            built = await asyncio.to_thread(_rollup_all, tenants)
+            if built:
+                logger.info(f"レポートのロールアップを実行しました: {built}")
+        except Exception as e:
+            logger.warning(f"レポートのロールアップに失敗しました: {e}")
+        await asyncio.sleep(interval)
+
+
+@router.post("/rollup")
+async def rollup(
+    tenant: str | None = Query(None),
+    x_admin_api_secret: str = Header(default="", convert_underscores=True),
+) -> dict[str, Any]:
+    """閉じた週・月のロールアップを手動実行"""
+    if x_admin_api_secret != settings.admin_api_secret:
+        raise HTTPException(401, "unauthorized")
+    tenants = list(settings.embed_api_keys_map)
+    if tenant is not None:
+        if not has_tenant(tenant):
+            raise HTTPException(400, "unknown tenant")
+        tenants = [tenant]
+    built = await asyncio.to_thread(_rollup_all, tenants, True)
+    if built is None:
+        raise HTTPException(409, "rollup already running")
+    return {"status": "ok", "built": built}
@@ -5,6 +5,8 @@
 
 import os
 from pathlib import Path
+from typing import Any, Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -28,6 +30,54 @@ class Settings(BaseSettings):
     # ベクトルストア設定
     persist_directory: str = "./vectorstore"
     embedding_model: str = "text-embedding-3-small"
+    # 埋め込みの出力次元数（text-embedding-3 系のみ。未設定でモデル既定の最大次元）
+    # 既存テナントへの反映は再インデックス（POST /api/v1/admin/reindex）で行う
+    embedding_dimensions: int | None = None
+    # 計算済み埋め込みのキャッシュ（再アップロード・再インデックスで API を呼ばない）
+    embedding_cache_enabled: bool = True
+    embedding_cache_file: str = "./embedding_cache/embeddings.sqlite3"
+    # 再インデックスで1回に埋め込み・書き込みするチャンク数
+    reindex_batch_size: int = 256
+    # 切り替え後、旧世代を破棄するまでの猶予（切り替え直前に始まった書き込みを取り込む）
+    reindex_cutover_grace_seconds: float = 5.0
+    # 再インデックス・モデル移行で埋め込み API に送る上限（トークン/分・ワーカー単位、0で無制限）
+    # 本番のアップロード・検索が使う分を残すため、API の TPM 上限より十分低くする
+    reindex_embedding_tokens_per_minute: int = 200_000
+
+    # Chroma 接続モード
+    # - embedded: プロセス内の永続化クライアント（単一ワーカー向け）
+    # - http: 別プロセスの Chroma サーバーに接続（複数ワーカーで1つのインデックスを共有）
+    chroma_mode: Literal["embedded", "http"] = "embedded"
+    chroma_host: str = "localhost"
+    chroma_port: int = 8001
+    chroma_ssl: bool = False
+    chroma_auth_token: str | None = None
+
+    # ベクトルバックエンド
+    # - chroma: Chroma コレクション（全テナント共有、tenant メタデータで分離）
+    # - flat: テナントごとの NumPy メモリマップ行列による全件探索
+    vector_backend: Literal["chroma", "flat"] = "chroma"
+    # テナント別の上書き（例: "client-a:flat,client-b:chroma"）
+    vector_backend_tenants: str | None = None
+    # flat バックエンドの保存先と格納精度（float16 でメモリ・ディスクを半減）
+    flat_index_directory: str = "./flat_index"
+    flat_index_dtype: Literal["float32", "float16"] = "float32"
+    # 同時に読み込んでおくテナント数・常駐メモリ（MB）の上限。超えると LRU で退避（0 で無制限）
+    flat_index_max_tenants: int = 0
+    flat_index_max_resident_mb: float = 0.0
+    # 書き込みタスクが1回にまとめる最大チャンク数と、後続の要求を待つ時間（ミリ秒）
+    ingest_writer_max_batch_rows: int = 2000
+    ingest_writer_linger_ms: int = 5
+
+    # === ベクトルストアの保守（リクエスト外で実行） ===
+    # 定期実行の間隔（秒）。0 で定期実行しない（管理APIからは実行可能）
+    maintenance_interval_seconds: int = 21600
+    # 孤立ファイルとみなすまでの猶予（書き込み途中のファイルを消さないため）
+    maintenance_orphan_grace_seconds: int = 600
+    # VACUUM の排他ロック待ち上限（秒）
+    maintenance_vacuum_timeout_seconds: int = 5
+    # flat: セグメント数がこの値以上のテナントを1セグメントに統合
+    flat_compact_min_segments: int = 8
 
     # LLM設定
     default_model: str = "gpt-4o-mini"
@@ -36,10 +86,34 @@ class Settings(BaseSettings):
     max_chunk_size: int = 500
     chunk_overlap: int = 70
 
+    # === ローカルの代替モデル（ベンチマーク・負荷試験用、API キー不要） ===
+    # local: 文字 n-gram のハッシュ埋め込み。OpenAI の埋め込みと互換性がないため、
+    #        既存データとは別の PERSIST_DIRECTORY / FLAT_INDEX_DIRECTORY で使う
+    embedding_provider: Literal["openai", "local"] = "openai"
+    local_embedding_dimensions: int = 1536
+    # fake: 最初のトークンまでの遅延と生成速度を再現する偽のチャットモデル
+    chat_provider: Literal["openai", "fake"] = "openai"
+    fake_chat_latency_ms: float = 300.0
+    fake_chat_tokens_per_second: float = 60.0
+    fake_chat_answer_tokens: int = 200
+
     # 類似度スコア閾値（ChromaのL2距離: 小さいほど類似）
     # 推奨値: 1.5（厳しい）、2.0（バランス型・推奨）、2.5（緩い）
     # 実際のスコア例: 関連性が高い質問で1.3-1.5程度
     similarity_score_threshold: float = 1.8
+    # cosine / ip 距離（1 - 類似度）の閾値。未設定時は similarity_score_threshold / 2
+    # （正規化済みの埋め込みでは 二乗L2距離 = 2 × cosine距離 のため同じ判定になる）
+    cosine_score_threshold: float | None = None
+
+    # === HNSW（Chroma コレクション作成時に適用） ===
+    # space は距離の種類（flat バックエンドも同じ尺度で距離を返す）
+    hnsw_space: Literal["l2", "cosine", "ip"] = "l2"
+    hnsw_construction_ef: int = 100
+    hnsw_search_ef: int = 10
+    hnsw_m: int = 16
+    # テナント別の上書き（例: "client-a:space=cosine,search_ef=64;client-b:m=32"）
+    # 上書きのあるテナントは専用の Chroma コレクションを使う
+    hnsw_tenants: str | None = None
 
     # ファイルアップロード設定
     max_file_size: int = 10 * 1024 * 1024  # 10MB
@@ -47,6 +121,7 @@ class Settings(BaseSettings):
     upload_directory: str = "./uploads"
 
     # ===== Embed Domain =====
+    # テナント専用 Chroma コレクション名の接頭辞（未設定時は "tenant-"）
     embed_collection_prefix: str | None = None
     embed_allowed_origins: str | None = None
     embed_api_keys: str | None = None
@@ -62,6 +137,18 @@ class Settings(BaseSettings):
     # === 料金・トークン上限 ===
     model_pricing: str | None = None  # 例: "gpt-4o-mini:0.002,gpt-4o:0.006"
     default_max_output_tokens: int = 768
+
+    # === LLM クライアント・チェーンのキャッシュ ===
+    # (model, 温度バケット, max_tokens) ごとに保持する LLM/チェーンの最大数（LRU）
+    llm_cache_size: int = 16
+    # 温度をキャッシュキーに丸める刻み幅（0 で丸めない）
+    llm_temperature_step: float = 0.05
+    # OpenAI 呼び出しのタイムアウト秒数
+    llm_timeout_seconds: float = 60.0
+    # 共有 HTTP クライアントの接続プール設定
+    llm_http_max_connections: int = 100
+    llm_http_max_keepalive: int = 20
+    llm_http_keepalive_expiry: float = 30.0
     # USD→JPY 為替レート（MODEL_PRICING を USD/token として受け取る想定）
     usd_jpy_rate: float = 148.117
 
@@ -71,6 +158,57 @@ class Settings(BaseSettings):
     # システム/指示/テンプレート固定分として見込むオーバーヘッド
     prompt_overhead_tokens: int = 512
 
+    # === レポート集計（週次・月次ロールアップ） ===
+    # ロールアップジョブの実行間隔（秒）。0 で定期実行しない
+    report_rollup_interval_seconds: int = 3600
+    # ロールアップ対象とする過去日数（この期間内に閉じた週・月を構築）
+    report_rollup_lookback_days: int = 70
+    # 月次ロールアップ済みの日次キーを保持する日数。0 で失効させない
+    # 失効した月を途中から・途中までしか含まない期間は、レポートで集計できる範囲に縮める
+    report_daily_retention_days: int = 90
+    # 参照ドキュメント・チャンクの集合に保持する上位件数
+    # （ロールアップ時と、/ask の記録時に一定割合で切り詰める）
+    report_top_n: int = 200
+    # /ask の記録時に当日の集合を切り詰める割合（ロールアップを無効にしていても有界にする）
+    report_top_trim_sample_rate: float = 0.05
+    # エビデンス画面の推定質問（LLM）のキャッシュ有効秒数
+    report_inference_cache_ttl_seconds: int = 86400
+
+    # === メトリクス（Prometheus テキスト形式の /metrics） ===
+    # テナント別の件数・トークン・コストを含むため既定では無効
+    metrics_enabled: bool = False
+    # 設定時は Authorization: Bearer <token> を要求する（本番で有効にする場合は必須）
+    metrics_auth_token: str | None = None
+
+    # === リクエストトレース（GET /api/v1/admin/traces） ===
+    tracing_enabled: bool = True
+    # ワーカーごとに保持するトレース数（古いものから捨てる）
+    trace_buffer_size: int = 200
+    # この時間以上かかったリクエストと 5xx は必ず保持し、それ以外は割合で標本化する
+    trace_slow_ms: float = 1000.0
+    trace_sample_rate: float = 0.01
+
+    # === ログ（キュー経由で別スレッドから出力） ===
+    # json: 1行1オブジェクト / text: 人が読む形式
+    log_format: str = "json"
+    # 検索結果のスコア内訳（DEBUG）。False で計算ごと省略する
+    retrieval_debug_log: bool = True
+    # 検索結果の内訳を記録するリクエストの割合
+    retrieval_log_sample_rate: float = 0.1
+
+    # === リクエスト単位のプロファイル（X-Profile: 1 と管理者シークレットで有効） ===
+    profiling_enabled: bool = True
+    profile_directory: str = "./profiles"
+    # 保持するプロファイル数（古いものから削除）
+    profile_max_files: int = 20
+
+    # === イベントループの遅延監視 ===
+    loop_monitor_enabled: bool = True
+    # 遅延を測る間隔
+    loop_monitor_interval_ms: float = 100.0
+    # この時間以上ループが止まったら、止めている処理のスタックを採取する（0 で無効）
+    loop_block_capture_ms: float = 0.0
+
     # 本番環境用セキュリティ設定
     allowed_hosts: str = "localhost,127.0.0.1"
 
@@ -84,6 +222,31 @@ class Settings(BaseSettings):
         """ベクトルストアの永続化パスを取得"""
         return Path(self.persist_directory)
 
+    @property
+    def embedding_cache_path(self) -> Path:
+        """埋め込みキャッシュの SQLite ファイルを取得"""
+        return Path(self.embedding_cache_file)
+
+    @property
+    def index_registry_path(self) -> Path:
+        """テナントごとのインデックス台帳（埋め込みモデル・次元数・世代）"""
+        return self.persist_path / "index_registry.json"
+
+    @property
+    def migration_state_path(self) -> Path:
+        """埋め込みモデル移行の進捗（全ワーカーから参照・再開に使う）"""
+        return self.persist_path / "migration.json"
+
+    @property
+    def flat_index_path(self) -> Path:
+        """flat バックエンドのインデックス保存先を取得"""
+        return Path(self.flat_index_directory)
+
+    @property
+    def profile_path(self) -> Path:
+        """リクエストのプロファイル（cProfile）の保存先を取得"""
+        return Path(self.profile_directory)
+
     @property
     def upload_path(self) -> Path:
         """アップロードディレクトリのパスを取得"""
@@ -109,6 +272,82 @@ class Settings(BaseSettings):
                 mapping[client] = key
         return mapping
 
+    @property
+    def vector_backend_tenants_map(self) -> dict[str, str]:
+        """テナント → ベクトルバックエンド名の上書き"""
+        mapping: dict[str, str] = {}
+        for pair in (self.vector_backend_tenants or "").split(","):
+            if ":" not in pair:
+                continue
+            tenant, backend = pair.split(":", 1)
+            tenant, backend = tenant.strip(), backend.strip().lower()
+            if tenant and backend in ("chroma", "flat"):
+                mapping[tenant] = backend
+        return mapping
+
+    def vector_backend_for(self, tenant: str | None) -> str:
+        """テナントが使うベクトルバックエンド名"""
+        if tenant is not None:
+            override = self.vector_backend_tenants_map.get(tenant)
+            if override:
+                return override
+        return self.vector_backend
+
+    @property
+    def hnsw_tenants_map(self) -> dict[str, dict[str, Any]]:
+        """テナント → HNSW パラメータの上書き"""
+        mapping: dict[str, dict[str, Any]] = {}
+        for entry in (self.hnsw_tenants or "").split(";"):
+            if ":" not in entry:
+                continue
+            tenant, params = entry.split(":", 1)
+            overrides: dict[str, Any] = {}
+            for pair in params.split(","):
+                if "=" not in pair:
+                    continue
+                key, value = (x.strip() for x in pair.split("=", 1))
+                key = key.lower()
+                if key == "space" and value in ("l2", "cosine", "ip"):
+                    overrides["space"] = value
+                elif key in ("construction_ef", "search_ef", "m"):
+                    try:
+                        overrides[key] = int(value)
+                    except ValueError:
+                        continue
+            if tenant.strip() and overrides:
+                mapping[tenant.strip()] = overrides
+        return mapping
+
+    def hnsw_params_for(self, tenant: str | None) -> dict[str, Any]:
+        """テナントに適用する HNSW パラメータ（space / construction_ef / search_ef / m）"""
+        params: dict[str, Any] = {
+            "space": self.hnsw_space,
+            "construction_ef": self.hnsw_construction_ef,
+            "search_ef": self.hnsw_search_ef,
+            "m": self.hnsw_m,
+        }
+        if tenant is not None:
+            params.update(self.hnsw_tenants_map.get(tenant, {}))
+        return params
+
+    def hnsw_collection_metadata(self, tenant: str | None) -> dict[str, Any]:
+        """Chroma コレクション作成時に渡すメタデータ"""
+        params = self.hnsw_params_for(tenant)
+        return {
+            "hnsw:space": params["space"],
+            "hnsw:construction_ef": params["construction_ef"],
+            "hnsw:search_ef": params["search_ef"],
+            "hnsw:M": params["m"],
+        }
+
+    def score_threshold_for(self, space: str) -> float:
+        """距離の種類に応じた類似度閾値"""
+        if space == "l2":
+            return self.similarity_score_threshold
+        if self.cosine_score_threshold is not None:
+            return self.cosine_score_threshold
+        return self.similarity_score_threshold / 2
+
     @property
     def embed_allowed_origins_list(self) -> list[str]:
         raw = os.getenv("EMBED_ALLOWED_ORIGINS") or (self.embed_allowed_origins or "")
@@ -208,7 +447,10 @@ class Settings(BaseSettings):
         """本番環境での必須チェック"""
         if not self.debug:
             # 必須環境変数のチェック
-            if not self.openai_api_key:
+            uses_openai = (
+                self.embedding_provider == "openai" or self.chat_provider == "openai"
+            )
+            if uses_openai and not self.openai_api_key:
                 raise ValueError("OPENAI_API_KEY is required in production")
             if not self.admin_api_secret:
                 raise ValueError("ADMIN_API_SECRET is required in production")
@@ -221,5 +463,20 @@ class Settings(BaseSettings):
             if not self.embed_allowed_origins:
                 raise ValueError("EMBED_ALLOWED_ORIGINS must be set in production")
 
+            # メトリクスはテナント一覧・利用額を含むため認証なしでは公開しない
+            if self.metrics_enabled and not self.metrics_auth_token:
+                raise ValueError(
+                    "METRICS_AUTH_TOKEN is required when METRICS_ENABLED in production"
+                )
+
+        # 埋め込み Chroma は複数プロセスから同じ SQLite/HNSW ファイルへ書き込めない
+        # （flat バックエンドはセグメント + manifest の差し替えでワーカー間共有できる）
+        uses_chroma = "chroma" in (
+            self.vector_backend,
+            *self.vector_backend_tenants_map.values(),
+        )
+        if self.workers > 1 and self.chroma_mode == "embedded" and uses_chroma:
+            raise ValueError("WORKERS > 1 requires CHROMA_MODE=http")
+
 
 settings = Settings()
@@ -0,0 +1,107 @@
+"""
+ログ設定モジュール
+ログの出力（フォーマットと書き込み）をイベントループから切り離す
+
+- ハンドラはキューに積むだけの QueueHandler。書き込みは QueueListener のスレッドが行う
+- 構造化ログは extra={"fields": {...}} で渡し、JSON 形式ではトップレベルのキーとして出力する
+- 高頻度の DEBUG ログ（検索結果の内訳など）は sampled() でリクエスト単位に間引く
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime as dt
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from .config import settings
+
+# LogRecord の標準属性（これ以外の属性は extra として出力する）
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行の JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": dt.datetime.fromtimestamp(
+                record.created, dt.timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """従来の1行形式（構造化フィールドは末尾に JSON で付ける）"""
+
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + json.dumps(fields, ensure_ascii=False, default=str)
+        return line
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    fields = dict(getattr(record, "fields", None) or {})
+    for name, value in vars(record).items():
+        if name not in _RESERVED and name != "fields":
+            fields.setdefault(name, value)
+    return fields
+
+
+def configure_logging(level: int | None = None, stream=None) -> QueueListener:
+    """ルートロガーをキュー経由の出力に切り替える（再呼び出しで差し替え）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if level is None:
+        level = logging.DEBUG if settings.debug else logging.INFO
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter() if settings.log_format == "json" else TextFormatter()
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出してスレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def sampled(rate: float) -> bool:
+    """rate の割合で True（1 以上は常に、0 以下は常に False）"""
+    return rate >= 1 or (rate > 0 and random.random() < rate)
@@ -0,0 +1,142 @@
+"""
+イベントループ監視モジュール
+イベントループの遅延（予定した時刻から実際に再開するまでの遅れ）を一定間隔で測り、
+メトリクス（tuukaa_event_loop_lag_seconds）に記録する
+
+- 遅延は同期的な処理（ブロッキング I/O・重い CPU 処理）がループを占有している時間の目安
+- LOOP_BLOCK_CAPTURE_MS を設定すると、別スレッドの監視役がループの停止を検知し、
+  止まっている最中のループのスレッドのスタックを採取する（デバッグ・CI 用）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any
+
+from .config import settings
+from .metrics import LOOP_BLOCKED, LOOP_LAG_LAST, LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 保持するブロッキングの記録数
+BLOCK_HISTORY = 50
+
+
+class LoopMonitor:
+    """遅延の計測タスクと、停止を検知してスタックを採取する監視スレッド"""
+
+    def __init__(self, interval: float, block_threshold: float = 0.0):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.blocked: deque[dict[str, Any]] = deque(maxlen=BLOCK_HISTORY)
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._loop_thread: int | None = None
+        self._heartbeat = time.monotonic()
+        self._reported: float | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._heartbeat = time.monotonic()
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+
+    def _watch(self) -> None:
+        poll = min(self.interval, self.block_threshold) / 2
+        while not self._stopped.wait(poll):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.block_threshold or heartbeat == self._reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread or 0)
+            if frame is None:
+                continue
+            # 同じ停止は1回だけ記録する
+            self._reported = heartbeat
+            stack = traceback.format_stack(frame)
+            self.blocked.append(
+                {
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "blocked_ms": round(stalled * 1000, 1),
+                    "stack": stack,
+                }
+            )
+            LOOP_BLOCKED.inc()
+            logger.warning(
+                "イベントループが停止しています",
+                extra={"fields": {"blocked_ms": round(stalled * 1000, 1)}},
+            )
+
+    def start(self) -> None:
+        """実行中のイベントループで監視を開始する"""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.block_threshold > 0:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "block_capture_ms": self.block_threshold * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "blocked": list(self.blocked),
+        }
+
+
+monitor: LoopMonitor | None = None
+
+
+def start_monitor() -> LoopMonitor | None:
+    """設定に従ってワーカーのループ監視を開始する（lifespan から呼ぶ）"""
+    global monitor
+    if not settings.loop_monitor_enabled or settings.loop_monitor_interval_ms <= 0:
+        return None
+    monitor = LoopMonitor(
+        settings.loop_monitor_interval_ms / 1000,
+        max(0.0, settings.loop_block_capture_ms) / 1000,
+    )
+    monitor.start()
+    return monitor
+
+
+async def stop_monitor() -> None:
+    global monitor
+    if monitor is not None:
+        await monitor.stop()
+        monitor = None
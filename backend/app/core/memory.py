@@ -0,0 +1,180 @@
+"""
+メモリ計測モジュール
+ワーカー内のキャッシュ・制限テーブル・インデックスのおおよそのサイズと、
+tracemalloc による確保元の差分を求める（管理API GET /api/v1/admin/memory）
+
+- サイズは sys.getsizeof をコンテナと属性まで辿って合計した概算。1回の集計内で
+  共有されている物は1度だけ数え、辿るオブジェクト数には上限を設ける
+- NumPy 配列はデータを所有するもののみ本体を数える（mmap の配列はページキャッシュ上の
+  ため、flat インデックスの resident_bytes として別に報告する）
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import deque
+from typing import Any
+
+import numpy as np
+
+# 1回の集計で辿るオブジェクト数の上限（巨大な構造で管理APIが長く止まらないように）
+MAX_OBJECTS = 200_000
+
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+class SizeCounter:
+    """共有オブジェクトを重複して数えない sizeof の集計"""
+
+    def __init__(self, max_objects: int = MAX_OBJECTS):
+        self._seen: set[int] = set()
+        self.max_objects = max_objects
+        self.truncated = False
+
+    def sizeof(self, obj: Any) -> int:
+        total = 0
+        stack = [obj]
+        while stack:
+            current = stack.pop()
+            if id(current) in self._seen or isinstance(current, _SKIP_TYPES):
+                continue
+            if len(self._seen) >= self.max_objects:
+                self.truncated = True
+                break
+            self._seen.add(id(current))
+            if isinstance(current, np.ndarray):
+                # データを所有する配列のみ本体を含む（mmap・ビューはヘッダのみ）
+                total += sys.getsizeof(current)
+                continue
+            try:
+                total += sys.getsizeof(current)
+            except TypeError:
+                continue
+            stack.extend(_referents(current))
+        return total
+
+
+def _referents(obj: Any) -> list[Any]:
+    """辿る子オブジェクト（走査中に他スレッドが変更した場合は辿らない）"""
+    try:
+        if isinstance(obj, dict):
+            return [x for pair in list(obj.items()) for x in pair]
+        if isinstance(obj, (list, tuple, set, frozenset, deque)):
+            return list(obj)
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+            return []
+        return gc.get_referents(obj)
+    except RuntimeError:
+        return []
+
+
+def table(name: str, obj: Any, counter: SizeCounter) -> dict[str, Any]:
+    """コンテナの件数と概算バイト数"""
+    try:
+        entries = len(obj)
+    except TypeError:
+        entries = None
+    return {"name": name, "entries": entries, "approx_bytes": counter.sizeof(obj)}
+
+
+def process_memory() -> dict[str, Any]:
+    """プロセス全体の RSS（取得できる環境のみ）"""
+    info: dict[str, Any] = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared, *_ = (int(x) for x in f.read().split())
+        page = os.sysconf("SC_PAGE_SIZE")
+        info["rss_bytes"] = resident * page
+        info["shared_bytes"] = shared * page
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KiB、macOS は bytes
+        info["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        pass
+    return info
+
+
+# ===== tracemalloc（基準スナップショットとの差分） =====
+
+_trace_lock = threading.Lock()
+_baseline: tracemalloc.Snapshot | None = None
+
+
+def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+
+
+def start_tracing(frames: int = 1) -> dict[str, Any]:
+    """tracemalloc を開始し、基準スナップショットを取る（実行中は基準を取り直す）"""
+    global _baseline
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+        _baseline = _filtered(tracemalloc.take_snapshot())
+        return tracing_status()
+
+
+def stop_tracing() -> dict[str, Any]:
+    global _baseline
+    with _trace_lock:
+        _baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return tracing_status()
+
+
+def tracing_status() -> dict[str, Any]:
+    status: dict[str, Any] = {"tracing": tracemalloc.is_tracing()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        status.update(
+            traced_bytes=current,
+            peak_traced_bytes=peak,
+            overhead_bytes=tracemalloc.get_tracemalloc_memory(),
+            frames=tracemalloc.get_traceback_limit(),
+        )
+    return status
+
+
+def top_allocations(limit: int = 20, reset: bool = False) -> dict[str, Any] | None:
+    """基準からの確保量の増加が大きい順（未開始なら None）
+
+    reset=True で今回のスナップショットを次回の基準にする。
+    """
+    global _baseline
+    with _trace_lock:
+        if not tracemalloc.is_tracing() or _baseline is None:
+            return None
+        snapshot = _filtered(tracemalloc.take_snapshot())
+        stats = snapshot.compare_to(_baseline, "traceback")
+        if reset:
+            _baseline = snapshot
+    return {
+        **tracing_status(),
+        "top": [
+            {
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+                "traceback": [f"{f.filename}:{f.lineno}" for f in stat.traceback],
+            }
+            for stat in stats[:limit]
+        ],
+    }
@@ -0,0 +1,324 @@
+"""
+メトリクスモジュール
+リクエスト処理の段階別の所要時間・キャッシュのヒット数・トークン数・コストを
+ワーカー内で集計し、Prometheus のテキスト形式（/metrics）で出力する
+段階の計測は同名のトレースのスパン（core.tracing）も兼ねる
+
+外部ライブラリに依存しない最小限の実装（Counter / Gauge / Histogram）。値はワーカー単位のため、
+複数ワーカーでは Prometheus 側で合算する。ラベルのテナントは登録済みテナントに限られ、
+モデルは既知のモデル（料金表・既定のモデル）以外を "other" にまとめるため、系列数は有界。
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from . import tracing
+from .config import settings
+from .registry import get_registry
+
+# 秒単位のバケット（LLM 呼び出しの数十秒まで）
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict[str, str | None]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} のラベルは {', '.join(self.labelnames)} です"
+            )
+        return tuple(str(labels[name] or "") for name in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加する値（ラベルの組ごと）"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str | None) -> None:
+        if amount < 0:
+            raise ValueError("Counter は減らせません")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str | None) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            labels = _format_labels(list(zip(self.labelnames, key)))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(_Metric):
+    """最新の値（ラベルの組ごと）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str | None) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str | None) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            labels = _format_labels(list(zip(self.labelnames, key)))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """観測値の分布（累積バケット・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルの組 → [バケット別件数（非累積、最後は +Inf）, 合計, 件数]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str | None) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str | None) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(
+                (key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()
+            )
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                labels = _format_labels(pairs + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(pairs)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"{metric.name} は登録済みです")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Prometheus テキスト形式（version 0.0.4）"""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """全系列を消す（テスト用）"""
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# model ラベルは、回答生成の段階ではチャットモデル、検索の段階では埋め込みモデル
+STAGE_SECONDS = Histogram(
+    "tuukaa_stage_duration_seconds",
+    "Duration of each request processing stage.",
+    ("stage", "tenant", "model"),
+)
+REQUEST_SECONDS = Histogram(
+    "tuukaa_request_duration_seconds",
+    "End-to-end handler duration.",
+    ("endpoint", "tenant"),
+)
+CACHE_HITS = Counter("tuukaa_cache_hits_total", "Cache hits by cache.", ("cache",))
+CACHE_MISSES = Counter(
+    "tuukaa_cache_misses_total", "Cache misses by cache.", ("cache",)
+)
+TOKENS = Counter(
+    "tuukaa_llm_tokens_total",
+    "LLM tokens accounted for answers.",
+    ("tenant", "model", "direction"),
+)
+COST_JPY = Counter(
+    "tuukaa_llm_cost_jpy_total",
+    "Estimated LLM cost in JPY.",
+    ("tenant", "model"),
+)
+LOOP_LAG_SECONDS = Histogram(
+    "tuukaa_event_loop_lag_seconds",
+    "Event loop scheduling delay measured by the lag monitor.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_LAG_LAST = Gauge(
+    "tuukaa_event_loop_lag_last_seconds", "Most recent event loop lag sample."
+)
+LOOP_BLOCKED = Counter(
+    "tuukaa_event_loop_blocked_total",
+    "Times the event loop was blocked longer than the capture threshold.",
+)
+
+
+# 既知でないモデル名をまとめる model ラベル
+OTHER_MODEL = "other"
+
+
+def model_label(model: str | None) -> str | None:
+    """model ラベルの値（リクエストで指定された未知のモデル名は "other"）"""
+    if model is None:
+        return None
+    name = model.strip()
+    if name in (settings.default_model, settings.embedding_model):
+        return name
+    if name in get_registry().pricing.prices:
+        return name
+    return OTHER_MODEL
+
+
+@contextmanager
+def stage_timer(
+    stage: str, tenant: str | None = None, model: str | None = None
+) -> Iterator[tracing.SpanLike]:
+    """ブロックの所要時間を段階別ヒストグラムに記録し、同名のスパンを返す
+
+    例外で抜けた場合も記録する。
+    """
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage) as span:
+            yield span
+    finally:
+        STAGE_SECONDS.observe(
+            time.perf_counter() - start,
+            stage=stage,
+            tenant=tenant,
+            model=model_label(model),
+        )
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    """キャッシュの結果を数え、現在のスパンにも記録する"""
+    tracing.set_attributes(
+        **{f"{cache}_cache_hits": hits, f"{cache}_cache_misses": misses}
+    )
+    if hits:
+        CACHE_HITS.inc(hits, cache=cache)
+    if misses:
+        CACHE_MISSES.inc(misses, cache=cache)
+
+
+def render() -> str:
+    return registry.render()
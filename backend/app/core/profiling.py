@@ -0,0 +1,146 @@
+"""
+リクエスト単位のプロファイルモジュール
+X-Profile: 1 と管理者シークレットを付けたリクエストだけを cProfile で計測し、
+結果を件数上限つきのディレクトリに保存する（本番でのみ再現する遅さの調査用）
+
+- cProfile はイベントループのスレッドを計測するため、同時に処理していた別リクエストの
+  処理も混ざる。asyncio.to_thread に逃がした処理は含まれない
+- 同時に計測できるのは1リクエストのみ。計測中の場合は計測せずに処理する
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from .config import settings
+
+_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+_lock = threading.Lock()
+
+
+def _header(scope: dict, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def requested(scope: dict) -> bool:
+    """プロファイルの要求が有効か（管理者シークレットが一致する場合のみ）"""
+    secret = settings.admin_api_secret
+    return (
+        settings.profiling_enabled
+        and bool(secret)
+        and _header(scope, b"x-profile") == "1"
+        and _header(scope, b"x-admin-api-secret") == secret
+    )
+
+
+def _save(profile_id: str, profiler: cProfile.Profile, meta: dict[str, Any]) -> None:
+    directory = settings.profile_path
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(directory / f"{profile_id}.prof"))
+    (directory / f"{profile_id}.json").write_text(
+        json.dumps(meta, ensure_ascii=False), encoding="utf-8"
+    )
+    # 件数上限を超えた分を古い順に削除
+    files = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for old in files[: max(0, len(files) - max(1, settings.profile_max_files))]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+
+def _path(profile_id: str, suffix: str) -> Path | None:
+    if not _ID_PATTERN.match(profile_id):
+        return None
+    path = settings.profile_path / f"{profile_id}{suffix}"
+    return path if path.exists() else None
+
+
+def list_profiles() -> list[dict[str, Any]]:
+    """保存済みプロファイルのメタデータ（新しい順）"""
+    directory = settings.profile_path
+    if not directory.exists():
+        return []
+    items = []
+    for path in directory.glob("*.json"):
+        try:
+            items.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return sorted(items, key=lambda m: m.get("created_at", ""), reverse=True)
+
+
+def profile_file(profile_id: str) -> Path | None:
+    """pstats 形式のファイル（snakeviz などで開ける）"""
+    return _path(profile_id, ".prof")
+
+
+def report(profile_id: str, sort: str = "cumulative", limit: int = 40) -> str | None:
+    """pstats のテキストレポート（上位 limit 関数）"""
+    path = profile_file(profile_id)
+    if path is None:
+        return None
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class ProfileMiddleware:
+    """要求されたリクエストを cProfile で包む ASGI ミドルウェア
+
+    ストリーミング応答は送信の完了までを含む。応答には X-Profile-Id を付ける。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not _lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:16]
+        status: dict[str, int] = {}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = cProfile.Profile()
+        created_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            _lock.release()
+            meta = {
+                "id": profile_id,
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status.get("code"),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "created_at": created_at,
+            }
+            await asyncio.to_thread(_save, profile_id, profiler, meta)
@@ -0,0 +1,154 @@
+"""
+実行時レジストリモジュール
+テナントキー索引と料金表を設定から一度だけ構築し、リクエストごとの再解析を避ける
+SIGHUP または管理APIから再読み込みできる
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from .config import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+# 既定: gpt-4o-mini の実コスト（USD/1M tokens）
+DEFAULT_USD_PER_MTOKEN_IN = 0.15
+DEFAULT_USD_PER_MTOKEN_OUT = 0.60
+
+# 再読み込みの対象とする設定項目
+RELOADABLE_FIELDS = ("embed_api_keys", "model_pricing", "usd_jpy_rate")
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+@dataclass(frozen=True)
+class TenantKeyIndex:
+    """埋め込みキー → テナントの索引
+
+    キーのSHA-256ダイジェストで引き、最後に実キーを定数時間比較する。
+    """
+
+    by_digest: Mapping[bytes, tuple[str, bytes]]
+    tenants: frozenset[str]
+
+    @classmethod
+    def build(cls, keys_map: dict[str, str]) -> "TenantKeyIndex":
+        by_digest = {
+            _digest(key): (tenant, key.encode("utf-8"))
+            for tenant, key in keys_map.items()
+        }
+        return cls(MappingProxyType(by_digest), frozenset(keys_map))
+
+    def lookup(self, key: str | None) -> str | None:
+        if not key:
+            return None
+        hit = self.by_digest.get(_digest(key))
+        if hit is None:
+            return None
+        tenant, expected = hit
+        if not hmac.compare_digest(expected, key.encode("utf-8")):
+            return None
+        return tenant
+
+
+@dataclass(frozen=True)
+class PricingTable:
+    """モデルごとの (入力JPY/token, 出力JPY/token)"""
+
+    prices: Mapping[str, tuple[float, float]]
+    default: tuple[float, float]
+
+    @classmethod
+    def build(
+        cls, inout_map: dict[str, tuple[float, float]], usd_jpy_rate: float
+    ) -> "PricingTable":
+        rate = float(usd_jpy_rate)
+        prices = {
+            name: (float(usd_in) * rate, float(usd_out) * rate)
+            for name, (usd_in, usd_out) in inout_map.items()
+        }
+        default = (
+            (DEFAULT_USD_PER_MTOKEN_IN / 1_000_000.0) * rate,
+            (DEFAULT_USD_PER_MTOKEN_OUT / 1_000_000.0) * rate,
+        )
+        return cls(MappingProxyType(prices), default)
+
+    def jpy_per_token(self, model: str | None) -> tuple[float, float]:
+        return self.prices.get((model or "").strip(), self.default)
+
+
+@dataclass(frozen=True)
+class RuntimeRegistry:
+    source: tuple[str | None, str | None, float]
+    tenant_index: TenantKeyIndex
+    pricing: PricingTable
+
+
+def _source(s: Settings) -> tuple[str | None, str | None, float]:
+    return (s.embed_api_keys, s.model_pricing, s.usd_jpy_rate)
+
+
+def _compile(s: Settings) -> RuntimeRegistry:
+    return RuntimeRegistry(
+        source=_source(s),
+        tenant_index=TenantKeyIndex.build(s.embed_api_keys_map),
+        pricing=PricingTable.build(s.model_pricing_inout_map, s.usd_jpy_rate),
+    )
+
+
+_lock = threading.Lock()
+_registry: RuntimeRegistry = _compile(settings)
+
+
+def get_registry() -> RuntimeRegistry:
+    """構築済みのレジストリを取得
+
+    設定値が書き換えられていた場合（テストでの差し替えなど）のみ再構築する。
+    """
+    global _registry
+    current = _registry
+    if current.source != _source(settings):
+        with _lock:
+            _registry = current = _compile(settings)
+    return current
+
+
+def tenant_from_key(key: str | None) -> str | None:
+    return get_registry().tenant_index.lookup(key)
+
+
+def has_tenant(tenant: str) -> bool:
+    return tenant in get_registry().tenant_index.tenants
+
+
+def jpy_per_token(model: str | None) -> tuple[float, float]:
+    return get_registry().pricing.jpy_per_token(model)
+
+
+def reload_registry() -> dict[str, int]:
+    """環境変数から再読み込み可能な設定を読み直し、レジストリを再構築する
+
+    Raises:
+        ValueError: 新しい設定の検証に失敗した場合（既存の設定は維持される）
+    """
+    global _registry
+    fresh = Settings()
+    with _lock:
+        for field in RELOADABLE_FIELDS:
+            setattr(settings, field, getattr(fresh, field))
+        _registry = _compile(settings)
+        registry = _registry
+    logger.info("テナントキー索引と料金表を再読み込みしました")
+    return {
+        "tenants": len(registry.tenant_index.tenants),
+        "priced_models": len(registry.pricing.prices),
+    }
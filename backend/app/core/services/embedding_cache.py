@@ -0,0 +1,214 @@
+"""
+埋め込みキャッシュモジュール
+チャンク本文のハッシュと埋め込みモデルをキーに、計算済みの埋め込みを SQLite に保存する
+
+- 同じ本文の再アップロードや再インデックスで埋め込み API を呼ばない
+- text-embedding-3 系は先頭次元の切り詰め＋再正規化が短縮出力と等価なため、
+  より高次元で保存済みの埋め込みから低次元の埋め込みを作れる
+- 本文そのものは保存しない（キーは SHA-256）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..metrics import record_cache
+
+# 短縮出力（Matryoshka 表現）に対応し、切り詰めで低次元化できるモデル
+SHORTENABLE_MODEL_PREFIXES = ("text-embedding-3-",)
+
+
+def supports_shortening(model: str) -> bool:
+    return model.startswith(SHORTENABLE_MODEL_PREFIXES)
+
+
+def shorten(vector: Any, dimensions: int) -> list[float]:
+    """先頭 dimensions 次元に切り詰めて L2 正規化（OpenAI の dimensions 指定と同じ変換）"""
+    head = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = float(np.linalg.norm(head))
+    if norm > 0:
+        head = head / norm
+    return head.tolist()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """(モデル, 本文ハッシュ, 要求次元数) → 埋め込み のキャッシュ
+
+    要求次元数 0 はモデル既定（最大次元）の出力を表す。
+    複数ワーカーから同じファイルを使えるよう WAL モードで開く。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=10, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash TEXT NOT NULL,"
+                " requested INTEGER NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_hash, requested))"
+            )
+            self._conn.commit()
+        self.hits = 0
+        self.shortened = 0
+        self.misses = 0
+
+    def get_many(
+        self, model: str, texts: list[str], dimensions: int | None = None
+    ) -> list[list[float] | None]:
+        """キャッシュ済みの埋め込みを取得（無いものは None）
+
+        同じ要求次元の保存値が無い場合、より高次元の保存値を短縮して返す
+        （短縮に対応したモデルのみ）。
+        """
+        requested = dimensions or 0
+        keys = [text_key(t) for t in texts]
+        rows: dict[str, dict[int, np.ndarray]] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start : start + 500]
+                marks = ",".join("?" * len(part))
+                for text_hash, req, blob in self._conn.execute(
+                    f"SELECT text_hash, requested, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *part],
+                ):
+                    rows.setdefault(text_hash, {})[req] = np.frombuffer(
+                        blob, dtype=np.float32
+                    )
+
+        shortenable = requested > 0 and supports_shortening(model)
+        result: list[list[float] | None] = []
+        for key in keys:
+            stored = rows.get(key, {})
+            if requested in stored:
+                self.hits += 1
+                result.append(stored[requested].tolist())
+                continue
+            larger = [v for v in stored.values() if len(v) > requested]
+            if shortenable and larger:
+                self.shortened += 1
+                result.append(shorten(min(larger, key=len), requested))
+                continue
+            self.misses += 1
+            result.append(None)
+        return result
+
+    def put_many(
+        self,
+        model: str,
+        texts: list[str],
+        vectors: list[list[float]],
+        dimensions: int | None = None,
+    ) -> None:
+        records = [
+            (
+                model,
+                text_key(text),
+                dimensions or 0,
+                np.asarray(vector, dtype=np.float32).tobytes(),
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, requested, vector)"
+                " VALUES (?, ?, ?, ?)",
+                records,
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "hits": self.hits,
+            "shortened": self.shortened,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """文書の埋め込みをキャッシュ経由で計算する Embeddings ラッパー
+
+    クエリは毎回異なることが多いためキャッシュせず、そのまま委譲する。
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        cache: EmbeddingCache,
+        model: str,
+        dimensions: int | None = None,
+    ):
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+        self.dimensions = dimensions
+
+    @staticmethod
+    def _merge(
+        cached: list[list[float] | None], computed: list[list[float]]
+    ) -> list[list[float]]:
+        it = iter(computed)
+        return [vector if vector is not None else next(it) for vector in cached]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached = self.cache.get_many(self.model, texts, self.dimensions)
+        missing = [t for t, v in zip(texts, cached) if v is None]
+        record_cache("embedding", hits=len(texts) - len(missing), misses=len(missing))
+        computed = self.inner.embed_documents(missing) if missing else []
+        if missing:
+            self.cache.put_many(self.model, missing, computed, self.dimensions)
+        return self._merge(cached, computed)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, _ = await self.aembed_documents_counted(texts)
+        return vectors
+
+    async def aembed_documents_counted(
+        self, texts: list[str]
+    ) -> tuple[list[list[float]], int]:
+        """埋め込みと、そのうちキャッシュから得た件数を返す"""
+        cached = await asyncio.to_thread(
+            self.cache.get_many, self.model, texts, self.dimensions
+        )
+        missing = [t for t, v in zip(texts, cached) if v is None]
+        record_cache("embedding", hits=len(texts) - len(missing), misses=len(missing))
+        computed = await self.inner.aembed_documents(missing) if missing else []
+        if missing:
+            await asyncio.to_thread(
+                self.cache.put_many, self.model, missing, computed, self.dimensions
+            )
+        return self._merge(cached, computed), len(texts) - len(missing)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.inner.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.inner.aembed_query(text)
@@ -0,0 +1,79 @@
+"""
+埋め込み API の流量制御モジュール
+再インデックス・モデル移行などの裏側の処理が埋め込み API の上限（TPM）を使い切り、
+本番のアップロード・検索の埋め込みを詰まらせないよう、送信トークン数を一定の速度に均す
+
+- トークン数は文字数からの概算（4文字≒1トークン、料金見積もりと同じ近似）
+- キャッシュ済みの埋め込みは API を呼ばないため、キャッシュの内側（API 呼び出し直前）に置く
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from ..config import settings
+
+
+def estimate_tokens(texts: list[str]) -> int:
+    return sum(max(1, len(text) // 4) for text in texts)
+
+
+class EmbeddingRateLimiter:
+    """トークン/分の上限で送信を等間隔に並べる（バーストさせない）"""
+
+    def __init__(self, tokens_per_minute: float):
+        self.tokens_per_minute = tokens_per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + tokens * 60.0 / self.tokens_per_minute
+        delay = start - now
+        if delay > 0:
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
+
+class ThrottledEmbeddings(Embeddings):
+    """文書の埋め込みを流量制御してから委譲する Embeddings ラッパー
+
+    裏側の処理は非同期版のみを使うため、同期版とクエリは制御せずに委譲する。
+    """
+
+    def __init__(self, inner: Embeddings, limiter: EmbeddingRateLimiter):
+        self.inner = inner
+        self.limiter = limiter
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await self.limiter.acquire(estimate_tokens(texts))
+        return await self.inner.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.inner.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.inner.aembed_query(text)
+
+
+_background_limiter: EmbeddingRateLimiter | None = None
+
+
+def background_limiter() -> EmbeddingRateLimiter:
+    """再インデックス・移行で共有する（ワーカー単位の）流量制御"""
+    global _background_limiter
+    rate = settings.reindex_embedding_tokens_per_minute
+    if _background_limiter is None or _background_limiter.tokens_per_minute != rate:
+        _background_limiter = EmbeddingRateLimiter(rate)
+    return _background_limiter
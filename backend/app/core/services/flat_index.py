@@ -0,0 +1,694 @@
+"""
+フラットインデックスモジュール
+テナントごとに埋め込み行列を NumPy のメモリマップファイルで保持し、
+全件の距離計算 + argpartition で上位k件を求めるベクトルバックエンド
+
+ベクトルと行ノルムは不変のセグメントファイルを mmap で読むため、
+同一ノード上の複数ワーカーはページキャッシュ上の1つの物理コピーを共有する。
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import quote, unquote
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .vector_backend import VectorBackend, matches_where
+
+# テナント未指定のチャンクを格納するディレクトリ名
+NO_TENANT = "_default"
+# 距離計算を行単位で分割する大きさ（float16 の一時変換メモリを抑える）
+SCORE_BLOCK_ROWS = 16384
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+# 読み込み中に他ワーカーの書き込みで旧セグメントが消えた場合の再試行回数
+RELOAD_ATTEMPTS = 3
+# get_system_info に出すロード・退避イベントの保持件数
+EVENT_HISTORY = 50
+# 再インデックスで作る世代の格納キー（"<テナント>@g<世代>"）
+GENERATION_SEP = "@g"
+
+
+def tenant_dirname(tenant: str | None) -> str:
+    """テナント名をディレクトリ名に安全に変換（区切り文字・ドットをエスケープ）
+
+    quote はドットをそのまま残すため、"." / ".." がルート自身・親ディレクトリを
+    指さないよう明示的に %2E に置き換える。
+    """
+    if tenant == "":
+        raise ValueError("tenant must not be empty")
+    name = tenant if tenant is not None else NO_TENANT
+    return quote(name, safe="-_").replace(".", "%2E")
+
+
+def location_key(tenant: str | None, generation: int) -> str | None:
+    """テナントのある世代のインデックスを指す格納キー（世代0はテナント名そのもの）"""
+    if generation <= 0:
+        return tenant
+    return f"{tenant if tenant is not None else NO_TENANT}{GENERATION_SEP}{generation}"
+
+
+def key_tenant(key: str | None) -> str | None:
+    """格納キーからテナント名を取り出す"""
+    if key is None:
+        return None
+    base, sep, generation = key.rpartition(GENERATION_SEP)
+    return base if sep and generation.isdigit() else key
+
+
+def _write_atomic(path: Path, write: Any) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def segment_files(name: str) -> tuple[str, str, str]:
+    """セグメントを構成するファイル名（ベクトル・行ノルム・メタデータ）"""
+    return f"{name}.npy", f"{name}.norms.npy", f"{name}.json"
+
+
+class Segment:
+    """不変のセグメント（書き出し後は変更せず、置き換えは新しいセグメントで行う）"""
+
+    def __init__(self, directory: Path, name: str):
+        vectors_file, norms_file, meta_file = segment_files(name)
+        self.name = name
+        self.vectors: np.ndarray = np.load(directory / vectors_file, mmap_mode="r")
+        self.sq_norms: np.ndarray = np.load(directory / norms_file, mmap_mode="r")
+        with open(directory / meta_file, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids: list[str] = meta["ids"]
+        self.documents: list[str] = meta["documents"]
+        self.metadatas: list[dict[str, Any]] = meta["metadatas"]
+        # サイドカーはプロセスごとのヒープに載るため、ファイルサイズで概算する
+        self.meta_bytes = os.path.getsize(directory / meta_file)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """マップしているベクトル・ノルムとメタデータの概算バイト数"""
+        return int(self.vectors.nbytes + self.sq_norms.nbytes + self.meta_bytes)
+
+    def touch(self) -> None:
+        """全ページを一度読んでページキャッシュに載せる（ウォームアップ用）"""
+        step = max(1, 4096 // max(1, self.vectors.strides[0]))
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.vectors[start : start + SCORE_BLOCK_ROWS : step]
+            float(np.asarray(block[:, :1], dtype=np.float32).sum())
+        float(np.asarray(self.sq_norms).sum())
+
+    @classmethod
+    def create(
+        cls,
+        directory: Path,
+        vectors: np.ndarray,
+        ids: list[str],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+        dtype: np.dtype,
+    ) -> "Segment":
+        name = f"seg-{uuid.uuid4().hex[:16]}"
+        vectors_file, norms_file, meta_file = segment_files(name)
+        stored = np.ascontiguousarray(vectors, dtype=dtype)
+        # ノルムは格納精度の値から計算し、検索時の距離と整合させる
+        as_f32 = stored.astype(np.float32)
+        norms = np.einsum("ij,ij->i", as_f32, as_f32).astype(np.float32)
+        _write_atomic(directory / vectors_file, lambda f: np.save(f, stored))
+        _write_atomic(directory / norms_file, lambda f: np.save(f, norms))
+        meta = {"ids": ids, "documents": documents, "metadatas": metadatas}
+        _write_atomic(
+            directory / meta_file,
+            lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8")),
+        )
+        return cls(directory, name)
+
+    def distances(
+        self, query: np.ndarray, query_sq: float, space: str = "l2"
+    ) -> np.ndarray:
+        """全行との距離（Chroma の同名 space と同じ尺度）
+
+        - l2:     二乗L2距離
+        - cosine: 1 - コサイン類似度
+        - ip:     1 - 内積
+        """
+        dots = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(
+                self.vectors[start : start + SCORE_BLOCK_ROWS], dtype=np.float32
+            )
+            dots[start : start + len(block)] = block @ query
+        if space == "ip":
+            return np.subtract(1.0, dots, out=dots)
+        if space == "cosine":
+            norms = np.sqrt(self.sq_norms * query_sq)
+            np.divide(dots, norms, out=dots, where=norms > 0)
+            dots[norms == 0] = 0.0
+            return np.subtract(1.0, dots, out=dots)
+        dists = self.sq_norms - 2.0 * dots + query_sq
+        return np.maximum(dists, 0.0, out=dists)
+
+
+@dataclass(frozen=True)
+class FlatSnapshot:
+    """ある版の manifest に対応する読み取り専用ビュー
+
+    検索は1つのスナップショットだけを参照するため、途中で別スレッドが
+    新しい版を読み込んでも結果が混ざらない。
+    """
+
+    version: int = 0
+    segments: tuple[Segment, ...] = ()
+    ids: list[str] = field(default_factory=list)
+    documents: list[str] = field(default_factory=list)
+    metadatas: list[dict[str, Any]] = field(default_factory=list)
+    positions: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, version: int, segments: list[Segment]) -> "FlatSnapshot":
+        ids: list[str] = []
+        documents: list[str] = []
+        metadatas: list[dict[str, Any]] = []
+        for seg in segments:
+            ids.extend(seg.ids)
+            documents.extend(seg.documents)
+            metadatas.extend(seg.metadatas)
+        return cls(
+            version=version,
+            segments=tuple(segments),
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            positions={cid: i for i, cid in enumerate(ids)},
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int | None:
+        return int(self.segments[0].vectors.shape[1]) if self.segments else None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(seg.nbytes for seg in self.segments)
+
+    def distances(self, query: np.ndarray, space: str = "l2") -> np.ndarray:
+        query_sq = float(query @ query)
+        if not self.segments:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(
+            [seg.distances(query, query_sq, space) for seg in self.segments]
+        )
+
+    def vector(self, row: int) -> np.ndarray:
+        """スナップショット内の行番号に対応する埋め込み（float32）"""
+        for seg in self.segments:
+            if row < len(seg):
+                return np.asarray(seg.vectors[row], dtype=np.float32)
+            row -= len(seg)
+        raise IndexError(row)
+
+    def mask(self, where: dict[str, Any] | None) -> np.ndarray | None:
+        if not where:
+            return None
+        return np.fromiter(
+            (matches_where(md, where) for md in self.metadatas),
+            dtype=bool,
+            count=len(self.metadatas),
+        )
+
+
+class TenantFlatIndex:
+    """1テナント分のフラットインデックス
+
+    ディスク上の構成:
+        manifest.json              版番号・次元数・行数・セグメント名の一覧
+        seg-<id>.npy               埋め込み行列（np.load(mmap_mode="r") で読む）
+        seg-<id>.norms.npy         行ノルムの二乗（同上）
+        seg-<id>.json              ids / documents / metadatas のサイドカー
+    追加は新しいセグメントを書くだけで既存ファイルには触れない。削除は対象行を除いた
+    セグメントを作り直す。いずれもプロセス間ロック下でセグメントを書き出してから
+    manifest を os.replace で差し替え、他ワーカーは manifest の変化を検知して取り込む。
+    """
+
+    def __init__(self, path: Path, dtype: str = "float32"):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.last_access = time.time()
+        self.snapshot = FlatSnapshot()
+        self._stamp: tuple[int, int, int] | None = None
+        self._reload_lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    @property
+    def nbytes(self) -> int:
+        return self.snapshot.nbytes
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path / MANIFEST)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def refresh(self) -> FlatSnapshot:
+        """manifest が差し替わっていれば読み直す（他ワーカーの書き込みを取り込む）"""
+        if self._stat() == self._stamp:
+            return self.snapshot
+        with self._reload_lock:
+            for attempt in range(RELOAD_ATTEMPTS):
+                stamp = self._stat()
+                if stamp == self._stamp:
+                    break
+                if stamp is None:
+                    self.snapshot, self._stamp = FlatSnapshot(), None
+                    break
+                try:
+                    manifest = json.loads(
+                        (self.path / MANIFEST).read_text(encoding="utf-8")
+                    )
+                    # セグメントは不変なので、同名のものはマップ済みのまま再利用する
+                    mapped = {seg.name: seg for seg in self.snapshot.segments}
+                    segments = [
+                        mapped.get(name) or Segment(self.path, name)
+                        for name in manifest["segments"]
+                    ]
+                except FileNotFoundError:
+                    # 読み込み中に新しい版が公開され、旧セグメントが削除された
+                    if attempt == RELOAD_ATTEMPTS - 1:
+                        raise
+                    continue
+                self.snapshot = FlatSnapshot.build(int(manifest["version"]), segments)
+                self._stamp = stamp
+                break
+        return self.snapshot
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """同じテナントへの書き込みをプロセス間で直列化"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / LOCK_FILE, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _publish(self, current: FlatSnapshot, segments: list[Segment]) -> None:
+        """manifest を差し替えて新しい版を公開し、参照されなくなったセグメントを削除"""
+        manifest = {
+            "version": current.version + 1,
+            "dim": int(segments[0].vectors.shape[1]) if segments else None,
+            "rows": sum(len(seg) for seg in segments),
+            "segments": [seg.name for seg in segments],
+        }
+        _write_atomic(
+            self.path / MANIFEST,
+            lambda f: f.write(json.dumps(manifest).encode("utf-8")),
+        )
+        with self._reload_lock:
+            self.snapshot = FlatSnapshot.build(manifest["version"], segments)
+            self._stamp = self._stat()
+        # 他ワーカーがマップ中でも unlink 済みファイルのページは解放されるまで有効
+        kept = {seg.name for seg in segments}
+        for seg in current.segments:
+            if seg.name not in kept:
+                for filename in segment_files(seg.name):
+                    try:
+                        (self.path / filename).unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def apply(
+        self,
+        drop_ids: set[str],
+        vectors: np.ndarray | None = None,
+        ids: list[str] | None = None,
+        documents: list[str] | None = None,
+        metadatas: list[dict[str, Any]] | None = None,
+    ) -> None:
+        """削除と追加を1回の manifest 更新で反映する
+
+        プロセス間ロックを取った上で最新の manifest を読み直してから計算するため、
+        別ワーカーの書き込みを失わない。
+        """
+        with self._write_lock():
+            current = self.refresh()
+            if vectors is not None and current.dim not in (None, vectors.shape[1]):
+                raise ValueError(
+                    f"埋め込み次元が一致しません: {current.dim} != {vectors.shape[1]}"
+                )
+            changed = False
+            segments: list[Segment] = []
+            for seg in current.segments:
+                keep = [i for i, cid in enumerate(seg.ids) if cid not in drop_ids]
+                if len(keep) == len(seg):
+                    segments.append(seg)
+                    continue
+                changed = True
+                if keep:
+                    segments.append(
+                        Segment.create(
+                            self.path,
+                            np.asarray(seg.vectors[keep], dtype=np.float32),
+                            [seg.ids[i] for i in keep],
+                            [seg.documents[i] for i in keep],
+                            [seg.metadatas[i] for i in keep],
+                            self.dtype,
+                        )
+                    )
+            if vectors is not None and ids:
+                changed = True
+                segments.append(
+                    Segment.create(
+                        self.path,
+                        vectors,
+                        list(ids),
+                        list(documents or []),
+                        [dict(md) for md in metadatas or []],
+                        self.dtype,
+                    )
+                )
+            if changed:
+                self._publish(current, segments)
+
+    def compact(self, min_segments: int) -> tuple[int, int]:
+        """セグメント数が min_segments 以上なら1つに統合して公開（統合前後の数を返す）"""
+        with self._write_lock():
+            current = self.refresh()
+            before = len(current.segments)
+            if before < max(2, min_segments):
+                return before, before
+            merged = Segment.create(
+                self.path,
+                np.concatenate(
+                    [
+                        np.asarray(seg.vectors, dtype=np.float32)
+                        for seg in current.segments
+                    ]
+                ),
+                list(current.ids),
+                list(current.documents),
+                list(current.metadatas),
+                self.dtype,
+            )
+            self._publish(current, [merged])
+            return before, 1
+
+
+class FlatVectorBackend(VectorBackend):
+    """テナント単位のメモリマップ・フラットインデックス
+
+    検索は O(N·d) の全件探索だが近似誤差がなく（recall=1.0）、
+    テナントごとのチャンク数が数十万程度までは HNSW より予測しやすい遅延で動く。
+
+    距離の種類（space）は検索時に適用するため、テナントごとに変えても再構築は不要。
+
+    テナントのインデックスは初回利用時に読み込み、最終アクセス順（LRU）で管理する。
+    読み込み数または常駐バイト数が上限を超えると、最も長く使われていないテナントから
+    退避する（ファイルは残り、次回利用時に再読み込みされる）。
+    """
+
+    name = "flat"
+
+    def __init__(
+        self,
+        root: Path,
+        dtype: str = "float32",
+        max_tenants: int = 0,
+        max_resident_bytes: int = 0,
+        space: str = "l2",
+        tenant_spaces: dict[str, str] | None = None,
+    ):
+        self.root = Path(root)
+        self.dtype = dtype
+        self.space = space
+        self.tenant_spaces = tenant_spaces or {}
+        self.max_tenants = max_tenants
+        self.max_resident_bytes = max_resident_bytes
+        self._indexes: OrderedDict[str, TenantFlatIndex] = OrderedDict()
+        self._loading: dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self.events: deque[dict[str, Any]] = deque(maxlen=EVENT_HISTORY)
+
+    def _record(self, event: str, name: str, **fields: Any) -> None:
+        self.events.append(
+            {
+                "event": event,
+                "tenant": unquote(name),
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                **fields,
+            }
+        )
+
+    def _index(self, tenant: str | None) -> TenantFlatIndex:
+        name = tenant_dirname(tenant)
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is not None:
+                self._indexes.move_to_end(name)
+            else:
+                loading = self._loading.setdefault(name, threading.Lock())
+        if index is None:
+            # 読み込みはテナント単位で直列化し、他テナントの検索はブロックしない
+            with loading:
+                with self._lock:
+                    index = self._indexes.get(name)
+                if index is None:
+                    started = time.perf_counter()
+                    index = TenantFlatIndex(self.root / name, self.dtype)
+                    with self._lock:
+                        self._indexes[name] = index
+                        self._loading.pop(name, None)
+                        self._record(
+                            "load",
+                            name,
+                            rows=len(index),
+                            resident_bytes=index.nbytes,
+                            load_ms=round((time.perf_counter() - started) * 1000, 2),
+                        )
+                        self._evict(keep=name)
+                    index.last_access = time.time()
+                    return index
+        index.last_access = time.time()
+        index.refresh()
+        return index
+
+    def _evict(self, keep: str) -> None:
+        """上限を超えている間、LRU 順にテナントを退避（呼び出し側で _lock を保持）"""
+        while len(self._indexes) > 1:
+            over_count = 0 < self.max_tenants < len(self._indexes)
+            over_bytes = (
+                0
+                < self.max_resident_bytes
+                < sum(idx.nbytes for idx in self._indexes.values())
+            )
+            if not (over_count or over_bytes):
+                break
+            name = next(iter(self._indexes))
+            if name == keep:
+                self._indexes.move_to_end(name)
+                name = next(iter(self._indexes))
+            evicted = self._indexes.pop(name)
+            self._record(
+                "evict",
+                name,
+                reason="count" if over_count else "memory",
+                resident_bytes=evicted.nbytes,
+                idle_seconds=round(time.time() - evicted.last_access, 1),
+            )
+
+    def is_resident(self, tenant: str | None) -> bool:
+        with self._lock:
+            return tenant_dirname(tenant) in self._indexes
+
+    def warm(self, tenant: str | None) -> None:
+        """テナントのインデックスを読み込み、ページをキャッシュに載せる"""
+        for seg in self._index(tenant).snapshot.segments:
+            seg.touch()
+
+    def tenants_on_disk(self) -> list[str]:
+        """インデックスが保存されているテナント名の一覧（未読み込みを含む）"""
+        if not self.root.exists():
+            return []
+        return sorted(
+            unquote(path.name)
+            for path in self.root.iterdir()
+            if (path / MANIFEST).exists()
+        )
+
+    def compact(self, tenant: str | None, min_segments: int) -> tuple[int, int]:
+        """テナントのセグメントを統合（未読み込みのテナントは LRU に載せずに開く）"""
+        name = tenant_dirname(tenant)
+        manifest_path = self.root / name / MANIFEST
+        if not manifest_path.exists():
+            return 0, 0
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        count = len(manifest.get("segments", []))
+        if count < max(2, min_segments):
+            return count, count
+        with self._lock:
+            index = self._indexes.get(name)
+        if index is None:
+            index = TenantFlatIndex(self.root / name, self.dtype)
+        return index.compact(min_segments)
+
+    def _snapshot(self, tenant: str | None) -> FlatSnapshot:
+        return self._index(tenant).snapshot
+
+    def add(self, tenant, ids, texts, embeddings, metadatas) -> None:
+        if not ids:
+            return
+        self._index(tenant).apply(
+            set(ids),
+            np.asarray(embeddings, dtype=np.float32),
+            list(ids),
+            list(texts),
+            list(metadatas),
+        )
+        with self._lock:
+            self._evict(keep=tenant_dirname(tenant))
+
+    def delete(self, tenant, ids) -> None:
+        if ids:
+            self._index(tenant).apply(set(ids))
+
+    def space_for(self, tenant) -> str:
+        tenant = key_tenant(tenant)
+        if tenant is not None and tenant in self.tenant_spaces:
+            return self.tenant_spaces[tenant]
+        return self.space
+
+    def search(self, tenant, query_embedding, k, where=None):
+        snap = self._snapshot(tenant)
+        n = len(snap)
+        if n == 0 or k <= 0:
+            return []
+        dists = snap.distances(
+            np.asarray(query_embedding, dtype=np.float32), self.space_for(tenant)
+        )
+        mask = snap.mask(where)
+        if mask is not None:
+            dists[~mask] = np.inf
+            n = int(mask.sum())
+        k = min(k, n)
+        if k == 0:
+            return []
+        if k < len(dists):
+            top = np.argpartition(dists, k - 1)[:k]
+        else:
+            top = np.arange(len(dists))
+        top = top[np.argsort(dists[top], kind="stable")]
+        return [
+            (
+                Document(
+                    page_content=snap.documents[i], metadata=dict(snap.metadatas[i])
+                ),
+                float(dists[i]),
+            )
+            for i in top
+        ]
+
+    def get(self, tenant, where=None, ids=None, include_documents=True):
+        snap = self._snapshot(tenant)
+        if ids is not None:
+            rows = [snap.positions[cid] for cid in ids if cid in snap.positions]
+        else:
+            rows = range(len(snap))
+        mask = snap.mask(where)
+        if mask is not None:
+            rows = [i for i in rows if mask[i]]
+        return {
+            "ids": [snap.ids[i] for i in rows],
+            "documents": (
+                [snap.documents[i] for i in rows] if include_documents else []
+            ),
+            "metadatas": [snap.metadatas[i] for i in rows],
+        }
+
+    def get_embeddings(self, tenant, ids):
+        snap = self._snapshot(tenant)
+        return {
+            cid: snap.vector(snap.positions[cid]).tolist()
+            for cid in ids
+            if cid in snap.positions
+        }
+
+    def tenants(self) -> list[str]:
+        return sorted(
+            {key_tenant(key) for key in self.tenants_on_disk()} - {NO_TENANT, None}
+        )
+
+    def count(self, tenant=None) -> int:
+        if tenant is not None:
+            return len(self._snapshot(tenant))
+        if not self.root.exists():
+            return 0
+        total = 0
+        for path in self.root.iterdir():
+            if (path / MANIFEST).exists():
+                manifest = json.loads((path / MANIFEST).read_text(encoding="utf-8"))
+                total += int(manifest.get("rows", 0))
+        return total
+
+    def drop(self, tenant: str | None) -> None:
+        """テナント（格納キー）のインデックスを削除（再インデックス後の旧世代の破棄）"""
+        name = tenant_dirname(tenant)
+        with self._lock:
+            self._indexes.pop(name, None)
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def info(self) -> dict[str, Any]:
+        with self._lock:
+            loaded = list(self._indexes.items())
+            events = list(self.events)
+        now = time.time()
+        return {
+            "backend": self.name,
+            "directory": str(self.root),
+            "dtype": self.dtype,
+            "space": self.space,
+            "max_tenants": self.max_tenants,
+            "max_resident_bytes": self.max_resident_bytes,
+            "loaded_tenants": len(loaded),
+            "vector_document_count": self.count(),
+            "resident_bytes": sum(idx.nbytes for _, idx in loaded),
+            # LRU 順（先頭ほど次に退避される）
+            "tenants": [
+                {
+                    "tenant": unquote(name),
+                    "rows": len(idx),
+                    "segments": len(idx.snapshot.segments),
+                    "resident_bytes": idx.nbytes,
+                    "idle_seconds": round(now - idx.last_access, 1),
+                }
+                for name, idx in loaded
+            ],
+            "events": events,
+        }
@@ -0,0 +1,113 @@
+"""
+インデックス台帳モジュール
+テナントごとに、現在検索に使っているインデックスの埋め込みモデル・次元数・世代を記録する
+
+- 台帳に無いテナントは基準（baseline: 初回起動時の設定）のインデックスを使う
+- 再インデックスは新しい世代のインデックスを裏で作り、完成後に台帳を書き換えて切り替える
+- 台帳は JSON ファイルで、書き込みはプロセス間ロック下で os.replace により差し替える。
+  各ワーカーはファイルの変化を検知して読み直すため、切り替えは全ワーカーに反映される
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """インデックスの埋め込み条件と世代（0 は従来の格納場所）"""
+
+    model: str
+    dimensions: int | None = None
+    generation: int = 0
+
+    def same_embedding(self, other: "IndexSpec") -> bool:
+        return self.model == other.model and self.dimensions == other.dimensions
+
+
+class IndexRegistry:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._data: dict[str, Any] = {}
+        self._stamp: tuple[int, int, int] | None = None
+        self._lock = threading.Lock()
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> dict[str, Any]:
+        stamp = self._stat()
+        with self._lock:
+            if stamp != self._stamp:
+                if stamp is None:
+                    self._data = {}
+                else:
+                    self._data = json.loads(self.path.read_text(encoding="utf-8"))
+                self._stamp = stamp
+            return self._data
+
+    @contextmanager
+    def _update(self) -> Iterator[dict[str, Any]]:
+        """ロック下で最新の台帳を読み、変更を原子的に書き戻す"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + ".lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = json.loads(json.dumps(self._load()))
+            yield data
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(
+                json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            os.replace(tmp, self.path)
+        self._load()
+
+    def baseline(self, default: IndexSpec) -> IndexSpec:
+        data = self._load().get("baseline")
+        return IndexSpec(**data) if data else default
+
+    def ensure_baseline(self, spec: IndexSpec) -> IndexSpec:
+        """基準が未記録なら記録する（既存データの埋め込み条件を固定するため）"""
+        if self._load().get("baseline"):
+            return self.baseline(spec)
+        with self._update() as data:
+            data.setdefault("baseline", asdict(spec))
+        return self.baseline(spec)
+
+    def spec_for(self, tenant: str | None, default: IndexSpec) -> IndexSpec:
+        entry = self._load().get("tenants", {}).get(tenant or "")
+        return IndexSpec(**entry) if entry else self.baseline(default)
+
+    def set_spec(self, tenant: str | None, spec: IndexSpec) -> None:
+        with self._update() as data:
+            data.setdefault("tenants", {})[tenant or ""] = asdict(spec)
+
+    def switch(self, specs: dict[str, IndexSpec], baseline: IndexSpec) -> None:
+        """複数テナントの記録と基準を1回の書き込みで切り替える（モデル移行の切り替え）"""
+        with self._update() as data:
+            tenants = data.setdefault("tenants", {})
+            for tenant, spec in specs.items():
+                tenants[tenant or ""] = asdict(spec)
+            data["baseline"] = asdict(baseline)
+
+    def reset(self, baseline: IndexSpec) -> None:
+        """全テナントの記録を消し、基準を置き換える（ベクトルストアのリセット時）"""
+        with self._update() as data:
+            data.clear()
+            data["baseline"] = asdict(baseline)
+
+    def tenants(self) -> dict[str, IndexSpec]:
+        return {
+            tenant: IndexSpec(**entry)
+            for tenant, entry in self._load().get("tenants", {}).items()
+        }
@@ -0,0 +1,171 @@
+"""
+書き込みコアレッシングモジュール
+コレクション（Chroma は1つ、flat はテナントごと）ごとに単一の書き込みタスクを持ち、
+キューに溜まった追加・削除要求を隣接する同種の操作ごとにまとめて実行する
+
+- 同じコレクションへの書き込みは常に1タスクが順に行うため、同時アップロードが競合しない
+- 小さなアップロードが多数重なっても、まとめて1回の add / delete（flat なら1回の公開）になる
+- 呼び出し側は自分の要求を含むまとまりが永続化された時点で完了する
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+from .vector_backend import VectorBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WriteRequest:
+    kind: str  # "add" | "delete"
+    ids: list[str]
+    texts: list[str] = field(default_factory=list)
+    embeddings: list[list[float]] = field(default_factory=list)
+    metadatas: list[dict[str, Any]] = field(default_factory=list)
+    future: asyncio.Future | None = None
+
+
+def coalesce(requests: list[WriteRequest]) -> list[list[WriteRequest]]:
+    """到着順を保ったまま、隣接する同種の要求をまとめる
+
+    追加と削除の順序が入れ替わると結果が変わるため、異なる種類をまたいで併合しない。
+    """
+    groups: list[list[WriteRequest]] = []
+    for req in requests:
+        if groups and groups[-1][0].kind == req.kind:
+            groups[-1].append(req)
+        else:
+            groups.append([req])
+    return groups
+
+
+class CollectionWriter:
+    """1コレクション分の書き込みキューと書き込みタスク"""
+
+    def __init__(
+        self,
+        backend: VectorBackend,
+        tenant: str | None,
+        max_batch_rows: int = 2000,
+        linger_seconds: float = 0.005,
+    ):
+        self.backend = backend
+        self.tenant = tenant
+        self.max_batch_rows = max(1, max_batch_rows)
+        self.linger_seconds = max(0.0, linger_seconds)
+        self.flushes = 0
+        self.requests = 0
+        self._queue: asyncio.Queue[WriteRequest] | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_started(self) -> asyncio.Queue[WriteRequest]:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return self._queue
+
+    async def add(
+        self,
+        ids: list[str],
+        texts: list[str],
+        embeddings: list[list[float]],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        await self._submit(WriteRequest("add", ids, texts, embeddings, metadatas))
+
+    async def delete(self, ids: list[str]) -> None:
+        await self._submit(WriteRequest("delete", ids))
+
+    async def _submit(self, req: WriteRequest) -> None:
+        queue = self._ensure_started()
+        req.future = asyncio.get_running_loop().create_future()
+        queue.put_nowait(req)
+        await req.future
+
+    async def _collect(self, queue: asyncio.Queue[WriteRequest]) -> list[WriteRequest]:
+        """先頭の要求に続けて、上限行数までキュー上の要求を取り出す"""
+        batch = [await queue.get()]
+        rows = len(batch[0].ids)
+        if self.linger_seconds > 0 and queue.empty():
+            # 同時に届きかけている要求を拾うため、ごく短時間だけ待つ
+            await asyncio.sleep(self.linger_seconds)
+        while rows < self.max_batch_rows and not queue.empty():
+            req = queue.get_nowait()
+            batch.append(req)
+            rows += len(req.ids)
+        return batch
+
+    def _apply(self, group: list[WriteRequest]) -> None:
+        if group[0].kind == "add":
+            self.backend.add(
+                self.tenant,
+                [i for r in group for i in r.ids],
+                [t for r in group for t in r.texts],
+                [e for r in group for e in r.embeddings],
+                [m for r in group for m in r.metadatas],
+            )
+        else:
+            self.backend.delete(self.tenant, [i for r in group for i in r.ids])
+
+    async def _run(self) -> None:
+        """キューが空になるまで書き込み、空になったら終了する（次の要求で再開）"""
+        queue = self._queue
+        assert queue is not None
+        batch: list[WriteRequest] = []
+        try:
+            while not queue.empty():
+                batch = await self._collect(queue)
+                self.requests += len(batch)
+                for group in coalesce(batch):
+                    try:
+                        # バックエンドの書き込みはブロッキングのためスレッドで実行
+                        await asyncio.to_thread(self._apply, group)
+                    except Exception as e:
+                        logger.warning(f"ベクトルストアへの書き込みに失敗しました: {e}")
+                        for req in group:
+                            if req.future is not None and not req.future.done():
+                                req.future.set_exception(e)
+                        continue
+                    finally:
+                        self.flushes += 1
+                    for req in group:
+                        if req.future is not None and not req.future.done():
+                            req.future.set_result(None)
+        finally:
+            # 終了時の取り消しなどで途中で抜けた場合、待っている呼び出し側を解放する
+            # （実行中の書き込みはスレッド側で完了し得るが、結果は保証しない）
+            self._fail_pending(batch, queue)
+
+    def _fail_pending(
+        self, batch: list[WriteRequest], queue: asyncio.Queue[WriteRequest]
+    ) -> None:
+        pending = list(batch)
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+        for req in pending:
+            if req.future is not None and not req.future.done():
+                req.future.set_exception(
+                    RuntimeError("ベクトルストアの書き込みタスクが停止しました")
+                )
+
+    async def close(self) -> None:
+        """キューに残った要求を書き終えるまで待つ"""
+        if self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "tenant": self.tenant,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "flushes": self.flushes,
+        }
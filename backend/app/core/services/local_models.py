@@ -0,0 +1,196 @@
+"""
+ローカルの代替モデルモジュール
+OpenAI API を使わずに実際の RAGEngine（検索・コンテキスト詰め込み・ベクトルストア）を
+動かすための、決定的な埋め込みと偽のチャットモデル（ベンチマーク・負荷試験用）
+
+- HashingEmbeddings: 文字 n-gram を符号付きハッシュで固定次元に写して L2 正規化する。
+  表記が近い文ほど近いベクトルになり、次元数は実モデルと同じにできる
+- FakeChatModel: 最初のトークンまでの遅延と生成速度（トークン/秒）を再現し、
+  プロンプトから決定的な回答を返す。ストリーミングにも対応する
+- ApproxEncoding: tiktoken の BPE を取得できないオフライン環境向けの概算トークナイザ
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+import time
+import zlib
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class ApproxEncoding:
+    """4文字≒1トークンで数える tiktoken 互換の概算エンコーダ（encode / decode のみ）"""
+
+    name = "approx"
+    chars_per_token = 4
+
+    def encode(self, text: str) -> list[str]:
+        step = self.chars_per_token
+        return [text[i : i + step] for i in range(0, len(text), step)]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+class HashingEmbeddings(Embeddings):
+    """文字 n-gram の特徴ハッシュによる決定的な埋め込み"""
+
+    def __init__(self, dimensions: int = 1536, ngram_range: tuple[int, int] = (2, 4)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        padded = f" {text.lower()} "
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                value = zlib.crc32(padded[i : i + n].encode("utf-8"))
+                # 最上位ビットで符号を決め、衝突による偏りを打ち消す
+                sign = 1.0 if value >> 31 else -1.0
+                vector[value % self.dimensions] += sign
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """遅延と生成速度を再現する偽のチャットモデル
+
+    回答はプロンプトの語を、プロンプトのハッシュで決まる位置から順に並べたもの。
+    """
+
+    model: str = "fake-chat"
+    max_tokens: int = 768
+    latency_seconds: float = 0.3
+    tokens_per_second: float = 60.0
+    answer_tokens: int = 200
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @staticmethod
+    def _prompt_text(messages: list[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _answer_tokens(self, prompt: str) -> list[str]:
+        words = _TOKEN_PATTERN.findall(prompt) or ["..."]
+        start = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        count = max(1, min(self.max_tokens, self.answer_tokens))
+        return [words[(start + i) % len(words)] for i in range(count)]
+
+    def _token_interval(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _metadata(self, prompt: str, tokens: list[str]) -> dict[str, Any]:
+        input_tokens = max(1, len(prompt) // 4)
+        return {
+            "response_metadata": {"model_name": self.model, "finish_reason": "stop"},
+            "usage_metadata": {
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens),
+            },
+        }
+
+    def _message(self, prompt: str, tokens: list[str]) -> AIMessage:
+        return AIMessage(content=" ".join(tokens), **self._metadata(prompt, tokens))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        tokens = self._answer_tokens(prompt)
+        time.sleep(self.latency_seconds + len(tokens) * self._token_interval())
+        return ChatResult(
+            generations=[ChatGeneration(message=self._message(prompt, tokens))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        tokens = self._answer_tokens(prompt)
+        await asyncio.sleep(self.latency_seconds + len(tokens) * self._token_interval())
+        return ChatResult(
+            generations=[ChatGeneration(message=self._message(prompt, tokens))]
+        )
+
+    def _chunk(self, token: str, first: bool) -> ChatGenerationChunk:
+        text = token if first else f" {token}"
+        return ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _final_chunk(self, prompt: str, tokens: list[str]) -> ChatGenerationChunk:
+        """モデル名と使用トークン数を載せた最後のチャンク（OpenAI のストリームと同じ形）"""
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content="", **self._metadata(prompt, tokens))
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        tokens = self._answer_tokens(prompt)
+        time.sleep(self.latency_seconds)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self._token_interval())
+            chunk = self._chunk(token, i == 0)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(prompt, tokens)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        tokens = self._answer_tokens(prompt)
+        await asyncio.sleep(self.latency_seconds)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self._token_interval())
+            chunk = self._chunk(token, i == 0)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(prompt, tokens)
@@ -0,0 +1,254 @@
+"""
+ベクトルストア保守モジュール
+アップロード時に行っていた永続化後の掃除をリクエスト経路から切り離し、
+定期実行または管理APIから、ノード単位のロック下でまとめて実行する
+
+- chroma_orphans: SQLite の segments に存在しない HNSW セグメントディレクトリの削除
+- chroma_sqlite:  適用済み WAL（embeddings_queue）の削除と ANALYZE / VACUUM
+- flat_orphans:   manifest から参照されない flat セグメント・一時ファイルの削除
+- flat_compact:   小さなセグメントが増えたテナントを1セグメントに統合
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+from ..config import settings
+from .flat_index import MANIFEST, FlatVectorBackend, segment_files
+
+if TYPE_CHECKING:
+    from .rag_engine import RAGEngine
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("chroma_orphans", "chroma_sqlite", "flat_orphans", "flat_compact")
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+LOCK_FILE = ".maintenance.lock"
+
+# 直近の実行結果（管理APIで参照）
+history: deque[dict[str, Any]] = deque(maxlen=20)
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _is_stale(path: Path, grace_seconds: float) -> bool:
+    """書き込み途中のファイルを消さないよう、一定時間更新のないものだけを対象にする"""
+    try:
+        return time.time() - path.stat().st_mtime >= grace_seconds
+    except FileNotFoundError:
+        return False
+
+
+def cleanup_chroma_orphans(persist_path: Path, grace_seconds: float) -> dict[str, Any]:
+    """SQLite に登録のないセグメントディレクトリを削除
+
+    Chroma の HNSW ディレクトリ名はコレクションIDではなくセグメントIDなので、
+    有効なIDは chroma.sqlite3 の segments テーブルから取得する。
+    """
+    db_path = persist_path / CHROMA_SQLITE_FILE
+    if not db_path.exists():
+        return {"removed": [], "freed_bytes": 0}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+    try:
+        valid = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    finally:
+        conn.close()
+
+    removed: list[str] = []
+    freed = 0
+    for path in persist_path.iterdir():
+        if not path.is_dir() or path.name in valid:
+            continue
+        try:
+            uuid.UUID(path.name)
+        except ValueError:
+            continue  # Chroma のセグメント以外には触れない
+        if not _is_stale(path, grace_seconds):
+            continue
+        freed += _dir_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    return {"removed": removed, "freed_bytes": freed}
+
+
+def optimize_chroma_sqlite(
+    chroma_client: Any, persist_path: Path, vacuum_timeout: int
+) -> dict[str, Any]:
+    """適用済みの WAL を削除し、統計更新（ANALYZE）と VACUUM を実行
+
+    プロセス内の Chroma と同じ接続プールを使い、書き込みとはビジータイムアウトで調停する。
+    """
+    from chromadb.db.impl.sqlite import SqliteDB
+
+    db_path = persist_path / CHROMA_SQLITE_FILE
+    before = db_path.stat().st_size if db_path.exists() else 0
+    sqlite_db = chroma_client._system.instance(SqliteDB)
+    collections = chroma_client.list_collections()
+    for collection in collections:
+        sqlite_db.purge_log(collection_id=collection.id)
+    with sqlite_db.tx() as cur:
+        cur.execute("ANALYZE")
+    sqlite_db.vacuum(timeout=vacuum_timeout)
+    after = db_path.stat().st_size if db_path.exists() else 0
+    return {
+        "collections": len(collections),
+        "size_before": before,
+        "size_after": after,
+    }
+
+
+def cleanup_flat_orphans(root: Path, grace_seconds: float) -> dict[str, Any]:
+    """manifest から参照されないセグメントファイルと残った一時ファイルを削除"""
+    removed = 0
+    freed = 0
+    if not root.exists():
+        return {"removed_files": 0, "freed_bytes": 0}
+    for tenant_dir in root.iterdir():
+        manifest_path = tenant_dir / MANIFEST
+        if not tenant_dir.is_dir():
+            continue
+        referenced: set[str] = set()
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            for name in manifest.get("segments", []):
+                referenced.update(segment_files(name))
+        for path in tenant_dir.iterdir():
+            orphan_segment = (
+                path.name.startswith("seg-") and path.name not in referenced
+            )
+            if not (orphan_segment or path.name.endswith(".tmp")):
+                continue
+            if not _is_stale(path, grace_seconds):
+                continue
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+    return {"removed_files": removed, "freed_bytes": freed}
+
+
+def compact_flat(backend: FlatVectorBackend, min_segments: int) -> dict[str, Any]:
+    """セグメント数が閾値以上のテナントを1セグメントに統合"""
+    compacted: dict[str, tuple[int, int]] = {}
+    for tenant in backend.tenants_on_disk():
+        before, after = backend.compact(tenant, min_segments)
+        if before != after:
+            compacted[tenant or ""] = (before, after)
+    return {"compacted": compacted}
+
+
+class NodeLock:
+    """同一ノードのワーカー間で保守・再インデックスを1つに限定するファイルロック（非ブロッキング）"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file: Any = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def run_maintenance(
+    engine: "RAGEngine", tasks: list[str] | None = None
+) -> dict[str, Any] | None:
+    """保守タスクを順に実行（ロック取得できなければ None）
+
+    各タスクの所要時間と結果を返し、直近の履歴に記録する。
+    """
+    selected = [t for t in TASKS if tasks is None or t in tasks]
+    lock = NodeLock(settings.persist_path / LOCK_FILE)
+    if not lock.acquire():
+        return None
+    grace = settings.maintenance_orphan_grace_seconds
+    embedded = engine.is_embedded and engine.chroma_client is not None
+    runners: dict[str, Callable[[], dict[str, Any]]] = {
+        "chroma_orphans": lambda: cleanup_chroma_orphans(settings.persist_path, grace),
+        "chroma_sqlite": lambda: optimize_chroma_sqlite(
+            engine.chroma_client,
+            settings.persist_path,
+            settings.maintenance_vacuum_timeout_seconds,
+        ),
+        "flat_orphans": lambda: cleanup_flat_orphans(settings.flat_index_path, grace),
+        "flat_compact": lambda: compact_flat(
+            engine.flat_backend, settings.flat_compact_min_segments
+        ),
+    }
+    started = time.perf_counter()
+    report: dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "tasks": {},
+    }
+    try:
+        for name in selected:
+            if name.startswith("chroma_") and not embedded:
+                # サーバーモードでは Chroma サーバー側がファイルを管理する
+                report["tasks"][name] = {"skipped": "chroma is not embedded"}
+                continue
+            task_started = time.perf_counter()
+            try:
+                result = runners[name]()
+            except Exception as e:
+                logger.warning(f"保守タスク {name} に失敗しました: {e}")
+                result = {"error": str(e)}
+            result["duration_ms"] = round(
+                (time.perf_counter() - task_started) * 1000, 2
+            )
+            report["tasks"][name] = result
+    finally:
+        lock.release()
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    history.append(report)
+    return report
+
+
+async def run_maintenance_loop(engine: "RAGEngine") -> None:
+    """保守タスクを定期実行する（lifespan から起動）"""
+    interval = max(60, settings.maintenance_interval_seconds)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await asyncio.to_thread(run_maintenance, engine)
+            if report:
+                logger.info(
+                    f"ベクトルストアの保守を実行しました: {report['duration_ms']}ms"
+                )
+        except Exception as e:
+            logger.warning(f"ベクトルストアの保守に失敗しました: {e}")
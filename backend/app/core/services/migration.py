@@ -0,0 +1,257 @@
+"""
+埋め込みモデル移行モジュール
+EMBEDDING_MODEL（と EMBEDDING_DIMENSIONS）の変更を、全テナントの再アップロードなしで反映する
+
+1. データを持つ全テナントについて、新しいモデルの別世代（影のインデックス）を作る。
+   チャンク本文は旧インデックスから読み、埋め込みは流量制御して少しずつ計算する
+2. 作成中も検索・アップロードは旧インデックスで動き続け、その間の追加・削除は
+   差分として影のインデックスに追従させる
+3. 全テナントが揃ったら、台帳を1回の書き込みで切り替える（全テナントと基準を同時に）
+4. 猶予時間の後、切り替え直前の書き込みを取り込んでから旧インデックスを破棄する
+
+進捗は永続化ディレクトリの migration.json に保存し、どのワーカーからも参照できる。
+失敗・再起動後に同じ条件で再実行すると、作成済みの影のインデックスを引き継いで再開する
+（埋め込みキャッシュにより、計算済みのチャンクは API を呼ばない）。
+テナント未指定のチャンク（API からは作られない）は移行せず、旧条件のまま残す。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from ..config import settings
+from .embedding_cache import supports_shortening
+from .embedding_throttle import background_limiter
+from .index_registry import IndexSpec
+from .maintenance import NodeLock
+from .reindex import (
+    ReindexConflict,
+    ShadowIndex,
+    cutover_grace,
+    new_status,
+    tenant_lock,
+)
+
+if TYPE_CHECKING:
+    from .rag_engine import RAGEngine
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = ".migration.lock"
+# 実行中の進捗を migration.json に書き出す間隔（秒）
+SAVE_INTERVAL_SECONDS = 1.0
+
+_task: asyncio.Task | None = None
+_save_lock = threading.Lock()
+
+
+def load_state() -> dict[str, Any]:
+    """直近の移行の進捗（未実行なら空）"""
+    path = settings.migration_state_path
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save(state: dict[str, Any]) -> None:
+    path = settings.migration_state_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _save_lock:
+        body = json.dumps(state, ensure_ascii=False, indent=2)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(body, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class Migration:
+    """1回分のモデル移行（ロックと影のインデックスを保持する）"""
+
+    def __init__(self, engine: "RAGEngine", model: str, dimensions: int | None) -> None:
+        self.engine = engine
+        self.model = model
+        self.dimensions = dimensions
+        self.previous = load_state()
+        self.shadows: dict[str, ShadowIndex] = {}
+        # 既に移行先の条件で動いているテナント（作り直さず、現在の世代に固定する）
+        self.unchanged: dict[str, IndexSpec] = {}
+        self.locks: list[NodeLock] = []
+        self.state: dict[str, Any] = {
+            "state": "running",
+            "target": {"model": model, "dimensions": dimensions},
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "tenants": {},
+        }
+
+    def acquire(self, lock: NodeLock, message: str) -> None:
+        if not lock.acquire():
+            raise ReindexConflict(message)
+        self.locks.append(lock)
+
+    def release(self) -> None:
+        for lock in self.locks:
+            lock.release()
+        self.locks.clear()
+
+    def _resumable(self, tenant: str, target: IndexSpec) -> bool:
+        """前回の移行で同じ世代・条件の影のインデックスを作りかけていたか"""
+        previous = self.previous.get("tenants", {}).get(tenant)
+        return previous is not None and previous.get("target") == asdict(target)
+
+    def add_tenants(self, tenants: list[str]) -> list[str]:
+        """未登録のテナントの影のインデックスを用意し、追加したテナントを返す"""
+        added = []
+        for tenant in tenants:
+            if tenant in self.shadows or tenant in self.unchanged:
+                continue
+            source = self.engine.index_spec(tenant)
+            target = IndexSpec(self.model, self.dimensions, source.generation + 1)
+            if source.same_embedding(target):
+                self.unchanged[tenant] = source
+                continue
+            self.acquire(tenant_lock(tenant), f"{tenant} の再インデックスが実行中です")
+            status = new_status(tenant, source, target)
+            status["state"] = "pending"
+            self.state["tenants"][tenant] = status
+            self.shadows[tenant] = ShadowIndex(
+                self.engine, tenant, source, target, status
+            )
+            added.append(tenant)
+        return added
+
+    async def build(self, tenants: list[str]) -> None:
+        for tenant in tenants:
+            shadow = self.shadows[tenant]
+            shadow.status["state"] = "copying"
+            await shadow.prepare(resume=self._resumable(tenant, shadow.target))
+            await shadow.converge()
+            shadow.status["state"] = "ready"
+
+    async def run(self) -> None:
+        engine, state = self.engine, self.state
+        old_baseline = engine.index_spec(None)
+        # 作成中に初めてアップロードしたテナントも取りこぼさないよう、増えなくなるまで繰り返す
+        pending = list(self.shadows)
+        while pending:
+            await self.build(pending)
+            tenants = await asyncio.to_thread(engine.stored_tenants)
+            pending = self.add_tenants(tenants)
+
+        # 切り替え直前に、作成中の追加・削除を取り込む
+        state["state"] = "catching_up"
+        for shadow in self.shadows.values():
+            await shadow.converge()
+
+        generation = max(
+            [old_baseline.generation + 1]
+            + [shadow.target.generation for shadow in self.shadows.values()]
+        )
+        specs = dict(self.unchanged)
+        specs.update((tenant, shadow.target) for tenant, shadow in self.shadows.items())
+        # テナント未指定のチャンクは移行しないため、旧条件に固定しておく
+        specs.setdefault("", engine.index_spec(None))
+        engine.index_registry.switch(
+            specs, IndexSpec(self.model, self.dimensions, generation)
+        )
+        state["state"] = "switched"
+        state["switched_at"] = datetime.now().isoformat(timespec="seconds")
+        for shadow in self.shadows.values():
+            shadow.status["state"] = "switched"
+        await asyncio.to_thread(_save, state)
+
+        await asyncio.sleep(cutover_grace())
+        for shadow in self.shadows.values():
+            await shadow.retire()
+            shadow.status["state"] = "completed"
+
+        # 最後の列挙から切り替えまでの間に初めてアップロードしたテナントは、
+        # 旧基準の場所に書かれているため新基準の場所へ移す（コピーのみ・削除はしない）
+        new_baseline = engine.index_registry.baseline(old_baseline)
+        for tenant in await asyncio.to_thread(engine.stored_tenants):
+            if tenant in specs or tenant in engine.index_registry.tenants():
+                continue
+            status = new_status(tenant, old_baseline, new_baseline)
+            straggler = ShadowIndex(engine, tenant, old_baseline, new_baseline, status)
+            await straggler.converge()
+            await straggler.retire()
+            status["state"] = "completed"
+            state["tenants"][tenant] = status
+
+
+async def _save_periodically(state: dict[str, Any]) -> None:
+    while True:
+        await asyncio.sleep(SAVE_INTERVAL_SECONDS)
+        await asyncio.to_thread(_save, state)
+
+
+async def start_migration(
+    engine: "RAGEngine", model: str | None = None, dimensions: int | None = None
+) -> dict[str, Any]:
+    """全テナントの埋め込みモデル移行をバックグラウンドで開始
+
+    model / dimensions 未指定の場合は現在の設定値（EMBEDDING_MODEL / EMBEDDING_DIMENSIONS）。
+
+    Raises:
+        ValueError: 次元数に非対応のモデルか、既に移行先の条件で動いている場合
+        ReindexConflict: 移行や対象テナントの再インデックスが実行中の場合
+    """
+    global _task
+    model = model or settings.embedding_model
+    if dimensions is None:
+        dimensions = settings.embedding_dimensions
+    if dimensions is not None and not supports_shortening(model):
+        raise ValueError(f"{model} は次元数の指定に対応していません")
+    if _task is not None and not _task.done():
+        raise ReindexConflict("埋め込みモデルの移行は実行中です")
+    target = IndexSpec(model, dimensions)
+    tenants = await asyncio.to_thread(engine.stored_tenants)
+    if engine.index_spec(None).same_embedding(target) and all(
+        engine.index_spec(tenant).same_embedding(target) for tenant in tenants
+    ):
+        raise ValueError("全テナントが既に指定の埋め込み条件です")
+
+    migration = Migration(engine, model, dimensions)
+    migration.acquire(
+        NodeLock(settings.persist_path / LOCK_FILE),
+        "埋め込みモデルの移行は他のワーカーで実行中です",
+    )
+    try:
+        migration.add_tenants(tenants)
+    except ReindexConflict:
+        migration.release()
+        raise
+    await asyncio.to_thread(_save, migration.state)
+    _task = asyncio.create_task(_run(migration))
+    return migration.state
+
+
+async def _run(migration: Migration) -> None:
+    state = migration.state
+    saver = asyncio.create_task(_save_periodically(state))
+    limiter = background_limiter()
+    waited_before = limiter.waited_seconds
+    try:
+        await migration.run()
+        state["state"] = "completed"
+    except Exception as e:
+        logger.warning(f"埋め込みモデルの移行に失敗しました: {e}")
+        state["state"] = "failed"
+        state["error"] = str(e)
+    finally:
+        saver.cancel()
+        migration.release()
+        state["throttled_seconds"] = round(limiter.waited_seconds - waited_before, 2)
+        state["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        await asyncio.to_thread(_save, state)
+
+
+async def wait() -> None:
+    """実行中の移行の完了を待つ（テスト・終了処理用）"""
+    if _task is not None:
+        await asyncio.shield(_task)
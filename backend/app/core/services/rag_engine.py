@@ -4,25 +4,88 @@ RAGシステムの中核となる
 ベクトルストア管理、検索、回答生成機能を提供する
 """
 
+import asyncio
 import gc
-import shutil
-from typing import Any
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable
 from datetime import datetime
 import uuid
+from dataclasses import asdict
 
 from chromadb.config import Settings as ChromaSettings
 import chromadb
+import httpx
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from pydantic import SecretStr
 
 from ..config import settings
+from ..logs import sampled
+from ..memory import SizeCounter, table
+from ..metrics import record_cache, stage_timer
+from .embedding_cache import CachedEmbeddings, EmbeddingCache
+from .embedding_throttle import (
+    EmbeddingRateLimiter,
+    ThrottledEmbeddings,
+    background_limiter,
+)
+from .flat_index import FlatVectorBackend, location_key
+from .index_registry import IndexRegistry, IndexSpec
+from .ingest_writer import CollectionWriter
+from .local_models import ApproxEncoding, FakeChatModel, HashingEmbeddings
+from .vector_backend import ChromaVectorBackend, VectorBackend
 import tiktoken
 
+logger = logging.getLogger(__name__)
+
+# モデル名 → 読み込み済みのトークナイザ
+_encodings: dict[str, Any] = {}
+
+
+def count_tokens(model: str, text: str) -> int:
+    """モデルのトークナイザで数えたトークン数（読み込んだトークナイザは使い回す）"""
+    return len(_encoding_for(model).encode(text or ""))
+
+
+def _encoding_for(model: str) -> Any:
+    """モデルのトークナイザ
+
+    BPE を取得できない（オフラインの）環境では文字数による概算で代用する。
+    偽のチャットモデル使用時は概算も保持し、リクエストごとに取得を再試行しない。
+    """
+    enc = _encodings.get(model)
+    if enc is not None:
+        return enc
+    try:
+        enc = tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            enc = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            logger.warning("トークナイザを取得できないため、文字数で概算します")
+            enc = ApproxEncoding()
+            if settings.chat_provider != "fake":
+                return enc
+    _encodings[model] = enc
+    return enc
+
+
+def _discard(tasks: list[asyncio.Future]) -> None:
+    """未完了のタスクを取り消す（完了済みの使わなかった例外は取得済みにして警告を出さない）"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
 
 class RAGEngine:
     """RAGエンジンクラス
@@ -110,95 +173,495 @@ class RAGEngine:
         )
 
         self.embeddings: OpenAIEmbeddings | None = None
-        self.llm: ChatOpenAI | None = None
+        self.llm: BaseChatModel | None = None
         self.vectorstore: Chroma | None = None
         self._chroma_client: Any | None = None
+        # テナントごとに選択されるベクトルバックエンド（埋め込みは本クラスで計算）
+        self._chroma_backend: ChromaVectorBackend | None = None
+        # 専用コレクション（HNSW 上書きテナント・再インデックス後の世代）
+        self._collection_backends: dict[str, ChromaVectorBackend] = {}
+        self._flat_backend: FlatVectorBackend | None = None
+        # テナント別インデックスのバックグラウンド読み込み（初回リクエスト時に開始）
+        self._warmups: dict[str | None, asyncio.Task] = {}
+        # コレクションごとの書き込みタスク（同時アップロードをまとめて書き込む）
+        self._writers: dict[tuple[str, str], CollectionWriter] = {}
+        # テナントごとのインデックス（埋め込みモデル・次元数・世代）の台帳
+        self.index_registry = IndexRegistry(settings.index_registry_path)
+        self._embedding_cache: EmbeddingCache | None = None
+        # self.embeddings の埋め込み条件と、異なる条件のテナント用の Embeddings
+        self._embeddings_key: tuple[str, int | None] | None = None
+        self._embedders: dict[tuple[str, int | None], Any] = {}
         self._ensure_directories()
-        self._llm_cache: dict[tuple[str, float, int], ChatOpenAI] = {}
+        # プロンプトはテンプレート固定のため一度だけ構築する
+        self._prompt = PromptTemplate.from_template(self.RAG_PROMPT_TEMPLATE)
+        # (model, 温度バケット, max_tokens) ごとの LLM と構築済みチェーン（LRU）
+        self._llm_cache: OrderedDict[tuple[str, float, int], BaseChatModel] = (
+            OrderedDict()
+        )
+        self._chain_cache: OrderedDict[tuple[str, float, int], Runnable] = OrderedDict()
+        # 全 ChatOpenAI / OpenAIEmbeddings で共有する keep-alive 付き HTTP クライアント
+        self._http_client: httpx.Client | None = None
+        self._http_async_client: httpx.AsyncClient | None = None
+
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.llm_http_max_connections,
+            max_keepalive_connections=settings.llm_http_max_keepalive,
+            keepalive_expiry=settings.llm_http_keepalive_expiry,
+        )
 
-    def _get_llm(
+    def _shared_http_clients(self) -> tuple[httpx.Client, httpx.AsyncClient]:
+        """OpenAI 呼び出しで共有する HTTP クライアント（接続プール）を取得"""
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=self._http_limits(), timeout=settings.llm_timeout_seconds
+            )
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(
+                limits=self._http_limits(), timeout=settings.llm_timeout_seconds
+            )
+        return self._http_client, self._http_async_client
+
+    def _llm_key(
         self,
         model: str | None,
         temperature: float | None,
-        max_tokens: int | None = None,
-    ) -> tuple[ChatOpenAI, str]:
-        """(model, temperature)ごとにLLMをキャッシュして取得"""
+        max_tokens: int | None,
+    ) -> tuple[str, float, int]:
+        """LLMキャッシュのキー（温度は設定の刻み幅に丸めてバケット化）"""
         used_model = model or settings.default_model
         used_temp = (
             temperature if temperature is not None else settings.default_temperature
         )
+        step = settings.llm_temperature_step
+        if step > 0:
+            used_temp = round(round(used_temp / step) * step, 4)
         used_max = (
             int(max_tokens)
             if max_tokens is not None
             else int(settings.default_max_output_tokens)
         )
-        key = (used_model, used_temp, used_max)
-        if key not in self._llm_cache:
-            api_key = (
-                SecretStr(settings.openai_api_key)
-                if settings.openai_api_key is not None
-                else None
+        return (used_model, used_temp, used_max)
+
+    def _create_llm(self, model: str, temperature: float, max_tokens: int) -> Any:
+        if settings.chat_provider == "fake":
+            return FakeChatModel(
+                model=model,
+                max_tokens=max_tokens,
+                latency_seconds=settings.fake_chat_latency_ms / 1000,
+                tokens_per_second=settings.fake_chat_tokens_per_second,
+                answer_tokens=settings.fake_chat_answer_tokens,
             )
-            self._llm_cache[key] = ChatOpenAI(
-                model=used_model,
-                temperature=used_temp,
-                api_key=api_key,
-                timeout=60,
-                max_tokens=used_max,
-            )
-        return self._llm_cache[key], used_model
+        api_key = (
+            SecretStr(settings.openai_api_key)
+            if settings.openai_api_key is not None
+            else None
+        )
+        http_client, http_async_client = self._shared_http_clients()
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=api_key,
+            timeout=settings.llm_timeout_seconds,
+            max_tokens=max_tokens,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+
+    def _get_llm(
+        self,
+        model: str | None,
+        temperature: float | None,
+        max_tokens: int | None = None,
+    ) -> tuple[BaseChatModel, str]:
+        """(model, 温度バケット, max_tokens)ごとにLLMをキャッシュして取得"""
+        key = self._llm_key(model, temperature, max_tokens)
+        llm = self._llm_cache.get(key)
+        if llm is None:
+            record_cache("llm", misses=1)
+            llm = self._create_llm(*key)
+            self._llm_cache[key] = llm
+            while len(self._llm_cache) > max(1, settings.llm_cache_size):
+                evicted, _ = self._llm_cache.popitem(last=False)
+                self._chain_cache.pop(evicted, None)
+        else:
+            record_cache("llm", hits=1)
+            self._llm_cache.move_to_end(key)
+        return llm, key[0]
+
+    def _get_chain(
+        self,
+        model: str | None,
+        temperature: float | None,
+        max_tokens: int | None = None,
+    ) -> tuple[Runnable, str]:
+        """構築済みの RAG チェーン（prompt | llm）を取得"""
+        key = self._llm_key(model, temperature, max_tokens)
+        llm, used_model = self._get_llm(model, temperature, max_tokens)
+        chain = self._chain_cache.get(key)
+        if chain is None:
+            chain = self._prompt | llm
+            self._chain_cache[key] = chain
+        return chain, used_model
+
+    async def close(self) -> None:
+        """書き込みキューを書き切ってから、共有 HTTP クライアントを閉じる"""
+        for writer in list(self._writers.values()):
+            await writer.close()
+        self._writers.clear()
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
 
     def _ensure_directories(self) -> None:
         settings.ensure_directories()
 
-    async def initialize(self) -> None:
-        """RAGエンジンの初期化
-        OpenAIクライアントとLLMを初期化
-        非同期で初期化することで、起動時の応答性を向上させる
+    def _create_embeddings(
+        self,
+        model: str | None = None,
+        dimensions: int | None = None,
+        limiter: EmbeddingRateLimiter | None = None,
+    ) -> Any:
+        """埋め込みモデルを作成（キャッシュ有効時は埋め込みキャッシュ経由）
+
+        limiter を渡すと API 呼び出し（キャッシュに無いものだけ）を流量制御する。
+        ローカル埋め込みは計算が安くキャッシュのキー（モデル名）と混ざるため、キャッシュしない。
         """
-        try:
-            api_key: SecretStr | None = (
-                SecretStr(settings.openai_api_key)
-                if settings.openai_api_key is not None
-                else None
+        if settings.embedding_provider == "local":
+            return HashingEmbeddings(dimensions or settings.local_embedding_dimensions)
+        model = model or settings.embedding_model
+        api_key: SecretStr | None = (
+            SecretStr(settings.openai_api_key)
+            if settings.openai_api_key is not None
+            else None
+        )
+        http_client, http_async_client = self._shared_http_clients()
+        embeddings = OpenAIEmbeddings(
+            model=model,
+            dimensions=dimensions,
+            api_key=api_key,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+        if limiter is not None:
+            embeddings = ThrottledEmbeddings(embeddings, limiter)
+        if not settings.embedding_cache_enabled:
+            return embeddings
+        return CachedEmbeddings(embeddings, self.embedding_cache, model, dimensions)
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        if self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache(settings.embedding_cache_path)
+        return self._embedding_cache
+
+    def embeddings_for(self, spec: IndexSpec) -> Any:
+        """インデックスの埋め込み条件に合う Embeddings
+
+        検索クエリは格納済みベクトルと同じモデル・次元数で埋め込む必要があるため、
+        再インデックス前のテナントは旧条件、切り替え後は新条件の Embeddings を使う。
+        """
+        key = (spec.model, spec.dimensions)
+        default_key = self._embeddings_key
+        if default_key is None:
+            baseline = self.index_registry.baseline(
+                IndexSpec(settings.embedding_model, settings.embedding_dimensions)
             )
+            default_key = (baseline.model, baseline.dimensions)
+        if self.embeddings is not None and key == default_key:
+            return self.embeddings
+        embedder = self._embedders.get(key)
+        if embedder is None:
+            embedder = self._create_embeddings(spec.model, spec.dimensions)
+            self._embedders[key] = embedder
+        return embedder
+
+    def background_embeddings(self, spec: IndexSpec) -> Any:
+        """再インデックス・移行用の Embeddings（API 呼び出しを流量制御する）"""
+        return self._create_embeddings(
+            spec.model, spec.dimensions, limiter=background_limiter()
+        )
 
-            self.embeddings = OpenAIEmbeddings(
-                model=settings.embedding_model,
-                api_key=api_key,
-            )
+    @property
+    def is_embedded(self) -> bool:
+        """Chroma をプロセス内（埋め込み永続化）で使っているか"""
+        return settings.chroma_mode != "http"
 
-            self.llm = ChatOpenAI(
-                model=settings.default_model,
-                temperature=settings.default_temperature,
-                api_key=api_key,
-                max_tokens=settings.default_max_output_tokens,
-            )
-            # ChromaDB (v0.5.x) の初期化: 既定テナント/DB を用意し、クライアントを確立
+    def _connect_embedded_chroma(self) -> Any | None:
+        """ChromaDB (v0.5.x) の埋め込みクライアント: 既定テナント/DB を用意して確立"""
+        try:
+            admin = chromadb.AdminClient(self.chroma_settings)
             try:
-                admin = chromadb.AdminClient(self.chroma_settings)
-                try:
-                    admin.create_tenant(name="default_tenant")
-                except Exception:
-                    pass
-                try:
-                    admin.create_database(
-                        name="default_database", tenant="default_tenant"
-                    )
-                except Exception:
-                    pass
+                admin.create_tenant(name="default_tenant")
             except Exception:
-                # AdminClient が失敗しても後続で Client が初期化できる可能性があるため続行
                 pass
-
             try:
-                self._chroma_client = chromadb.Client(
-                    self.chroma_settings,
-                    tenant="default_tenant",
-                    database="default_database",
-                )
+                admin.create_database(name="default_database", tenant="default_tenant")
             except Exception:
-                self._chroma_client = None
+                pass
+        except Exception:
+            # AdminClient が失敗しても後続で Client が初期化できる可能性があるため続行
+            pass
+
+        try:
+            return chromadb.Client(
+                self.chroma_settings,
+                tenant="default_tenant",
+                database="default_database",
+            )
+        except Exception:
+            return None
+
+    def _connect_http_chroma(self) -> Any:
+        """Chroma サーバーに接続（複数ワーカーで1つのインデックスを共有）
+
+        クライアントは内部で httpx の接続プール（keep-alive）を持つため、
+        ワーカーごとに1つだけ生成して全リクエストで使い回す。
+        """
+        headers: dict[str, str] = {}
+        if settings.chroma_auth_token:
+            headers["Authorization"] = f"Bearer {settings.chroma_auth_token}"
+        return chromadb.HttpClient(
+            host=settings.chroma_host,
+            port=settings.chroma_port,
+            ssl=settings.chroma_ssl,
+            headers=headers,
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+
+    def _get_flat_backend(self) -> FlatVectorBackend:
+        if self._flat_backend is None:
+            self._flat_backend = FlatVectorBackend(
+                settings.flat_index_path,
+                settings.flat_index_dtype,
+                max_tenants=settings.flat_index_max_tenants,
+                max_resident_bytes=int(settings.flat_index_max_resident_mb * 2**20),
+                space=settings.hnsw_space,
+                tenant_spaces={
+                    tenant: params["space"]
+                    for tenant, params in settings.hnsw_tenants_map.items()
+                    if "space" in params
+                },
+            )
+        return self._flat_backend
+
+    @property
+    def chroma_client(self) -> Any | None:
+        return self._chroma_client
+
+    @property
+    def flat_backend(self) -> FlatVectorBackend:
+        return self._get_flat_backend()
+
+    def prefetch(self, tenant: str | None) -> asyncio.Task | None:
+        """テナントのインデックスが未読み込みならバックグラウンドで読み込みを開始
+
+        リクエスト受付直後に呼ぶことで、レート制限・予算チェックやクエリ埋め込みと
+        インデックスの読み込みを重ねる。読み込み済み・Chroma のテナントでは何もしない。
+        """
+        if settings.vector_backend_for(tenant) != "flat":
+            return None
+        key = location_key(tenant, self.index_spec(tenant).generation)
+        task = self._warmups.get(key)
+        if task is not None:
+            return task
+        backend = self._get_flat_backend()
+        if backend.is_resident(key):
+            return None
+        task = asyncio.create_task(asyncio.to_thread(backend.warm, key))
+        self._warmups[key] = task
+        task.add_done_callback(lambda t: self._finish_warmup(key, t))
+        return task
+
+    def _finish_warmup(self, key: str | None, task: asyncio.Task) -> None:
+        self._warmups.pop(key, None)
+        # 投げっぱなしの先読みが失敗しても未回収例外の警告にしない（利用側で再度読み込む）
+        if not task.cancelled():
+            task.exception()
+
+    async def _ready_backend(
+        self, tenant: str | None, spec: IndexSpec | None = None
+    ) -> tuple[VectorBackend, str | None]:
+        """バックエンドを取得し、未読み込みのインデックスはスレッドで読み込んでから返す
+
+        読み込みをイベントループ上で行わないため、コールドなテナントの初回リクエストが
+        他のリクエストを止めない。
+        """
+        backend, key = self._route(tenant, spec)
+        if spec is None or spec == self.index_spec(tenant):
+            task = self.prefetch(tenant)
+            if task is not None:
+                await task
+        return backend, key
+
+    def index_spec(self, tenant: str | None) -> IndexSpec:
+        """テナントが現在検索に使っているインデックスの埋め込み条件と世代"""
+        return self.index_registry.spec_for(
+            tenant, IndexSpec(settings.embedding_model, settings.embedding_dimensions)
+        )
+
+    def _route(
+        self, tenant: str | None, spec: IndexSpec | None = None
+    ) -> tuple[VectorBackend, str | None]:
+        """テナントのインデックス（spec 省略時は現在の世代）と、バックエンドに渡すキー
+
+        flat は世代ごとに別ディレクトリ（キーは格納キー）、Chroma は世代ごとに
+        別コレクション（キーはテナント名で、tenant メタデータで絞り込む）。
+
+        Raises:
+            RuntimeError: Chroma バックエンドが未初期化の場合
+        """
+        spec = spec or self.index_spec(tenant)
+        if settings.vector_backend_for(tenant) == "flat":
+            return self._get_flat_backend(), location_key(tenant, spec.generation)
+        if self.vectorstore is None:
+            raise RuntimeError("ベクトルストアが初期化されていません")
+        name = self._collection_name(tenant, spec.generation)
+        if name is not None:
+            return self._collection_backend(name, tenant), tenant
+        collection = self.vectorstore._collection
+        if (
+            self._chroma_backend is None
+            or self._chroma_backend.collection is not collection
+        ):
+            self._chroma_backend = ChromaVectorBackend(collection)
+            self._check_hnsw_params(self._chroma_backend, None)
+        return self._chroma_backend, tenant
+
+    @staticmethod
+    def _tenant_collection_name(tenant: str | None) -> str:
+        """テナント専用コレクション名（Chroma の命名規則に合わせて英数字化）"""
+        tenant = tenant if tenant is not None else "default"
+        prefix = settings.embed_collection_prefix or "tenant-"
+        slug = re.sub(r"[^A-Za-z0-9_-]", "-", tenant)[:32]
+        digest = hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:8]
+        return f"{prefix}{slug}-{digest}"
+
+    def _collection_name(self, tenant: str | None, generation: int) -> str | None:
+        """テナント・世代の Chroma コレクション名（共有コレクションなら None）
+
+        HNSW パラメータを上書きしたテナントと、再インデックス後の世代は専用コレクション。
+        """
+        dedicated = tenant is not None and tenant in settings.hnsw_tenants_map
+        if generation <= 0 and not dedicated:
+            return None
+        name = self._tenant_collection_name(tenant)
+        return name if generation <= 0 else f"{name}-g{generation}"
+
+    def _collection_backend(self, name: str, tenant: str | None) -> ChromaVectorBackend:
+        """専用コレクション（無ければテナントの HNSW パラメータで作成）"""
+        backend = self._collection_backends.get(name)
+        if backend is None:
+            collection = self.vectorstore._client.get_or_create_collection(
+                name, metadata=settings.hnsw_collection_metadata(tenant)
+            )
+            backend = ChromaVectorBackend(collection)
+            self._check_hnsw_params(backend, tenant)
+            self._collection_backends[name] = backend
+        return backend
+
+    async def drop_index(self, tenant: str | None, spec: IndexSpec) -> None:
+        """テナントのある世代のインデックスを削除（再インデックス後の旧世代の破棄）"""
+        backend, key = self._route(tenant, spec)
+        self._writers.pop(self._writer_key(backend, key), None)
+        if isinstance(backend, FlatVectorBackend):
+            await asyncio.to_thread(backend.drop, key)
+            return
+        name = self._collection_name(tenant, spec.generation)
+        if name is not None:
+            self._collection_backends.pop(name, None)
+            await asyncio.to_thread(self.vectorstore._client.delete_collection, name)
+            return
+        # 共有コレクションではテナントの行だけを削除する
+        ids = (await asyncio.to_thread(backend.get, key, None, None, False))["ids"]
+        for start in range(0, len(ids), settings.reindex_batch_size):
+            await asyncio.to_thread(
+                backend.delete, key, ids[start : start + settings.reindex_batch_size]
+            )
+
+    def stored_tenants(self) -> list[str]:
+        """データを持つテナント名の一覧（埋め込みモデル移行の対象）
+
+        台帳に記録済みのテナントと、各バックエンドに現在の割り当てでデータを持つテナント。
+        """
+        found = {tenant for tenant in self.index_registry.tenants() if tenant}
+        found.update(settings.hnsw_tenants_map)
+        found.update(
+            tenant
+            for tenant in self._get_flat_backend().tenants()
+            if settings.vector_backend_for(tenant) == "flat"
+        )
+        if self.vectorstore is not None:
+            shared = ChromaVectorBackend(self.vectorstore._collection)
+            found.update(
+                tenant
+                for tenant in shared.tenants()
+                if settings.vector_backend_for(tenant) == "chroma"
+            )
+        return sorted(found)
+
+    @staticmethod
+    def _check_hnsw_params(backend: ChromaVectorBackend, tenant: str | None) -> None:
+        """既存コレクションの HNSW パラメータが設定と異なれば警告
+
+        HNSW パラメータはコレクション作成時に確定するため、設定変更は
+        新しいコレクションへの再構築後に反映される。
+        """
+        actual = backend.hnsw_params
+        expected = settings.hnsw_params_for(tenant)
+        if actual != expected:
+            logger.warning(
+                f"コレクション {backend.collection.name} の HNSW パラメータ {actual} が"
+                f"設定 {expected} と異なります（再構築するまで既存の値で動作します）"
+            )
+
+    @staticmethod
+    def _writer_key(backend: VectorBackend, key: str | None) -> tuple[str, str]:
+        if isinstance(backend, ChromaVectorBackend):
+            return (backend.name, str(backend.collection.id))
+        return (backend.name, key or "")
+
+    def _writer_for(self, backend: VectorBackend, key: str | None) -> CollectionWriter:
+        """書き込み先コレクションの書き込みタスクを取得
+
+        Chroma はコレクション（共有または専用）、flat は格納キー（ディレクトリ）が単位。
+        """
+        writer_key = self._writer_key(backend, key)
+        writer = self._writers.get(writer_key)
+        if writer is None or writer.backend is not backend:
+            writer = CollectionWriter(
+                backend,
+                None if isinstance(backend, ChromaVectorBackend) else key,
+                max_batch_rows=settings.ingest_writer_max_batch_rows,
+                linger_seconds=settings.ingest_writer_linger_ms / 1000,
+            )
+            self._writers[writer_key] = writer
+        return writer
+
+    async def initialize(self) -> None:
+        """RAGエンジンの初期化
+        OpenAIクライアントとLLMを初期化
+        非同期で初期化することで、起動時の応答性を向上させる
+        """
+        try:
+            self.embeddings = self._create_embeddings()
+            self._embeddings_key = (
+                settings.embedding_model,
+                settings.embedding_dimensions,
+            )
+            # 既存データの埋め込み条件を固定する（以降の設定変更は再インデックスで反映）
+            self.index_registry.ensure_baseline(
+                IndexSpec(settings.embedding_model, settings.embedding_dimensions)
+            )
+            self.llm, _ = self._get_llm(None, None, None)
+
+            if self.is_embedded:
+                self._chroma_client = self._connect_embedded_chroma()
+            else:
+                self._chroma_client = self._connect_http_chroma()
 
             await self._load_existing_vectorstore()
 
@@ -211,11 +674,23 @@ class RAGEngine:
             読み込みに成功した場合True, 失敗した場合False
         """
         try:
-            if settings.persist_path.exists() and self.embeddings:
+            if not self.embeddings:
+                return False
+            if not self.is_embedded:
+                if self._chroma_client is None:
+                    return False
+                self.vectorstore = Chroma(
+                    client=self._chroma_client,
+                    embedding_function=self.embeddings,
+                    collection_metadata=settings.hnsw_collection_metadata(None),
+                )
+                return True
+            if settings.persist_path.exists():
                 # 既存のベクトルストアに接続（client を優先して使用）
                 kwargs: dict[str, Any] = {
                     "persist_directory": str(settings.persist_path),
                     "embedding_function": self.embeddings,
+                    "collection_metadata": settings.hnsw_collection_metadata(None),
                 }
                 if self._chroma_client is not None:
                     kwargs["client"] = self._chroma_client
@@ -252,8 +727,13 @@ class RAGEngine:
             raise RuntimeError("RAGエンジンが初期化されていません")
 
         try:
-            if not self.vectorstore:
+            if (
+                self.vectorstore is None
+                and settings.vector_backend_for(tenant) == "chroma"
+            ):
                 await self._load_existing_vectorstore()
+            spec = self.index_spec(tenant)
+            backend, key = await self._ready_backend(tenant, spec)
 
             file_id = str(uuid.uuid4())
             upload_time = datetime.now().isoformat()
@@ -273,30 +753,17 @@ class RAGEngine:
                     md["source"] = source
                 metadatas.append(md)
 
-            if not self.vectorstore:
-                # 新規作成
-                if self._chroma_client is not None:
-                    self.vectorstore = Chroma.from_texts(
-                        texts=chunks,
-                        embedding=self.embeddings,
-                        metadatas=metadatas,
-                        client=self._chroma_client,
-                        persist_directory=str(settings.persist_path),
-                    )
-                else:
-                    self.vectorstore = Chroma.from_texts(
-                        texts=chunks,
-                        embedding=self.embeddings,
-                        metadatas=metadatas,
-                        client_settings=self.chroma_settings,
-                    )
-            else:
-                # 既存コレクションに追記
-                await self._add_chunks_to_existing_vectorstore(chunks, metadatas)
+            embeddings = await self.embeddings_for(spec).aembed_documents(chunks)
+            ids = [str(uuid.uuid4()) for _ in chunks]
+            # 同じコレクションへの同時アップロードは書き込みタスクがまとめて書き込む
+            await self._writer_for(backend, key).add(ids, chunks, embeddings, metadatas)
 
-            self.vectorstore.persist()
-            current_uuid = str(self.vectorstore._collection.id)
-            await self._cleanup_old_directories(current_uuid)
+            # Chroma は書き込み時に自動で永続化される。不要ファイルの掃除や
+            # SQLite の最適化はリクエスト外の保守処理（services.maintenance）で行う
+            if isinstance(backend, ChromaVectorBackend):
+                current_uuid = str(backend.collection.id)
+            else:
+                current_uuid = f"{backend.name}:{key or ''}"
 
             return {
                 "status": "success",
@@ -308,12 +775,6 @@ class RAGEngine:
         except Exception as e:
             raise RuntimeError(f"ベクトルストアの作成に失敗しました: {str(e)}")
 
-    async def _add_chunks_to_existing_vectorstore(
-        self, chunks: list[str], metadatas: list[dict[str, Any]]
-    ) -> None:
-        """既存のベクトルストアにチャンクを追加"""
-        self.vectorstore.add_texts(texts=chunks, metadatas=metadatas)
-
     # NOTE
     # ↓はベクトルストアの上書き作成用のメソッドのため利用停止
     # async def _cleanup_existing_vectorstore(self) -> None:
@@ -327,23 +788,6 @@ class RAGEngine:
     #         self.vectorstore = None
     #         gc.collect()
 
-    async def _cleanup_old_directories(self, keep_uuid: str) -> None:
-        """古いUUIDディレクトリを削除
-
-        Args:
-            keep_uuid: 残しておくUUID
-        """
-        try:
-            persist_dir = settings.persist_path
-            if not persist_dir.exists():
-                return
-
-            for path in persist_dir.iterdir():
-                if path.is_dir() and path.name != keep_uuid:
-                    shutil.rmtree(path, ignore_errors=True)
-        except Exception:
-            pass
-
     async def search_documents(
         self, query: str, top_k: int | None = None, tenant: str | None = None
     ) -> list[Document]:
@@ -358,42 +802,59 @@ class RAGEngine:
         Raises:
             RuntimeError: ベクトルストアが初期化されていない場合
         """
-        if not self.vectorstore:
+        if not self.embeddings:
             raise RuntimeError("ベクトルストアが初期化されていません")
+        spec = self.index_spec(tenant)
+        backend, key = self._route(tenant, spec)
+        warmup = self.prefetch(tenant)
 
         k = top_k or settings.default_top_k
 
         try:
-            kwargs: dict[str, Any] = {}
-            if tenant is not None:
-                kwargs["filter"] = {"tenant": tenant}
-
-            # スコア付きで検索を実行
-            results = await self.vectorstore.asimilarity_search_with_score(
-                query, k=k, filter=kwargs.get("filter")
-            )
-
-            # デバッグ: スコアを確認
-            print(f"[DEBUG] 検索クエリ: {query[:50]}...")
-            print(f"[DEBUG] 検索結果数: {len(results)}")
-            for i, (doc, score) in enumerate(results):
-                print(
-                    f"[DEBUG] 文書{i+1}: スコア={score:.4f}, 内容={doc.page_content[:100]}..."
+            # スコア付きで検索を実行（インデックスの読み込みはクエリ埋め込みと並行）
+            with stage_timer("query_embedding", tenant, spec.model):
+                query_embedding = await self.embeddings_for(spec).aembed_query(query)
+            if warmup is not None:
+                with stage_timer("index_load", tenant, spec.model):
+                    await warmup
+            with stage_timer("vector_search", tenant, spec.model) as span:
+                # 距離計算・Chroma の問い合わせは同期処理のためループの外で行う
+                results = await asyncio.to_thread(
+                    backend.search, key, query_embedding, k
                 )
+                span.set(results=len(results))
 
-            # 類似度閾値でフィルタリング（Chromaは距離を返すので、小さいほど類似）
-            threshold = settings.similarity_score_threshold
-            print(f"[DEBUG] 閾値: {threshold}")
-            filtered_documents = []
-            for doc, score in results:
-                # スコアが閾値以下（類似度が高い）の文書のみ採用
-                if score <= threshold:
-                    filtered_documents.append(doc)
-                    print(f"[DEBUG] ✓ 採用: スコア={score:.4f}")
-                else:
-                    print(f"[DEBUG] ✗ 除外: スコア={score:.4f}")
+            # 類似度閾値でフィルタリング（距離なので小さいほど類似。尺度は space に依存）
+            threshold = settings.score_threshold_for(backend.space_for(key))
+            # スコアが閾値以下（類似度が高い）の文書のみ採用
+            filtered_documents = [doc for doc, score in results if score <= threshold]
 
-            print(f"[DEBUG] フィルタ後の文書数: {len(filtered_documents)}")
+            if (
+                settings.retrieval_debug_log
+                and logger.isEnabledFor(logging.DEBUG)
+                and sampled(settings.retrieval_log_sample_rate)
+            ):
+                # 本文・クエリは記録しない（スコアと出所のみ）
+                logger.debug(
+                    "検索結果の内訳",
+                    extra={
+                        "fields": {
+                            "tenant": tenant,
+                            "query_chars": len(query),
+                            "threshold": threshold,
+                            "kept": len(filtered_documents),
+                            "results": [
+                                {
+                                    "score": round(float(score), 4),
+                                    "kept": score <= threshold,
+                                    "file_id": doc.metadata.get("file_id"),
+                                    "chunk_index": doc.metadata.get("chunk_index"),
+                                }
+                                for doc, score in results
+                            ],
+                        }
+                    },
+                )
             return filtered_documents
 
         except Exception as e:
@@ -407,11 +868,19 @@ class RAGEngine:
         temperature: float | None = None,
         tenant: str | None = None,
         max_output_tokens: int | None = None,
+        precheck: Awaitable[Any] | None = None,
     ) -> dict[str, Any]:
         """RAGによる回答生成
+
+        事前チェック（precheck）・文書の有無の確認・検索は並行して実行し、
+        LLM の呼び出しはすべてが通ってから行う。いずれかが失敗した時点で残りは取り消す。
+        文書がない場合も precheck の完了は待ち、その失敗を優先して送出する。
+
         Args:
             question: 質問
             top_k: 検索結果の上位k件
+            precheck: LLM 呼び出しの前に完了を待つ処理（予算の確認など）。
+                その例外はそのまま送出する
 
         Returns:
             回答と関連文書を含む辞書
@@ -419,12 +888,48 @@ class RAGEngine:
         Raises:
             RuntimeError: RAGエンジンが初期化されていない場合
         """
-        if not self.vectorstore or not self.llm:
-            raise RuntimeError("RAGエンジンが初期化されていません")
+        check = asyncio.ensure_future(precheck) if precheck is not None else None
+        tasks: list[asyncio.Future] = [check] if check is not None else []
+        try:
+            if not self.embeddings or not self.llm:
+                raise RuntimeError("RAGエンジンが初期化されていません")
+            self._route(tenant)
+        except Exception:
+            _discard(tasks)
+            raise
 
         try:
-            # まず、テナントにドキュメントが存在するかチェック
-            doc_list = await self.get_document_list(tenant=tenant)
+            used_model = self._llm_key(model, temperature, max_output_tokens)[0]
+
+            async def corpus_check() -> dict[str, Any]:
+                with stage_timer("corpus_check", tenant, used_model):
+                    return await self.get_document_list(tenant=tenant)
+
+            async def retrieval() -> list[Document]:
+                with stage_timer("retrieval", tenant, used_model) as span:
+                    documents = await self.search_documents(
+                        question, top_k, tenant=tenant
+                    )
+                    span.set(documents=len(documents))
+                    return documents
+
+            corpus = asyncio.create_task(corpus_check())
+            search = asyncio.create_task(retrieval())
+            tasks += [corpus, search]
+
+            # チェックの完了順に判定し、失敗した時点で抜ける（残りは finally で取り消す）
+            # 文書がなければ検索はすぐ取り消すが、事前チェックの失敗（予算超過など）は
+            # 文書の有無より優先して送出するため、その完了は待つ
+            pending = {t for t in (check, corpus) if t is not None}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    task.result()
+                if corpus in done and corpus.result()["total_chunks"] == 0:
+                    search.cancel()
+            doc_list = corpus.result()
             if doc_list["total_chunks"] == 0:
                 return {
                     "answer": (
@@ -437,7 +942,7 @@ class RAGEngine:
                     "llm_model": getattr(self.llm, "model", settings.default_model),
                 }
 
-            documents = await self.search_documents(question, top_k, tenant=tenant)
+            documents = await search
 
             if not documents:
                 return {
@@ -448,59 +953,55 @@ class RAGEngine:
                 }
 
             # トークンベース詰め込み（質問・プロンプト・出力上限を考慮した残り枠に収める）
-            model_for_encoding = model or getattr(
-                self.llm, "model", settings.default_model
-            )
-            try:
-                enc = tiktoken.encoding_for_model(model_for_encoding)
-            except Exception:
-                enc = tiktoken.get_encoding("cl100k_base")
-
-            context_window = getattr(settings, "default_context_window_tokens", 8192)
-            prompt_overhead = getattr(settings, "prompt_overhead_tokens", 512)
-
-            question_tokens = len(enc.encode(question or ""))
-            fixed_prompt_tokens = prompt_overhead
-
-            used_max_out = (
-                int(max_output_tokens)
-                if max_output_tokens is not None
-                else int(settings.default_max_output_tokens)
-            )
+            with stage_timer("context_packing", tenant, used_model) as span:
+                model_for_encoding = model or getattr(
+                    self.llm, "model", settings.default_model
+                )
+                enc = _encoding_for(model_for_encoding)
 
-            remaining_input_budget = max(
-                0, context_window - fixed_prompt_tokens - question_tokens - used_max_out
-            )
+                context_window = getattr(
+                    settings, "default_context_window_tokens", 8192
+                )
+                prompt_overhead = getattr(settings, "prompt_overhead_tokens", 512)
 
-            selected_parts = self._select_context_parts(
-                documents, enc, remaining_input_budget
-            )
+                question_tokens = len(enc.encode(question or ""))
+                fixed_prompt_tokens = prompt_overhead
 
-            context = self._format_documents(selected_parts)
+                used_max_out = (
+                    int(max_output_tokens)
+                    if max_output_tokens is not None
+                    else int(settings.default_max_output_tokens)
+                )
 
-            if (
-                model is not None
-                or temperature is not None
-                or max_output_tokens is not None
-            ):
-                llm, used_model = self._get_llm(model, temperature, max_output_tokens)
-            else:
-                llm = self.llm
-                used_model = getattr(
-                    llm,
-                    "model",
-                    getattr(llm, "model_name", settings.default_model),
+                remaining_input_budget = max(
+                    0,
+                    context_window
+                    - fixed_prompt_tokens
+                    - question_tokens
+                    - used_max_out,
                 )
 
-            prompt = PromptTemplate.from_template(self.RAG_PROMPT_TEMPLATE)
+                selected_parts = self._select_context_parts(
+                    documents, enc, remaining_input_budget
+                )
 
-            rag_chain = (
-                {"context": lambda x: context, "question": RunnablePassthrough()}
-                | prompt
-                | llm
-            )
+                context = self._format_documents(selected_parts)
+                span.set(
+                    budget_tokens=remaining_input_budget, parts=len(selected_parts)
+                )
 
-            msg = await rag_chain.ainvoke(question)
+            with stage_timer("llm", tenant, used_model) as span:
+                rag_chain, used_model = self._get_chain(
+                    model, temperature, max_output_tokens
+                )
+                msg = await rag_chain.ainvoke(
+                    {"context": context, "question": question}
+                )
+                usage = getattr(msg, "usage_metadata", None) or {}
+                span.set(
+                    input_tokens=usage.get("input_tokens"),
+                    output_tokens=usage.get("output_tokens"),
+                )
             answer = getattr(msg, "content", str(msg))
 
             # APIレスポンス由来のモデル名を優先（無ければused_model）
@@ -523,7 +1024,12 @@ class RAGEngine:
             }
 
         except Exception as e:
+            if check is not None and check.done() and not check.cancelled():
+                if check.exception() is e:
+                    raise
             raise RuntimeError(f"回答生成に失敗しました: {str(e)}")
+        finally:
+            _discard(tasks)
 
     def _select_context_parts(
         self,
@@ -575,6 +1081,40 @@ class RAGEngine:
         """
         return "\n\n".join(selected_parts)
 
+    def memory_usage(self, counter: SizeCounter) -> dict[str, Any]:
+        """エンジンが保持するキャッシュとインデックスのおおよそのサイズ
+
+        LLM とチェーンが共有する HTTP クライアントなどは最初に数えた表に計上される。
+        """
+        tables = [
+            table("llm_cache", self._llm_cache, counter),
+            table("chain_cache", self._chain_cache, counter),
+            table("embedders", self._embedders, counter),
+            table("encodings", _encodings, counter),
+            table("collection_backends", self._collection_backends, counter),
+            table("warmups", self._warmups, counter),
+            table("ingest_writers", self._writers, counter),
+        ]
+        usage: dict[str, Any] = {
+            "tables": tables,
+            "llm_cache_keys": [list(key) for key in self._llm_cache],
+        }
+        if self._flat_backend is not None:
+            flat = self._flat_backend.info()
+            usage["flat_index"] = {
+                "loaded_tenants": flat["loaded_tenants"],
+                "resident_bytes": flat["resident_bytes"],
+                "max_resident_bytes": flat["max_resident_bytes"],
+                "tenants": [
+                    {"tenant": t["tenant"], "resident_bytes": t["resident_bytes"]}
+                    for t in flat["tenants"]
+                ],
+            }
+        if self._embedding_cache is not None:
+            # 埋め込みキャッシュは SQLite（ディスク）のため件数のみ
+            usage["embedding_cache_entries"] = self._embedding_cache.stats()["entries"]
+        return usage
+
     async def get_system_info(self) -> dict[str, Any]:
         """システム情報を取得
 
@@ -582,37 +1122,66 @@ class RAGEngine:
             システム情報の辞書
         """
         info: dict[str, Any] = {
-            "status": "initialized" if self.vectorstore else "not_initialized",
+            "status": (
+                "initialized" if self.vectorstore is not None else "not_initialized"
+            ),
             "embedding_model": settings.embedding_model,
-            "persist_directory": str(settings.persist_path),
+            "chroma_mode": "embedded" if self.is_embedded else "http",
         }
+        if self.is_embedded:
+            info["persist_directory"] = str(settings.persist_path)
+        else:
+            info["chroma_server"] = f"{settings.chroma_host}:{settings.chroma_port}"
+
+        info["vector_backend"] = settings.vector_backend
+        overrides = settings.vector_backend_tenants_map
+        if overrides:
+            info["vector_backend_tenants"] = overrides
 
-        if self.vectorstore:
+        if self.vectorstore is not None:
             try:
-                collection = self.vectorstore._collection
-                info.update(
-                    {
-                        "collection_id": str(collection.id),
-                        "vector_document_count": collection.count(),
-                        "vectorstore_ready": True,
-                    }
-                )
+                info.update(self._route(None)[0].info())
+                info.pop("backend", None)
+                info["vectorstore_ready"] = True
             except Exception:
                 info["vectorstore_ready"] = False
         else:
             info["vectorstore_ready"] = False
 
+        if self._collection_backends:
+            info["tenant_collections"] = {
+                name: {"hnsw": backend.hnsw_params}
+                for name, backend in self._collection_backends.items()
+            }
+
+        reindexed = self.index_registry.tenants()
+        if reindexed:
+            info["tenant_indexes"] = {
+                tenant: asdict(spec) for tenant, spec in reindexed.items()
+            }
+        if self._embedding_cache is not None:
+            info["embedding_cache"] = self._embedding_cache.stats()
+
+        if self._flat_backend is not None:
+            try:
+                info["flat_index"] = self._flat_backend.info()
+            except Exception:
+                pass
+
+        if self._writers:
+            info["ingest_writers"] = [w.stats() for w in self._writers.values()]
+
         return info
 
     async def get_document_list(self, tenant: str | None = None) -> dict[str, Any]:
         """アップロード済みドキュメント一覧を取得"""
         try:
-            if not self.vectorstore:
+            try:
+                backend, key = await self._ready_backend(tenant)
+            except RuntimeError:
                 return {"files": [], "total_files": 0, "total_chunks": 0}
 
-            collection = self.vectorstore._collection
-            where = {"tenant": {"$eq": tenant}} if tenant is not None else None
-            results = collection.get(include=["metadatas"], where=where)
+            results = await asyncio.to_thread(backend.get, key, include_documents=False)
             metadatas = results.get("metadatas") or []
 
             if not metadatas:
@@ -656,21 +1225,17 @@ class RAGEngine:
         Return:
             各チャンクの{"content": str, "metadata": dict}のリスト
         """
-        if not self.vectorstore:
-            raise RuntimeError("ベクトルストアが初期化されていません")
-
-        collection = self.vectorstore._collection
+        backend, key = await self._ready_backend(tenant)
         results: list[dict[str, Any]] = []
         for file_id, chunk_index in pairs:
             try:
-                conditions = [
-                    {"file_id": {"$eq": file_id}},
-                    {"chunk_index": {"$eq": int(chunk_index)}},
-                ]
-                if tenant is not None:
-                    conditions.append({"tenant": {"$eq": tenant}})
-                where = {"$and": conditions}
-                got = collection.get(where=where, include=["documents", "metadatas"])
+                where = {
+                    "$and": [
+                        {"file_id": {"$eq": file_id}},
+                        {"chunk_index": {"$eq": int(chunk_index)}},
+                    ]
+                }
+                got = await asyncio.to_thread(backend.get, key, where=where)
                 docs = got.get("documents") or []
                 metas = got.get("metadatas") or []
                 if docs and metas:
@@ -684,16 +1249,12 @@ class RAGEngine:
     ) -> dict[str, Any]:
         """file_idでドキュメントを削除（推奨）"""
         try:
-            if not self.vectorstore:
-                raise RuntimeError("ベクトルストアが初期化されていません")
-
-            collection = self.vectorstore._collection
-            conditions = [{"file_id": {"$eq": file_id}}]
-            if tenant is not None:
-                conditions.append({"tenant": {"$eq": tenant}})
-            where = {"$and": conditions} if len(conditions) > 1 else conditions[0]
+            backend, key = await self._ready_backend(tenant)
+            where = {"file_id": {"$eq": file_id}}
 
-            results = collection.get(where=where, include=["metadatas"])
+            results = await asyncio.to_thread(
+                backend.get, key, where=where, include_documents=False
+            )
             ids = results.get("ids") or []
             if not ids:
                 raise ValueError(f"file_id '{file_id}' は見つかりませんでした")
@@ -707,14 +1268,11 @@ class RAGEngine:
                     break
 
             deleted_count = len(ids)
-            collection.delete(where=where)
-            after_count = collection.count()
+            await self._writer_for(backend, key).delete(ids)
+            after_count = await asyncio.to_thread(backend.count, key)
 
-            remaining_where = (
-                {"tenant": {"$eq": tenant}} if tenant is not None else None
-            )
-            remaining_results = collection.get(
-                include=["metadatas"], where=remaining_where
+            remaining_results = await asyncio.to_thread(
+                backend.get, key, include_documents=False
             )
             metadatas = remaining_results.get("metadatas") or []
             remaining_files = (
@@ -740,11 +1298,19 @@ class RAGEngine:
             リセット結果
         """
         try:
-            if self.vectorstore:
-                current_uuid = str(self.vectorstore._collection.id)
+            for writer in list(self._writers.values()):
+                await writer.close()
+            self._writers.clear()
+            if self.vectorstore is not None:
                 self.vectorstore._client.reset()
-                await self._cleanup_old_directories(current_uuid)
                 self.vectorstore = None
+                self._chroma_backend = None
+                self._collection_backends.clear()
+            self._get_flat_backend().reset()
+            # 全データを消したので、以降は現在の設定の埋め込み条件で作り直す
+            self.index_registry.reset(
+                IndexSpec(settings.embedding_model, settings.embedding_dimensions)
+            )
 
             return {"status": "success", "message": "ベクトルストアをリセットしました"}
 
@@ -0,0 +1,272 @@
+"""
+再インデックスモジュール
+テナントのインデックスを新しい埋め込み条件（次元数など）の別世代として作り直し、
+完成後にインデックス台帳を書き換えて切り替える
+
+- 作り直しの間も検索・アップロードは現在の世代で動き続ける
+- 埋め込みは次の順で再利用し、埋め込み API の呼び出しを最小にする
+  1. 同じモデルで次元を下げる場合は格納済みベクトルを短縮
+  2. 埋め込みキャッシュ（より高次元の保存値の短縮を含む）
+  3. 埋め込み API（本番の埋め込みを詰まらせないよう流量制御する）
+- 作成中に追加・削除されたチャンクは差分がなくなるまで追従してから切り替え、
+  切り替え後も猶予時間をおいて旧世代との差分を反映してから旧世代を破棄する
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from ..config import settings
+from .embedding_cache import CachedEmbeddings, shorten, supports_shortening
+from .index_registry import IndexSpec
+from .maintenance import NodeLock
+from .vector_backend import VectorBackend
+
+if TYPE_CHECKING:
+    from .rag_engine import RAGEngine
+
+logger = logging.getLogger(__name__)
+
+# テナント → このワーカーで実行した再インデックスの状態（管理APIで参照）
+jobs: dict[str, dict[str, Any]] = {}
+_tasks: dict[str, asyncio.Task] = {}
+
+
+class ReindexConflict(RuntimeError):
+    """同じテナントの再インデックスが実行中"""
+
+
+def tenant_lock(tenant: str) -> NodeLock:
+    digest = hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:16]
+    return NodeLock(settings.persist_path / f".reindex-{digest}.lock")
+
+
+class ShadowIndex:
+    """テナントの新しい世代を、旧世代に追従させながら裏で作る
+
+    検索・書き込みは台帳が切り替わるまで旧世代（source）のまま。
+    """
+
+    def __init__(
+        self,
+        engine: "RAGEngine",
+        tenant: str,
+        source: IndexSpec,
+        target: IndexSpec,
+        status: dict[str, Any],
+    ):
+        self.engine = engine
+        self.tenant = tenant
+        self.source = source
+        self.target = target
+        self.status = status
+        self.copied: set[str] = set()
+        self._embedder: Any = None
+
+    async def prepare(self, resume: bool = False) -> None:
+        """旧世代を読み込み、新世代の作成を始める
+
+        resume=True なら同じ条件で途中まで作った新世代を引き継ぐ（チャンク ID は
+        内容ごとに固有で書き換えられないため、ID の差分だけ反映すれば追いつく）。
+        それ以外は前回失敗した同じ世代の残りを消してから作る。
+        """
+        await self.engine._ready_backend(self.tenant, self.source)
+        if not resume:
+            await self.engine.drop_index(self.tenant, self.target)
+            return
+        backend, key = self.engine._route(self.tenant, self.target)
+        got = await asyncio.to_thread(backend.get, key, None, None, False)
+        self.copied = set(got["ids"])
+
+    async def _embed(
+        self,
+        source_backend: VectorBackend,
+        source_key: str | None,
+        ids: list[str],
+        texts: list[str],
+    ) -> list[list[float]]:
+        """1バッチ分の埋め込みを、再利用できるものから順に用意する"""
+        source, target, status = self.source, self.target, self.status
+        vectors: dict[str, list[float]] = {}
+        if (
+            source.model == target.model
+            and target.dimensions is not None
+            and supports_shortening(target.model)
+        ):
+            stored = await asyncio.to_thread(
+                source_backend.get_embeddings, source_key, ids
+            )
+            for cid, vector in stored.items():
+                if len(vector) >= target.dimensions:
+                    vectors[cid] = shorten(vector, target.dimensions)
+            status["reused_vectors"] += len(vectors)
+
+        rest = [i for i, cid in enumerate(ids) if cid not in vectors]
+        if rest:
+            if self._embedder is None:
+                self._embedder = self.engine.background_embeddings(target)
+            embedder = self._embedder
+            rest_texts = [texts[i] for i in rest]
+            if isinstance(embedder, CachedEmbeddings):
+                computed, from_cache = await embedder.aembed_documents_counted(
+                    rest_texts
+                )
+            else:
+                computed, from_cache = await embedder.aembed_documents(rest_texts), 0
+            status["from_cache"] += from_cache
+            status["embedded"] += len(rest) - from_cache
+            for i, vector in zip(rest, computed):
+                vectors[ids[i]] = vector
+        return [vectors[cid] for cid in ids]
+
+    async def sync(self) -> bool:
+        """旧世代との差分（未コピー・削除済み）を1回反映し、差分があったかを返す"""
+        engine, status = self.engine, self.status
+        source_backend, source_key = engine._route(self.tenant, self.source)
+        target_backend, target_key = engine._route(self.tenant, self.target)
+        writer = engine._writer_for(target_backend, target_key)
+        current = await asyncio.to_thread(source_backend.get, source_key)
+        live = {
+            cid: (doc, md)
+            for cid, doc, md in zip(
+                current["ids"], current["documents"], current["metadatas"]
+            )
+        }
+        pending = [cid for cid in current["ids"] if cid not in self.copied]
+        removed = self.copied - live.keys()
+        status["total"] = len(live)
+
+        batch_size = max(1, settings.reindex_batch_size)
+        for start in range(0, len(pending), batch_size):
+            ids = pending[start : start + batch_size]
+            texts = [live[cid][0] for cid in ids]
+            vectors = await self._embed(source_backend, source_key, ids, texts)
+            await writer.add(ids, texts, vectors, [live[cid][1] for cid in ids])
+            self.copied.update(ids)
+            status["copied"] = len(self.copied & live.keys())
+        if removed:
+            await writer.delete(sorted(removed))
+            self.copied -= removed
+        status["copied"] = len(self.copied & live.keys())
+        return bool(pending or removed)
+
+    async def converge(self) -> None:
+        """差分がなくなるまで追従する"""
+        while await self.sync():
+            pass
+
+    async def retire(self) -> None:
+        """切り替え後、旧世代への書き込みを取り込んでから旧世代を破棄"""
+        await self.sync()
+        await self.engine.drop_index(self.tenant, self.source)
+
+
+def new_status(tenant: str, source: IndexSpec, target: IndexSpec) -> dict[str, Any]:
+    return {
+        "tenant": tenant,
+        "state": "running",
+        "source": asdict(source),
+        "target": asdict(target),
+        "total": 0,
+        "copied": 0,
+        "reused_vectors": 0,
+        "from_cache": 0,
+        "embedded": 0,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def cutover_grace(seconds: float | None = None) -> float:
+    return settings.reindex_cutover_grace_seconds if seconds is None else seconds
+
+
+async def reindex_tenant(
+    engine: "RAGEngine",
+    tenant: str,
+    target: IndexSpec,
+    status: dict[str, Any],
+    cutover_grace_seconds: float | None = None,
+) -> None:
+    """テナントを target の世代に作り直して切り替える"""
+    shadow = ShadowIndex(engine, tenant, engine.index_spec(tenant), target, status)
+    await shadow.prepare()
+    await shadow.converge()
+
+    # 台帳の差し替えで全ワーカーの検索・書き込みが新世代に切り替わる
+    engine.index_registry.set_spec(tenant, target)
+    status["state"] = "switched"
+    status["switched_at"] = datetime.now().isoformat(timespec="seconds")
+
+    # 切り替え直前に旧世代を参照したリクエストの書き込みを待ってから取り込む
+    await asyncio.sleep(cutover_grace(cutover_grace_seconds))
+    await shadow.retire()
+
+
+def start_reindex(
+    engine: "RAGEngine",
+    tenant: str,
+    dimensions: int | None = None,
+    model: str | None = None,
+) -> dict[str, Any]:
+    """テナントの再インデックスをバックグラウンドで開始
+
+    Raises:
+        ValueError: 次元数に非対応のモデルか、現在と同じ埋め込み条件が指定された場合
+        ReindexConflict: 同じテナントの再インデックスが実行中の場合
+    """
+    task = _tasks.get(tenant)
+    if task is not None and not task.done():
+        raise ReindexConflict(f"{tenant} の再インデックスは実行中です")
+    source = engine.index_spec(tenant)
+    target = IndexSpec(
+        model or settings.embedding_model,
+        dimensions if dimensions is not None else settings.embedding_dimensions,
+        source.generation + 1,
+    )
+    if target.dimensions is not None and not supports_shortening(target.model):
+        raise ValueError(f"{target.model} は次元数の指定に対応していません")
+    if target.same_embedding(source):
+        raise ValueError(f"{tenant} は既に指定の埋め込み条件です")
+
+    lock = tenant_lock(tenant)
+    if not lock.acquire():
+        raise ReindexConflict(f"{tenant} の再インデックスは他のワーカーで実行中です")
+
+    status = new_status(tenant, source, target)
+    jobs[tenant] = status
+    _tasks[tenant] = asyncio.create_task(_run(engine, tenant, target, status, lock))
+    return status
+
+
+async def _run(
+    engine: "RAGEngine",
+    tenant: str,
+    target: IndexSpec,
+    status: dict[str, Any],
+    lock: NodeLock,
+) -> None:
+    started = time.perf_counter()
+    try:
+        await reindex_tenant(engine, tenant, target, status)
+        status["state"] = "completed"
+    except Exception as e:
+        logger.warning(f"{tenant} の再インデックスに失敗しました: {e}")
+        status["state"] = "failed"
+        status["error"] = str(e)
+    finally:
+        lock.release()
+        status["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        status["finished_at"] = datetime.now().isoformat(timespec="seconds")
+
+
+async def wait(tenant: str) -> None:
+    """実行中の再インデックスの完了を待つ（テスト・終了処理用）"""
+    task = _tasks.get(tenant)
+    if task is not None:
+        await asyncio.shield(task)
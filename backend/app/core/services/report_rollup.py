@@ -0,0 +1,452 @@
+"""
+レポート集計ロールアップモジュール
+日次の集計キーを週次・月次のバケットへ圧縮し、
+期間クエリを利用可能な最も粗いバケットの組み合わせで解決する
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+from ..config import settings
+
+JST = dt.timezone(dt.timedelta(hours=9))
+
+# 期間 top-k の ZUNIONSTORE 結果を置く一時キーの有効秒数
+TOPK_CACHE_TTL = 60
+# 旧形式の参照回数キーの移行が完了したことの目印
+LEGACY_MIGRATED_KEY = "report_legacy_migrated"
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """集計バケット（day / week / month）"""
+
+    kind: str
+    start: dt.date
+    end: dt.date
+
+    @property
+    def label(self) -> str:
+        if self.kind == "month":
+            return f"M{self.start:%Y-%m}"
+        if self.kind == "week":
+            return f"W{self.start:%Y-%m-%d}"
+        return self.start.strftime("%Y-%m-%d")
+
+
+def today_jst() -> dt.date:
+    return dt.datetime.now(JST).date()
+
+
+def daterange(start: dt.date, end: dt.date) -> Iterator[dt.date]:
+    cur = start
+    while cur <= end:
+        yield cur
+        cur = cur + dt.timedelta(days=1)
+
+
+def day_keys(day: str, tenant: str) -> dict[str, str]:
+    """docs_ask / docs_feedback が書き込む日次キー"""
+    return {
+        "count": f"metrics:{day}:{tenant}:count",
+        "tokens": f"tokens:{day}:{tenant}",
+        "cost": f"cost:{day}:{tenant}",
+        "docs": f"docs:{day}:{tenant}",
+        "feedback": f"feedback:{day}:{tenant}",
+        "hll": f"hll:{day}:{tenant}:clients",
+        "docs_top": f"docs_rank:{day}:{tenant}",
+        "chunks_top": f"chunks_rank:{day}:{tenant}",
+    }
+
+
+def legacy_top_keys(day: str, tenant: str) -> dict[str, str]:
+    """旧形式（無制限ハッシュ）の参照回数キー。起動時とロールアップジョブで移行する"""
+    return {
+        "docs_top": f"docs_top:{day}:{tenant}",
+        "chunks_top": f"chunks_top:{day}:{tenant}",
+    }
+
+
+def rollup_keys(label: str, tenant: str) -> dict[str, str]:
+    """週次・月次ロールアップのキー"""
+    return {
+        "summary": f"rollup:{label}:{tenant}",
+        "hll": f"rollup_hll:{label}:{tenant}",
+        "docs_top": f"rollup_docs_top:{label}:{tenant}",
+        "chunks_top": f"rollup_chunks_top:{label}:{tenant}",
+    }
+
+
+def month_bucket(d: dt.date) -> Bucket:
+    start = d.replace(day=1)
+    next_month = (start + dt.timedelta(days=32)).replace(day=1)
+    return Bucket("month", start, next_month - dt.timedelta(days=1))
+
+
+def week_bucket(d: dt.date) -> Bucket:
+    start = d - dt.timedelta(days=d.weekday())
+    return Bucket("week", start, start + dt.timedelta(days=6))
+
+
+def closed_buckets(d0: dt.date, d1: dt.date, today: dt.date) -> list[Bucket]:
+    """[d0, d1] に完全に含まれ、かつ today より前に閉じた週・月バケット"""
+    found: dict[str, Bucket] = {}
+    for d in daterange(d0, d1):
+        for b in (month_bucket(d), week_bucket(d)):
+            if b.start >= d0 and b.end <= d1 and b.end < today:
+                found.setdefault(b.label, b)
+    return list(found.values())
+
+
+def plan_buckets(
+    rc: Any,
+    tenant: str,
+    d0: dt.date,
+    d1: dt.date,
+    today: dt.date | None = None,
+) -> list[Bucket]:
+    """期間を利用可能な最も粗いバケットで覆う
+
+    ロールアップ済みの月 > 週 > 日 の優先順で先頭から貪欲に割り当てる。
+    ロールアップの有無は1回のパイプライン(EXISTS)で確認する。
+    """
+    today = today or today_jst()
+    candidates = closed_buckets(d0, d1, today)
+    available: set[str] = set()
+    if candidates:
+        pipe = rc.pipeline(transaction=False)
+        for b in candidates:
+            pipe.exists(rollup_keys(b.label, tenant)["summary"])
+        for b, exists in zip(candidates, pipe.execute()):
+            if exists:
+                available.add(b.label)
+
+    plan: list[Bucket] = []
+    cur = d0
+    while cur <= d1:
+        chosen = Bucket("day", cur, cur)
+        for b in (month_bucket(cur), week_bucket(cur)):
+            if b.start == cur and b.label in available:
+                chosen = b
+                break
+        plan.append(chosen)
+        cur = chosen.end + dt.timedelta(days=1)
+    return plan
+
+
+def retained_range(
+    rc: Any,
+    tenant: str,
+    d0: dt.date,
+    d1: dt.date,
+    today: dt.date | None = None,
+) -> tuple[dt.date, dt.date] | None:
+    """期間を、日次キーの失効で欠けずに集計できる範囲に縮める
+
+    月次ロールアップ済みの日次キーは report_daily_retention_days 日で失効するため、
+    その月を途中から・途中までしか含まない期間は月バケットでも日次キーでも数えられない。
+    そうした月の部分を両端から除く（まだ失効していない日は残す）。
+
+    Returns:
+        集計できる (開始日, 終了日)。何も残らなければ None
+    """
+    retention = settings.report_daily_retention_days
+    today = today or today_jst()
+    if retention <= 0:
+        return d0, d1
+    # これより前の日の日次キーは、月次ロールアップ済みなら失効している
+    first_retained = today - dt.timedelta(days=retention - 1)
+    if d0 >= first_retained:
+        return d0, d1
+
+    months: dict[str, Bucket] = {}
+    for d in daterange(d0, min(d1, first_retained - dt.timedelta(days=1))):
+        months.setdefault(month_bucket(d).label, month_bucket(d))
+    pipe = rc.pipeline(transaction=False)
+    for b in months.values():
+        pipe.exists(rollup_keys(b.label, tenant)["summary"])
+    rolled = {label for label, exists in zip(months, pipe.execute()) if exists}
+
+    def expired(m: Bucket) -> bool:
+        return m.label in rolled and m.start < first_retained
+
+    while d0 <= d1 and d0 < first_retained:
+        m = month_bucket(d0)
+        if not expired(m) or (d0 == m.start and m.end <= d1):
+            break
+        d0 = min(m.end + dt.timedelta(days=1), first_retained)
+    while d0 <= d1 and d1 < first_retained:
+        m = month_bucket(d1)
+        if not expired(m) or (d1 == m.end and m.start >= d0):
+            break
+        d1 = m.start - dt.timedelta(days=1)
+    if d0 > d1:
+        return None
+    return d0, d1
+
+
+def _empty_summary() -> dict[str, Any]:
+    return {
+        "questions": 0,
+        "tokens": 0.0,
+        "cost_jpy": 0.0,
+        "hit": 0,
+        "zero_hit": 0,
+        "feedback_yes": 0,
+        "feedback_no": 0,
+        "unique_users": 0,
+        "docs_top": [],
+    }
+
+
+def _bucket_key(b: Bucket, tenant: str, name: str) -> str:
+    if b.kind == "day":
+        return day_keys(b.label, tenant)[name]
+    return rollup_keys(b.label, tenant)[name]
+
+
+def _queue_topk(
+    pipe: Any, tenant: str, buckets: list[Bucket], name: str, top_n: int
+) -> None:
+    """期間の top-k をサーバー側で求めるコマンドをパイプラインに積む
+
+    各バケットのソート済み集合を ZUNIONSTORE で短命のキャッシュキーへ合算し、
+    上位 top_n 件だけを ZREVRANGE で取り出す（パイプライン上は3コマンド）。
+    """
+    labels = ",".join(b.label for b in buckets)
+    digest = hashlib.sha1(labels.encode("utf-8")).hexdigest()[:16]
+    dest = f"topk:{name}:{tenant}:{digest}"
+    pipe.zunionstore(dest, [_bucket_key(b, tenant, name) for b in buckets])
+    pipe.expire(dest, TOPK_CACHE_TTL)
+    pipe.zrevrange(dest, 0, max(0, top_n - 1), withscores=True)
+
+
+def _topk_result(items: Any) -> list[tuple[str, int]]:
+    return [(member, int(score)) for member, score in (items or [])]
+
+
+def fetch_summary(
+    rc: Any, tenant: str, buckets: list[Bucket], top_n: int = 5
+) -> dict[str, Any]:
+    """バケット列の集計値を1回のパイプラインでまとめて取得・集計する
+
+    日バケットは日次キーを、週・月バケットはロールアップキーを読む。
+    ユニークユーザー数は全バケットのHLLを複数キーの PFCOUNT で和集合として数える。
+    """
+    pipe = rc.pipeline(transaction=False)
+    hll_keys: list[str] = []
+    for b in buckets:
+        if b.kind == "day":
+            k = day_keys(b.label, tenant)
+            pipe.get(k["count"])
+            pipe.get(k["tokens"])
+            pipe.get(k["cost"])
+            pipe.hgetall(k["docs"])
+            pipe.hgetall(k["feedback"])
+        else:
+            k = rollup_keys(b.label, tenant)
+            pipe.hgetall(k["summary"])
+        hll_keys.append(k["hll"])
+    if buckets:
+        pipe.pfcount(*hll_keys)
+        _queue_topk(pipe, tenant, buckets, "docs_top", top_n)
+    results = iter(pipe.execute())
+
+    agg = _empty_summary()
+    for b in buckets:
+        if b.kind == "day":
+            count, tokens, cost, h, fb = (next(results) for _ in range(5))
+            h, fb = h or {}, fb or {}
+            agg["questions"] += int(count or 0)
+            agg["tokens"] += float(tokens or 0)
+            agg["cost_jpy"] += float(cost or 0)
+            agg["hit"] += int(h.get("hit", 0) or 0)
+            agg["zero_hit"] += int(h.get("zero_hit", 0) or 0)
+            agg["feedback_yes"] += int(fb.get("yes", 0) or 0)
+            agg["feedback_no"] += int(fb.get("no", 0) or 0)
+        else:
+            s = next(results) or {}
+            agg["questions"] += int(s.get("questions", 0) or 0)
+            agg["tokens"] += float(s.get("tokens", 0) or 0)
+            agg["cost_jpy"] += float(s.get("cost_jpy", 0) or 0)
+            for field in ("hit", "zero_hit", "feedback_yes", "feedback_no"):
+                agg[field] += int(s.get(field, 0) or 0)
+    if buckets:
+        agg["unique_users"] = int(next(results) or 0)
+        next(results)  # ZUNIONSTORE
+        next(results)  # EXPIRE
+        agg["docs_top"] = _topk_result(next(results))
+    return agg
+
+
+def fetch_chunks_top(
+    rc: Any, tenant: str, buckets: list[Bucket], top_n: int = 10
+) -> list[tuple[str, int]]:
+    """バケット列でよく参照されたチャンク上位 top_n 件を (member, count) で返す"""
+    if not buckets:
+        return []
+    pipe = rc.pipeline(transaction=False)
+    _queue_topk(pipe, tenant, buckets, "chunks_top", top_n)
+    return _topk_result(pipe.execute()[-1])
+
+
+def trim_top(pipe: Any, key: str) -> None:
+    """参照回数の集合を上位 report_top_n 件に切り詰める"""
+    top_n = max(1, settings.report_top_n)
+    pipe.zremrangebyrank(key, 0, -(top_n + 1))
+
+
+def _rollup_bucket(rc: Any, tenant: str, bucket: Bucket, today: dt.date) -> None:
+    """1つの閉じた週・月バケットを日次キーから構築して書き込む"""
+    days = [Bucket("day", d, d) for d in daterange(bucket.start, bucket.end)]
+    agg = fetch_summary(rc, tenant, days)
+    keys = rollup_keys(bucket.label, tenant)
+    daily = [day_keys(b.label, tenant) for b in days]
+
+    pipe = rc.pipeline(transaction=True)
+    pipe.delete(keys["hll"])
+    pipe.pfmerge(keys["hll"], *[k["hll"] for k in daily])
+    for name in ("docs_top", "chunks_top"):
+        pipe.zunionstore(keys[name], [k[name] for k in daily])
+        trim_top(pipe, keys[name])
+    # summary ハッシュはバケットが利用可能であることの目印を兼ねるため最後に書く
+    pipe.hset(
+        keys["summary"],
+        mapping={
+            field: agg[field]
+            for field in (
+                "questions",
+                "tokens",
+                "cost_jpy",
+                "hit",
+                "zero_hit",
+                "feedback_yes",
+                "feedback_no",
+            )
+        },
+    )
+
+    # 月次ロールアップ済みの日次キーは保持期間経過後に失効させる
+    retention = settings.report_daily_retention_days
+    if bucket.kind == "month" and retention > 0:
+        for b, k in zip(days, daily):
+            remaining_days = (b.start - today).days + retention
+            ttl = max(1, remaining_days * 86400)
+            for key in k.values():
+                pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def _migrate_and_trim_days(rc: Any, tenant: str, days: list[dt.date]) -> None:
+    """旧形式のハッシュをソート済み集合へ移行し、日次の集合を上位N件に切り詰める"""
+    labels = [d.strftime("%Y-%m-%d") for d in days]
+    pipe = rc.pipeline(transaction=False)
+    for day in labels:
+        for key in legacy_top_keys(day, tenant).values():
+            pipe.hgetall(key)
+    legacy = iter(pipe.execute())
+
+    pipe = rc.pipeline(transaction=False)
+    for day in labels:
+        new_keys = day_keys(day, tenant)
+        for name, old_key in legacy_top_keys(day, tenant).items():
+            counts = next(legacy) or {}
+            for member, cnt in counts.items():
+                pipe.zincrby(new_keys[name], int(cnt or 0), member)
+            if counts:
+                pipe.delete(old_key)
+            trim_top(pipe, new_keys[name])
+    pipe.execute()
+
+
+def _parse_legacy_key(key: str) -> tuple[str, str, str] | None:
+    """旧形式のキーを (名前, 日付, テナント) に分解（形式外は None）"""
+    parts = key.split(":", 2)
+    if len(parts) != 3 or parts[0] not in ("docs_top", "chunks_top"):
+        return None
+    try:
+        dt.date.fromisoformat(parts[1])
+    except ValueError:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+def migrate_legacy_top(rc: Any, batch: int = 500) -> int:
+    """旧形式のハッシュ（docs_top:* / chunks_top:*）を全期間分ソート済み集合へ移行する
+
+    rollup_tenant の移行はロールアップ対象期間内の日に限られるため、
+    それより古い日も SCAN で見つけて移行する。移行元の失効期限は移行先へ引き継ぐ。
+    ロールアップと同じロックの下で呼ぶこと（並行して移行すると二重に加算される）。
+    全件を移行し終えたら完了の目印を置き、以降は走査しない
+    （移行後に旧バージョンのワーカーが書いた直近の日は rollup_tenant が移行する）。
+
+    Returns:
+        移行したキー数
+    """
+    if rc.exists(LEGACY_MIGRATED_KEY):
+        return 0
+    keys = [
+        key
+        for pattern in ("docs_top:*", "chunks_top:*")
+        for key in rc.scan_iter(match=pattern, count=batch)
+        if _parse_legacy_key(key) is not None
+    ]
+    for start in range(0, len(keys), batch):
+        chunk = keys[start : start + batch]
+        pipe = rc.pipeline(transaction=False)
+        for key in chunk:
+            pipe.hgetall(key)
+            pipe.pttl(key)
+        values = iter(pipe.execute())
+
+        pipe = rc.pipeline(transaction=False)
+        for key in chunk:
+            counts, ttl = next(values) or {}, next(values)
+            name, day, tenant = _parse_legacy_key(key)
+            new_key = day_keys(day, tenant)[name]
+            for member, cnt in counts.items():
+                pipe.zincrby(new_key, int(cnt or 0), member)
+            trim_top(pipe, new_key)
+            if ttl and ttl > 0:
+                pipe.pexpire(new_key, ttl)
+            pipe.delete(key)
+        pipe.execute()
+    rc.set(LEGACY_MIGRATED_KEY, dt.datetime.now(JST).isoformat())
+    return len(keys)
+
+
+def rollup_tenant(rc: Any, tenant: str, today: dt.date | None = None) -> list[str]:
+    """閉じた週・月のうち未構築のものをロールアップする
+
+    Returns:
+        新たに構築したバケットのラベル一覧
+    """
+    today = today or today_jst()
+    lookback = max(7, settings.report_rollup_lookback_days)
+    window_start = today - dt.timedelta(days=lookback)
+    window_end = today - dt.timedelta(days=1)
+
+    candidates: dict[str, Bucket] = {}
+    for d in daterange(window_start, window_end):
+        for b in (week_bucket(d), month_bucket(d)):
+            if b.start >= window_start and b.end < today:
+                candidates.setdefault(b.label, b)
+    _migrate_and_trim_days(rc, tenant, list(daterange(window_start, today)))
+    if not candidates:
+        return []
+
+    buckets = sorted(candidates.values(), key=lambda b: (b.start, b.kind))
+    pipe = rc.pipeline(transaction=False)
+    for b in buckets:
+        pipe.exists(rollup_keys(b.label, tenant)["summary"])
+    built: list[str] = []
+    for b, exists in zip(buckets, pipe.execute()):
+        if exists:
+            continue
+        _rollup_bucket(rc, tenant, b, today)
+        built.append(b.label)
+    return built
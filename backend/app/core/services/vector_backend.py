@@ -0,0 +1,222 @@
+"""
+ベクトルバックエンドモジュール
+RAGEngine が利用するベクトル格納・検索の共通インターフェースと、
+Chroma コレクションによる実装を提供する
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any
+
+from langchain_core.documents import Document
+
+
+def tenant_where(
+    tenant: str | None, where: dict[str, Any] | None = None
+) -> dict[str, Any] | None:
+    """テナント条件と追加条件を Chroma の where 形式に合成"""
+    conditions: list[dict[str, Any]] = []
+    if tenant is not None:
+        conditions.append({"tenant": {"$eq": tenant}})
+    if where:
+        conditions.append(where)
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def matches_where(metadata: dict[str, Any], where: dict[str, Any] | None) -> bool:
+    """Chroma の where 形式（$eq/$ne/$in/$nin/$and/$or）をメタデータに評価"""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            for op, expected in cond.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+class VectorBackend(ABC):
+    """ベクトルバックエンドの共通インターフェース
+
+    埋め込みは RAGEngine 側で計算し、バックエンドはベクトルと本文・メタデータの
+    格納と検索だけを担う。スコアは距離（小さいほど類似）で返す。
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def add(
+        self,
+        tenant: str | None,
+        ids: list[str],
+        texts: list[str],
+        embeddings: list[list[float]],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        """チャンクを追加"""
+
+    @abstractmethod
+    def delete(self, tenant: str | None, ids: list[str]) -> None:
+        """ID指定でチャンクを削除"""
+
+    @abstractmethod
+    def search(
+        self,
+        tenant: str | None,
+        query_embedding: list[float],
+        k: int,
+        where: dict[str, Any] | None = None,
+    ) -> list[tuple[Document, float]]:
+        """類似検索（距離の昇順）"""
+
+    @abstractmethod
+    def get(
+        self,
+        tenant: str | None,
+        where: dict[str, Any] | None = None,
+        ids: list[str] | None = None,
+        include_documents: bool = True,
+    ) -> dict[str, list[Any]]:
+        """条件に一致するチャンクを {"ids", "documents", "metadatas"} で取得"""
+
+    @abstractmethod
+    def get_embeddings(
+        self, tenant: str | None, ids: list[str]
+    ) -> dict[str, list[float]]:
+        """ID → 格納済みの埋め込み（再インデックスで既存ベクトルを再利用するため）"""
+
+    @abstractmethod
+    def tenants(self) -> list[str]:
+        """チャンクを格納しているテナント名の一覧（テナント未指定のチャンクは除く）"""
+
+    @abstractmethod
+    def count(self, tenant: str | None = None) -> int:
+        """チャンク数（tenant が None なら全体）"""
+
+    def space_for(self, tenant: str | None) -> str:
+        """テナントの検索で返す距離の種類（l2 / cosine / ip）"""
+        return "l2"
+
+    def reset(self) -> None:
+        """全データを削除"""
+
+    def info(self) -> dict[str, Any]:
+        """システム情報用の概要"""
+        return {"backend": self.name}
+
+
+class ChromaVectorBackend(VectorBackend):
+    """Chroma コレクション（全テナント共有、tenant メタデータで分離）"""
+
+    name = "chroma"
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    def add(self, tenant, ids, texts, embeddings, metadatas) -> None:
+        self.collection.upsert(
+            ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas
+        )
+
+    def delete(self, tenant, ids) -> None:
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def search(self, tenant, query_embedding, k, where=None):
+        res = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            where=tenant_where(tenant, where),
+            include=["documents", "metadatas", "distances"],
+        )
+        docs = (res.get("documents") or [[]])[0]
+        metas = (res.get("metadatas") or [[]])[0]
+        dists = (res.get("distances") or [[]])[0]
+        return [
+            (Document(page_content=doc or "", metadata=md or {}), float(dist))
+            for doc, md, dist in zip(docs, metas, dists)
+        ]
+
+    def get(self, tenant, where=None, ids=None, include_documents=True):
+        include = ["metadatas", "documents"] if include_documents else ["metadatas"]
+        got = self.collection.get(
+            ids=ids, where=tenant_where(tenant, where), include=include
+        )
+        return {
+            "ids": got.get("ids") or [],
+            "documents": got.get("documents") or [],
+            "metadatas": got.get("metadatas") or [],
+        }
+
+    def get_embeddings(self, tenant, ids):
+        if not ids:
+            return {}
+        got = self.collection.get(ids=ids, include=["embeddings"])
+        embeddings = got.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {cid: list(map(float, vec)) for cid, vec in zip(got["ids"], embeddings)}
+
+    def tenants(self, page_size: int = 5000) -> list[str]:
+        # Chroma に DISTINCT は無いため、メタデータだけをページ単位で走査する
+        found: set[str] = set()
+        offset = 0
+        while True:
+            got = self.collection.get(
+                include=["metadatas"], limit=page_size, offset=offset
+            )
+            metadatas = got.get("metadatas") or []
+            found.update(
+                md["tenant"] for md in metadatas if md and md.get("tenant") is not None
+            )
+            if len(metadatas) < page_size:
+                return sorted(found)
+            offset += page_size
+
+    def count(self, tenant=None) -> int:
+        if tenant is None:
+            return self.collection.count()
+        return len(self.get(tenant, include_documents=False)["ids"])
+
+    @property
+    def hnsw_params(self) -> dict[str, Any]:
+        """コレクション作成時に確定した HNSW パラメータ（未指定は Chroma の既定値）"""
+        metadata = self.collection.metadata or {}
+        return {
+            "space": metadata.get("hnsw:space", "l2"),
+            "construction_ef": metadata.get("hnsw:construction_ef", 100),
+            "search_ef": metadata.get("hnsw:search_ef", 10),
+            "m": metadata.get("hnsw:M", 16),
+        }
+
+    def space_for(self, tenant) -> str:
+        return self.hnsw_params["space"]
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "backend": self.name,
+            "collection_id": str(self.collection.id),
+            "collection_name": self.collection.name,
+            "hnsw": self.hnsw_params,
+            "vector_document_count": self.collection.count(),
+        }
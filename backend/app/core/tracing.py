@@ -0,0 +1,198 @@
+"""
+リクエストトレースモジュール
+1リクエスト内の各段階（認証 → レート制限 → 予算 → 検索 → 詰め込み → LLM → 計上 → 集計）を
+スパンとして記録し、遅いリクエスト・失敗したリクエストをワーカー内のリングバッファに残す
+
+- スパンは contextvars で親子関係を保持するため、同じリクエスト内で並行するタスクや
+  asyncio.to_thread のスレッドからも同じトレースにぶら下がる
+- 保存はリクエストの終了後に決める（テールサンプリング）。TRACE_SLOW_MS 以上かかったもの
+  と 5xx・例外で終わったものは必ず残し、それ以外は TRACE_SAMPLE_RATE の割合だけ残す
+- トレースの外で呼ばれたスパンは何も記録しない（バックグラウンド処理・テスト）
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator, Union
+
+from .config import settings
+
+
+class Span:
+    """処理の1段階（開始・終了時刻、属性、子スパン）"""
+
+    __slots__ = ("name", "start", "end", "attributes", "children", "error")
+
+    def __init__(self, name: str, attributes: dict[str, Any] | None = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attributes: dict[str, Any] = dict(attributes or {})
+        self.children: list[Span] = []
+        self.error: str | None = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class _NoopSpan:
+    """トレースの外で使われるスパン（属性の設定を無視する）"""
+
+    def set(self, **attributes: Any) -> None:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+SpanLike = Union[Span, _NoopSpan]
+
+_current_span: ContextVar[Span | None] = ContextVar("tuukaa_span", default=None)
+
+
+class Trace:
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = datetime.now(timezone.utc)
+        self.root = Span(name, attributes)
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    @property
+    def failed(self) -> bool:
+        return self.root.error is not None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "failed": self.failed,
+            **self.root.to_dict(self.root.start),
+        }
+
+
+class TraceBuffer:
+    """テールサンプリングしたトレースのリングバッファ（古いものから捨てる）"""
+
+    def __init__(self, size: int):
+        self._traces: deque[Trace] = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+        self.seen = 0
+
+    def offer(self, trace: Trace) -> bool:
+        keep = (
+            trace.failed
+            or trace.duration * 1000 >= settings.trace_slow_ms
+            or random.random() < settings.trace_sample_rate
+        )
+        with self._lock:
+            self.seen += 1
+            if keep:
+                self._traces.append(trace)
+        return keep
+
+    def slowest(self, limit: int) -> list[Trace]:
+        with self._lock:
+            traces = list(self._traces)
+        return sorted(traces, key=lambda t: t.duration, reverse=True)[:limit]
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+            self.seen = 0
+
+
+buffer = TraceBuffer(settings.trace_buffer_size)
+
+
+def _record_error(span: Span, error: BaseException) -> None:
+    """例外をスパンに記録（status_code を持つ例外は 5xx のみ失敗として扱う）"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        span.set(status=status)
+    if status is None or status >= 500:
+        span.error = f"{type(error).__name__}: {error}"
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[SpanLike]:
+    """リクエスト全体のトレースを開始し、終了時にバッファへの保存を判断する"""
+    if not settings.tracing_enabled:
+        yield NOOP_SPAN
+        return
+    current = Trace(name, attributes)
+    token = _current_span.set(current.root)
+    try:
+        yield current.root
+    except BaseException as e:
+        _record_error(current.root, e)
+        raise
+    finally:
+        current.root.finish()
+        _current_span.reset(token)
+        buffer.offer(current)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[SpanLike]:
+    """現在のスパンの子スパンを記録（トレースの外では何もしない）"""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    current = Span(name, attributes)
+    parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _record_error(current, e)
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """現在のスパンに属性を追加（トレースの外では何もしない）"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def slowest(limit: int) -> list[dict[str, Any]]:
+    """バッファ内のトレースを所要時間の長い順に返す"""
+    return [t.to_dict() for t in buffer.slowest(limit)]
@@ -2,6 +2,14 @@
 依存性注入のためのヘルパー関数
 """
 
+import time
+from typing import AsyncIterator, Callable
+
+from fastapi import Header
+
+from .. import tracing
+from ..metrics import REQUEST_SECONDS
+from ..registry import tenant_from_key
 from ..services.rag_engine import RAGEngine
 
 # グローバルRAGエンジンインスタンス
@@ -13,6 +21,11 @@ async def initialize_rag_engine():
     await _rag_engine.initialize()
 
 
+async def shutdown_rag_engine():
+    """RAGエンジンが保持する共有リソースを解放"""
+    await _rag_engine.close()
+
+
 def get_rag_engine() -> RAGEngine:
     """RAGエンジンインスタンスを取得
     この関数は依存性注入のために使用されます
@@ -23,3 +36,25 @@ def get_rag_engine() -> RAGEngine:
 async def get_rag_system_info():
     """RAGエンジンのシステム情報を取得"""
     return await _rag_engine.get_system_info()
+
+
+def request_timer(endpoint: str) -> Callable[..., AsyncIterator[None]]:
+    """ハンドラ全体の所要時間をテナント別に記録し、リクエストのトレースを開始する依存関係
+
+    yield 以降は応答の送信後に実行されるため、SSE はストリームの終了までを含む。
+    """
+
+    async def dependency(
+        x_embed_key: str | None = Header(default=None, convert_underscores=True),
+    ) -> AsyncIterator[None]:
+        tenant = tenant_from_key(x_embed_key)
+        start = time.perf_counter()
+        try:
+            with tracing.trace(endpoint, tenant=tenant):
+                yield
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, endpoint=endpoint, tenant=tenant
+            )
+
+    return dependency
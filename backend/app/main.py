@@ -2,7 +2,10 @@
 FastAPIアプリケーションのメインエントリーポイント
 """
 
+import asyncio
 import logging
+import secrets
+import signal
 from contextlib import asynccontextmanager
 from datetime import datetime
 
@@ -11,28 +14,53 @@ try:
 except ImportError:
     from pytz import timezone as ZoneInfo  # それ以前はpytzを使う
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from .api import router as api_router
+from .api.reports import migrate_legacy_reports, run_rollup_loop
+from .core import metrics
 from .core.config import settings
-from .core.web.dependencies import get_rag_engine, initialize_rag_engine
+from .core.logs import configure_logging
+from .core.loop_monitor import start_monitor, stop_monitor
+from .core.profiling import ProfileMiddleware
+from .core.registry import reload_registry
+from .core.web.dependencies import (
+    get_rag_engine,
+    initialize_rag_engine,
+    shutdown_rag_engine,
+)
+from .core.services.maintenance import run_maintenance_loop
 from .core.services.rag_engine import RAGEngine
 from .models.schemas import HealthResponse
 
 # タイムゾーン設定
 JST = ZoneInfo("Asia/Tokyo")
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO if not settings.debug else logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# ロギング設定（出力は別スレッド）
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
+def _reload_on_sighup() -> None:
+    try:
+        reload_registry()
+    except Exception as e:
+        logger.error(f"SIGHUPによる設定の再読み込みに失敗しました: {e}")
+
+
+def _install_sighup_reload() -> None:
+    """SIGHUPでテナントキーと料金表を再読み込み（ワーカーの再起動不要）"""
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload_on_sighup)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        # Windows やメインスレッド外では登録できないため管理APIでの再読み込みのみ
+        pass
+
+
 # NOTE
 # @asynccontextmanager を使った関数は、FastAPIのライフサイクル管理（アプリケーションの起動時・終了時の処理）に利用できる
 @asynccontextmanager
@@ -49,9 +77,29 @@ async def lifespan(app: FastAPI):
         logger.error(f"RAGエンジンの初期化に失敗しました: {e}")
         raise
 
+    _install_sighup_reload()
+    start_monitor()
+
+    migration_task = asyncio.create_task(migrate_legacy_reports())
+
+    rollup_task: asyncio.Task | None = None
+    if settings.report_rollup_interval_seconds > 0:
+        rollup_task = asyncio.create_task(run_rollup_loop())
+
+    maintenance_task: asyncio.Task | None = None
+    if settings.maintenance_interval_seconds > 0:
+        maintenance_task = asyncio.create_task(run_maintenance_loop(get_rag_engine()))
+
     yield
 
     logger.info("アプリケーション終了中...")
+    migration_task.cancel()
+    if rollup_task is not None:
+        rollup_task.cancel()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    await stop_monitor()
+    await shutdown_rag_engine()
 
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
@@ -75,6 +123,22 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+async def metrics_endpoint(
+    authorization: str | None = Header(default=None),
+) -> Response:
+    """Prometheus 形式のメトリクス（このワーカーの値）"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = settings.metrics_auth_token
+    if not token:
+        # 本番ではトークンなしで公開しない（起動時の検証に加えた保険）
+        if not settings.debug:
+            raise HTTPException(status_code=404, detail="Not Found")
+    elif not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 def create_app() -> FastAPI:
     """FastAPIアプリケーションを作成
     Returns:
@@ -112,6 +176,9 @@ def create_app() -> FastAPI:
     # セキュリティヘッダー（全環境で適用）
     app.add_middleware(SecurityHeadersMiddleware)
 
+    # 管理者が要求したリクエストのプロファイル（X-Profile: 1）
+    app.add_middleware(ProfileMiddleware)
+
     # セキュリティ設定
     if not settings.debug:
         app.add_middleware(
@@ -119,6 +186,9 @@ def create_app() -> FastAPI:
         )
 
     app.include_router(api_router, prefix="/api/v1")
+    app.add_api_route(
+        "/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False
+    )
 
     return app
 
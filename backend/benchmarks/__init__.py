@@ -0,0 +1,9 @@
+"""
+ベンチマーク（手動実行用。pytest の通常テストには含めない）
+"""
+
+import os
+
+# app.core.config を import する前に最低限の環境変数を設定（tests/conftest.py と同様）
+os.environ.setdefault("DEBUG", "true")
+os.environ.setdefault("EMBED_ALLOWED_ORIGINS", "http://localhost")
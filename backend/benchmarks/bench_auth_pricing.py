@@ -0,0 +1,69 @@
+"""
+リクエストごとの認証（テナント解決）と料金算出のマイクロベンチマーク
+
+旧実装（毎回 EMBED_API_KEYS / MODEL_PRICING を再解析して線形探索）と、
+構築済みのテナントキー索引・料金表（app.core.registry）を比較する。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_auth_pricing --tenants 50 --models 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+
+from app.core import registry
+from app.core.config import settings
+
+
+def legacy_request(key: str, model: str) -> tuple[str | None, float]:
+    """/ask 1回分の旧処理: テナント解決 + 料金表の解析2回（事前見積り・事後計上）"""
+    tenant = None
+    for t, k in settings.embed_api_keys_map.items():
+        if k == key:
+            tenant = t
+            break
+    total = 0.0
+    for _ in range(2):
+        inout = settings.model_pricing_inout_map.get(model)
+        usd_in, usd_out = inout if inout else (0.15e-6, 0.60e-6)
+        total += (usd_in + usd_out) * settings.usd_jpy_rate
+    return tenant, total
+
+
+def compiled_request(key: str, model: str) -> tuple[str | None, float]:
+    tenant = registry.tenant_from_key(key)
+    total = 0.0
+    for _ in range(2):
+        jpy_in, jpy_out = registry.jpy_per_token(model)
+        total += jpy_in + jpy_out
+    return tenant, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--models", type=int, default=10)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    settings.embed_api_keys = ",".join(
+        f"tenant-{i}:key-{i:04d}-{'x' * 24}" for i in range(args.tenants)
+    )
+    settings.model_pricing = ",".join(
+        f"model-{i}:in=0.{i + 1}:out={i + 1}.0" for i in range(args.models)
+    )
+    # 最悪ケース（末尾のテナント・モデル）で比較
+    key = f"key-{args.tenants - 1:04d}-{'x' * 24}"
+    model = f"model-{args.models - 1}"
+    assert legacy_request(key, model)[0] == compiled_request(key, model)[0]
+
+    for name, fn in (("legacy", legacy_request), ("compiled", compiled_request)):
+        best = min(timeit.repeat(lambda: fn(key, model), number=args.number, repeat=5))
+        print(f"{name:8s}: {best / args.number * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
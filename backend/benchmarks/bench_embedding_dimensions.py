@@ -0,0 +1,144 @@
+"""
+埋め込み次元数の比較（メモリ・検索遅延・recall@k）
+
+ローカルの偽埋め込み（文字 n-gram のハッシュを固定の乱数射影で 1536 次元にしたもの）で
+合成コーパスを埋め込み、先頭次元の切り詰め＋再正規化（text-embedding-3 の dimensions 指定と
+同じ変換）で各次元数に短縮して flat バックエンドに投入する。
+最大次元の厳密解に対する recall@k、p50/p95 遅延、常駐メモリを出力し、
+EMBEDDING_DIMENSIONS を決める目安にする（API キー不要・ネットワーク不要）。
+
+偽埋め込みは、実モデル同様に先頭の次元ほど情報量が多くなるよう次元ごとの尺度を減衰させている。
+実データでの判断には、同じ表を実際の埋め込み（--vectors）で取り直すこと。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_embedding_dimensions --rows 20000 --dims 256,512,1536
+    python -m benchmarks.bench_embedding_dimensions --vectors corpus.npy --json dims.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.core.services.flat_index import FlatVectorBackend
+
+from .bench_vector_backends import TENANT, exact_topk, load, measure
+
+FULL_DIMENSIONS = 1536
+
+
+class MatryoshkaFakeEmbedding:
+    """文字 3-gram のハッシュ特徴を乱数射影した決定的な偽埋め込み
+
+    射影行列の列ごとの尺度を減衰させ、先頭次元に情報を寄せる（短縮しても近傍が保たれる）。
+    """
+
+    def __init__(self, dimensions: int = FULL_DIMENSIONS, buckets: int = 4096):
+        rng = np.random.default_rng(42)
+        decay = 1.0 / np.sqrt(1.0 + np.arange(dimensions) / 64.0)
+        self.projection = (rng.normal(size=(buckets, dimensions)) * decay).astype(
+            np.float32
+        )
+        self.buckets = buckets
+
+    def _features(self, text: str) -> np.ndarray:
+        counts = np.zeros(self.buckets, dtype=np.float32)
+        padded = f"  {text}  "
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i : i + 3].encode(), digest_size=4)
+            counts[int.from_bytes(digest.digest(), "little") % self.buckets] += 1.0
+        return counts
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.stack([self._features(t) for t in texts]) @ self.projection
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32)
+
+
+def synthetic_texts(count: int, seed: int) -> list[str]:
+    """トピックごとの語彙から文を作る（同じトピックの文同士が近くなる）"""
+    rng = np.random.default_rng(seed)
+    syllables = ["ka", "shi", "to", "ne", "ru", "mi", "so", "ha", "ku", "ze", "po"]
+    topics = [
+        ["".join(rng.choice(syllables, size=3)) for _ in range(30)] for _ in range(64)
+    ]
+    common = ["".join(rng.choice(syllables, size=2)) for _ in range(50)]
+    texts = []
+    for _ in range(count):
+        topic = topics[rng.integers(len(topics))]
+        words = list(rng.choice(topic, size=8)) + list(rng.choice(common, size=4))
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+    return texts
+
+
+def shorten_all(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    head = vectors[:, :dimensions]
+    return (head / np.linalg.norm(head, axis=1, keepdims=True)).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--dims", default="256,512,1536")
+    parser.add_argument(
+        "--vectors", help="実際の埋め込みの .npy ファイル（N×1536 など）"
+    )
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    args = parser.parse_args()
+
+    if args.vectors:
+        data = np.load(args.vectors).astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+        corpus, queries = data[: -args.queries][: args.rows], data[-args.queries :]
+    else:
+        embedder = MatryoshkaFakeEmbedding()
+        corpus = embedder.embed(synthetic_texts(args.rows, seed=0))
+        queries = embedder.embed(synthetic_texts(args.queries, seed=1))
+    truth = exact_topk(corpus, queries, args.k)
+
+    print(
+        f"rows={len(corpus)} full_dim={corpus.shape[1]} queries={len(queries)} "
+        f"k={args.k}\n"
+        f"{'dims':>5s} {'MiB':>8s} {'load_s':>7s} {'p50_ms':>7s} {'p95_ms':>7s} "
+        f"{'recall':>7s}"
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for dims in [int(d) for d in args.dims.split(",") if d]:
+            dims = min(dims, corpus.shape[1])
+            backend = FlatVectorBackend(Path(tmp) / f"d{dims}", "float32")
+            load_s = load(backend, shorten_all(corpus, dims))
+            r = measure(backend, shorten_all(queries, dims), truth, args.k)
+            mib = backend.info()["resident_bytes"] / 2**20
+            results.append(
+                {
+                    "dimensions": dims,
+                    "resident_mib": round(mib, 2),
+                    "load_s": round(load_s, 3),
+                    **{key: round(value, 4) for key, value in r.items()},
+                }
+            )
+            print(
+                f"{dims:5d} {mib:8.1f} {load_s:7.2f} {r['p50_ms']:7.2f} "
+                f"{r['p95_ms']:7.2f} {r['recall']:7.3f}"
+            )
+            backend.drop(TENANT)
+
+    if args.json:
+        report = {"rows": len(corpus), "k": args.k, "results": results}
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
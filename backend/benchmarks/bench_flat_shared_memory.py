@@ -0,0 +1,129 @@
+"""
+flat インデックスの複数ワーカー間メモリ共有ベンチマーク
+
+1テナント分のインデックスをセグメントファイルとして作成し、4つのワーカープロセスが
+それぞれ FlatVectorBackend で開いて全件検索した後の RSS / PSS（比例配分後の実メモリ）を
+/proc/self/smaps_rollup から取得する。比較として各ワーカーが行列をヒープに
+コピーした場合（従来のワーカーごとのインデックス）も測定する。
+
+続けて親プロセスが新しいセグメントを公開し、各ワーカーが再起動なしで
+追加分を検索できることを確認する。
+
+実行例（Linux のみ）:
+    cd backend
+    python -m benchmarks.bench_flat_shared_memory --rows 200000 --dim 256 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.core.services.flat_index import FlatVectorBackend
+
+TENANT = "bench"
+
+
+def memory_kb() -> dict[str, int]:
+    fields: dict[str, int] = {}
+    with open("/proc/self/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] in ("Rss:", "Pss:", "Shared_Clean:"):
+                fields[parts[0].rstrip(":").lower()] = int(parts[1])
+    return fields
+
+
+def populate(root: Path, rows: int, dim: int, batch: int = 20000) -> None:
+    rng = np.random.default_rng(0)
+    backend = FlatVectorBackend(root)
+    for offset in range(0, rows, batch):
+        n = min(batch, rows - offset)
+        ids = [str(offset + i) for i in range(n)]
+        backend.add(
+            TENANT,
+            ids,
+            [f"chunk {i}" for i in ids],
+            rng.normal(size=(n, dim)).astype(np.float32),
+            [{"tenant": TENANT} for _ in ids],
+        )
+
+
+def worker(root: str, private: bool, dim: int, conn) -> None:
+    backend = FlatVectorBackend(Path(root))
+    snap = backend._snapshot(TENANT)
+    if private:
+        # 従来方式の再現: ワーカーごとに行列をヒープへ読み込む
+        for seg in snap.segments:
+            seg.vectors = np.array(seg.vectors)
+            seg.sq_norms = np.array(seg.sq_norms)
+    query = np.ones(dim, dtype=np.float32).tolist()
+    for _ in range(3):
+        backend.search(TENANT, query, 10)
+    conn.send({"count": backend.count(TENANT), **memory_kb()})
+    conn.recv()  # 親が新しいセグメントを公開するまで待つ
+    hits = backend.search(TENANT, query, 1, where={"tenant": "bench-new"})
+    conn.send({"count": backend.count(TENANT), "new_visible": bool(hits)})
+
+
+def run(root: Path, workers: int, private: bool, dim: int) -> None:
+    ctx = mp.get_context("spawn")
+    pipes, procs = [], []
+    for _ in range(workers):
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(target=worker, args=(str(root), private, dim, child))
+        proc.start()
+        pipes.append(parent)
+        procs.append(proc)
+    stats = [p.recv() for p in pipes]
+
+    label = "private copy" if private else "shared mmap"
+    print(f"--- {label} ---")
+    for i, s in enumerate(stats):
+        print(
+            f"worker{i}: rows={s['count']} rss={s['rss'] / 1024:7.1f} MiB "
+            f"pss={s['pss'] / 1024:7.1f} MiB shared={s['shared_clean'] / 1024:7.1f} MiB"
+        )
+    print(f"total pss: {sum(s['pss'] for s in stats) / 1024:.1f} MiB")
+
+    # 書き込み側が新しいセグメントを公開 → 各ワーカーは manifest の変化で取り込む
+    FlatVectorBackend(root).add(
+        TENANT,
+        [f"new-{label}"],
+        ["new chunk"],
+        [[0.0] * dim],
+        [{"tenant": "bench-new"}],
+    )
+    for p in pipes:
+        p.send("go")
+    after = [p.recv() for p in pipes]
+    print(
+        "after publish: "
+        + ", ".join(f"rows={a['count']} new={a['new_visible']}" for a in after)
+    )
+    for proc in procs:
+        proc.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        populate(root, args.rows, args.dim)
+        matrix_mib = args.rows * args.dim * 4 / 2**20
+        print(f"rows={args.rows} dim={args.dim} matrix={matrix_mib:.1f} MiB")
+        run(root, args.workers, private=False, dim=args.dim)
+        run(root, args.workers, private=True, dim=args.dim)
+
+
+if __name__ == "__main__":
+    main()
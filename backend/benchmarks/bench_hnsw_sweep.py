@@ -0,0 +1,185 @@
+"""
+HNSW パラメータのスイープ（recall@k と検索遅延）
+
+space / M / construction_ef / search_ef の組み合わせごとに Chroma コレクションを作成し、
+同じクエリを検索して厳密解（全件探索）に対する recall@k と p50/p95 遅延、構築時間を出力する。
+結果を見て HNSW_* 設定（テナント別なら HNSW_TENANTS）を決める。
+
+ベクトルは合成データのほか、.npy（N×d）や既存の Chroma 永続ディレクトリからも読み込める。
+実データを使う場合、クエリはコーパスから抜き出した行を使う。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_hnsw_sweep --rows 20000 --dim 256 \\
+        --space l2,cosine --m 16,32 --construction-ef 100,200 --search-ef 10,50,100
+    python -m benchmarks.bench_hnsw_sweep --chroma-path ./chroma_db --json sweep.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+
+from .bench_vector_backends import synthetic_corpus
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def load_vectors(args: argparse.Namespace) -> tuple[np.ndarray, np.ndarray]:
+    """コーパスとクエリを読み込む（実データはコーパスから queries 行を抜き出す）"""
+    if args.vectors or args.chroma_path:
+        if args.vectors:
+            data = np.load(args.vectors).astype(np.float32)
+        else:
+            client = chromadb.PersistentClient(
+                path=args.chroma_path,
+                settings=ChromaSettings(anonymized_telemetry=False),
+            )
+            got = client.get_collection(args.collection).get(include=["embeddings"])
+            data = np.asarray(got["embeddings"], dtype=np.float32)
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(data), size=min(args.queries, len(data)), replace=False)
+        rest = np.setdiff1d(np.arange(len(data)), picked)
+        return data[rest][: args.rows], data[picked]
+    return synthetic_corpus(args.rows, args.dim, args.queries)
+
+
+def exact_topk(
+    corpus: np.ndarray, queries: np.ndarray, k: int, space: str
+) -> list[set[int]]:
+    """space ごとの厳密な上位k件（Chroma と同じ距離定義）"""
+    dots = queries @ corpus.T
+    if space == "ip":
+        dists = 1.0 - dots
+    elif space == "cosine":
+        norms = np.linalg.norm(queries, axis=1)[:, None] * np.linalg.norm(
+            corpus, axis=1
+        )
+        dists = 1.0 - dots / np.maximum(norms, 1e-12)
+    else:
+        dists = (corpus**2).sum(axis=1)[None, :] - 2.0 * dots
+    return [set(np.argpartition(row, k - 1)[:k].tolist()) for row in dists]
+
+
+def run_one(
+    client,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: list[set[int]],
+    k: int,
+    params: dict[str, object],
+    batch: int = 2000,
+) -> dict[str, object]:
+    collection = client.create_collection(
+        f"sweep-{uuid.uuid4().hex[:12]}",
+        metadata={
+            "hnsw:space": params["space"],
+            "hnsw:M": params["m"],
+            "hnsw:construction_ef": params["construction_ef"],
+            "hnsw:search_ef": params["search_ef"],
+        },
+    )
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch):
+        block = corpus[offset : offset + batch]
+        collection.add(
+            ids=[str(offset + i) for i in range(len(block))],
+            embeddings=block.tolist(),
+        )
+    build_s = time.perf_counter() - start
+
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k)
+    latencies: list[float] = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        res = collection.query(
+            query_embeddings=[query.tolist()], n_results=k, include=[]
+        )
+        latencies.append(time.perf_counter() - start)
+        hits += len({int(i) for i in res["ids"][0]} & expected)
+    client.delete_collection(collection.name)
+    lat = np.array(latencies) * 1000
+    return {
+        **params,
+        "build_s": round(build_s, 3),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "recall": round(hits / (len(truth) * k), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--space", default="l2,cosine")
+    parser.add_argument("--m", default="16,32")
+    parser.add_argument("--construction-ef", default="100,200")
+    parser.add_argument("--search-ef", default="10,50,100")
+    parser.add_argument("--vectors", help="コーパスの .npy ファイル（N×d）")
+    parser.add_argument("--chroma-path", help="既存の Chroma 永続ディレクトリ")
+    parser.add_argument("--collection", default="langchain")
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    args = parser.parse_args()
+
+    corpus, queries = load_vectors(args)
+    spaces = [s for s in args.space.split(",") if s]
+    truths = {space: exact_topk(corpus, queries, args.k, space) for space in spaces}
+
+    print(
+        f"rows={len(corpus)} dim={corpus.shape[1]} queries={len(queries)} k={args.k}\n"
+        f"{'space':7s} {'M':>4s} {'c_ef':>5s} {'s_ef':>5s} {'build_s':>8s} "
+        f"{'p50_ms':>7s} {'p95_ms':>7s} {'recall':>7s}"
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(
+            path=tmp, settings=ChromaSettings(anonymized_telemetry=False)
+        )
+        for space, m, c_ef, s_ef in itertools.product(
+            spaces,
+            _ints(args.m),
+            _ints(args.construction_ef),
+            _ints(args.search_ef),
+        ):
+            params = {
+                "space": space,
+                "m": m,
+                "construction_ef": c_ef,
+                "search_ef": s_ef,
+            }
+            r = run_one(client, corpus, queries, truths[space], args.k, params)
+            results.append(r)
+            print(
+                f"{space:7s} {m:4d} {c_ef:5d} {s_ef:5d} {r['build_s']:8.2f} "
+                f"{r['p50_ms']:7.2f} {r['p95_ms']:7.2f} {r['recall']:7.3f}"
+            )
+
+    if args.json:
+        report = {
+            "rows": len(corpus),
+            "dim": int(corpus.shape[1]),
+            "k": args.k,
+            "results": results,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+同時アップロード時の書き込みスループット比較
+
+小さなアップロード（数チャンク）を多数同時に発行し、
+- direct: アップロードごとにバックエンドへ書き込む（従来方式、書き込みは直列化）
+- writer: CollectionWriter でまとめて書き込む
+の所要時間・チャンク/秒・バックエンド書き込み回数を Chroma と flat で比較する。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_ingest_writer --uploads 200 --chunks 5 --dim 256
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+
+from app.core.services.flat_index import FlatVectorBackend
+from app.core.services.ingest_writer import CollectionWriter
+from app.core.services.vector_backend import ChromaVectorBackend, VectorBackend
+
+TENANT = "bench"
+
+
+def make_uploads(uploads: int, chunks: int, dim: int) -> list[tuple]:
+    rng = np.random.default_rng(0)
+    result = []
+    for u in range(uploads):
+        ids = [f"{u}-{i}" for i in range(chunks)]
+        result.append(
+            (
+                ids,
+                [f"upload {u} chunk {i}" for i in range(chunks)],
+                rng.normal(size=(chunks, dim)).astype(np.float32).tolist(),
+                [{"tenant": TENANT, "file_id": str(u)} for _ in ids],
+            )
+        )
+    return result
+
+
+async def run_direct(backend: VectorBackend, uploads: list[tuple]) -> int:
+    lock = asyncio.Lock()
+    calls = 0
+
+    async def one(ids, texts, embeddings, metadatas):
+        nonlocal calls
+        async with lock:
+            await asyncio.to_thread(
+                backend.add, TENANT, ids, texts, embeddings, metadatas
+            )
+            calls += 1
+
+    await asyncio.gather(*(one(*u) for u in uploads))
+    return calls
+
+
+async def run_writer(backend: VectorBackend, uploads: list[tuple]) -> int:
+    writer = CollectionWriter(backend, TENANT)
+    await asyncio.gather(*(writer.add(*u) for u in uploads))
+    await writer.close()
+    return writer.flushes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+
+    uploads = make_uploads(args.uploads, args.chunks, args.dim)
+    total = args.uploads * args.chunks
+    print(
+        f"uploads={args.uploads} chunks/upload={args.chunks} dim={args.dim}\n"
+        f"{'backend':8s} {'mode':7s} {'seconds':>8s} {'chunks/s':>9s} {'writes':>7s}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(
+            path=str(Path(tmp) / "chroma"),
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+        for mode, runner in (("direct", run_direct), ("writer", run_writer)):
+            backends: list[tuple[str, VectorBackend]] = [
+                ("chroma", ChromaVectorBackend(client.create_collection(mode))),
+                ("flat", FlatVectorBackend(Path(tmp) / f"flat-{mode}")),
+            ]
+            for name, backend in backends:
+                start = time.perf_counter()
+                writes = asyncio.run(runner(backend, uploads))
+                elapsed = time.perf_counter() - start
+                assert backend.count(TENANT) == total
+                print(
+                    f"{name:8s} {mode:7s} {elapsed:8.2f} {total / elapsed:9.0f} "
+                    f"{writes:7d}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+RAG チェーン構築コストのマイクロベンチマーク
+
+リクエストごとに PromptTemplate の解析・Runnable グラフの構築・ChatOpenAI の生成を行う
+旧実装と、(model, 温度バケット, max_tokens) ごとに構築済みチェーンを再利用する
+現行実装（RAGEngine._get_chain）を、応答を即時に返す偽のチャットモデルで比較する。
+ChatOpenAI の生成コスト（キャッシュミス時）も共有 HTTP クライアントの有無で計測する。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_rag_chain --iterations 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.core.services.rag_engine import RAGEngine
+
+CONTEXT = "就業規則の第3条によれば、勤怠の申請は前日までに行う必要があります。" * 20
+QUESTION = "勤怠の申請方法は?"
+
+
+def _fake_llm() -> FakeListChatModel:
+    return FakeListChatModel(responses=["回答です。"])
+
+
+async def legacy_request(llm: FakeListChatModel) -> None:
+    """旧実装: リクエストごとにプロンプトとチェーンを構築"""
+    prompt = PromptTemplate.from_template(RAGEngine.RAG_PROMPT_TEMPLATE)
+    chain = {"context": lambda x: CONTEXT, "question": RunnablePassthrough()} | (
+        prompt | llm
+    )
+    await chain.ainvoke(QUESTION)
+
+
+async def cached_request(engine: RAGEngine) -> None:
+    chain, _ = engine._get_chain(None, 0.2, None)
+    await chain.ainvoke({"context": CONTEXT, "question": QUESTION})
+
+
+async def _timeit(fn, iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def _construct_chat_openai(iterations: int, shared: bool) -> float:
+    kwargs = {}
+    if shared:
+        kwargs = {
+            "http_client": httpx.Client(),
+            "http_async_client": httpx.AsyncClient(),
+        }
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        ChatOpenAI(model="gpt-4o-mini", api_key="sk-bench", **kwargs)
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    llm = _fake_llm()
+    engine = RAGEngine()
+    engine._create_llm = lambda *a: _fake_llm()  # type: ignore[method-assign]
+
+    legacy = await _timeit(lambda: legacy_request(llm), args.iterations)
+    cached = await _timeit(lambda: cached_request(engine), args.iterations)
+    print(f"per-request chain build : {legacy:8.1f} us/request")
+    print(f"cached chain (LRU={settings.llm_cache_size:3d}) : {cached:8.1f} us/request")
+
+    n = max(1, args.iterations // 20)
+    print(f"ChatOpenAI() own client : {_construct_chat_openai(n, False):8.1f} us")
+    print(f"ChatOpenAI() shared     : {_construct_chat_openai(n, True):8.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""
+/admin/reports/summary の集計ベンチマーク
+
+365日分の合成データをローカルのRedis代替（fakeredis）に投入し、
+日ごとに逐次コマンドを発行する旧実装、日次キーを1回のパイプラインで取得する実装、
+週次・月次ロールアップを使う現行実装の往復回数・所要時間を比較する。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_reports_summary --days 365 --rtt-ms 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import random
+import statistics
+import time
+from typing import Any
+
+import fakeredis
+
+from app.core.config import settings
+from app.core.services.report_rollup import (
+    Bucket,
+    daterange,
+    fetch_summary,
+    plan_buckets,
+    rollup_tenant,
+)
+
+TENANT = "bench"
+
+
+class LatencyRedis(fakeredis.FakeRedis):
+    """往復ごとに疑似ネットワーク遅延を加え、往復回数を数える fakeredis"""
+
+    def __init__(self, *args: Any, rtt: float = 0.0, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.rtt = rtt
+        self.round_trips = 0
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        self._round_trip()
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> Any:
+        pipe = super().pipeline(transaction=transaction, shard_hint=shard_hint)
+        original_execute = pipe.execute
+
+        def execute(*args: Any, **kwargs: Any) -> Any:
+            self._round_trip()
+            return original_execute(*args, **kwargs)
+
+        pipe.execute = execute
+        return pipe
+
+
+def seed(rc: fakeredis.FakeRedis, start: dt.date, days: int, seed_: int = 0) -> None:
+    """docs_ask / docs_feedback と同じキー構成で合成データを投入"""
+    rnd = random.Random(seed_)
+    pipe = rc.pipeline(transaction=False)
+    for i in range(days):
+        day = (start + dt.timedelta(days=i)).strftime("%Y-%m-%d")
+        n = rnd.randint(5, 200)
+        pipe.set(f"metrics:{day}:{TENANT}:count", n)
+        pipe.set(f"tokens:{day}:{TENANT}", float(n * rnd.randint(300, 1200)))
+        pipe.set(f"cost:{day}:{TENANT}", n * 0.05)
+        zero = rnd.randint(0, n // 5)
+        pipe.hset(f"docs:{day}:{TENANT}", mapping={"hit": n - zero, "zero_hit": zero})
+        pipe.hset(
+            f"feedback:{day}:{TENANT}",
+            mapping={"yes": rnd.randint(0, n // 2), "no": rnd.randint(0, n // 4)},
+        )
+        clients = [f"client-{rnd.randint(0, 5000)}" for _ in range(n)]
+        pipe.pfadd(f"hll:{day}:{TENANT}:clients", *clients)
+        for _ in range(20):
+            pipe.zincrby(f"docs_rank:{day}:{TENANT}", 1, f"file-{rnd.randint(0, 50)}")
+    pipe.execute()
+
+
+def legacy_summary(rc: Any, tenant: str, d0: dt.date, d1: dt.date) -> dict[str, Any]:
+    """日ごとに逐次コマンドを発行する旧実装（比較用）"""
+    total_q = 0
+    total_tokens = 0.0
+    total_cost = 0.0
+    dau = 0
+    docs_top: dict[str, int] = {}
+    for d in daterange(d0, d1):
+        day = d.strftime("%Y-%m-%d")
+        total_q += int(rc.get(f"metrics:{day}:{tenant}:count") or 0)
+        dau += int(rc.pfcount(f"hll:{day}:{tenant}:clients") or 0)
+        total_tokens += float(rc.get(f"tokens:{day}:{tenant}") or 0)
+        total_cost += float(rc.get(f"cost:{day}:{tenant}") or 0)
+        rc.hgetall(f"docs:{day}:{tenant}")
+        rc.hgetall(f"feedback:{day}:{tenant}")
+        top = rc.zrange(f"docs_rank:{day}:{tenant}", 0, -1, withscores=True)
+        for k, v in top:
+            docs_top[k] = docs_top.get(k, 0) + int(v or 0)
+    return {"questions": total_q, "unique_users": dau, "tokens": total_tokens}
+
+
+def _measure(fn, rc: LatencyRedis, repeat: int) -> tuple[list[float], int]:
+    timings: list[float] = []
+    rc.round_trips = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings, rc.round_trips // repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--rtt-ms", type=float, default=0.2, help="1往復あたりの疑似遅延(ms)"
+    )
+    args = parser.parse_args()
+
+    rc = LatencyRedis(decode_responses=True, rtt=0.0)
+    d1 = dt.date.today()
+    d0 = d1 - dt.timedelta(days=args.days - 1)
+    seed(rc, d0, args.days)
+    rc.rtt = args.rtt_ms / 1000.0
+    days = [Bucket("day", d, d) for d in daterange(d0, d1)]
+
+    legacy_t, legacy_rt = _measure(
+        lambda: legacy_summary(rc, TENANT, d0, d1), rc, args.repeat
+    )
+    piped_t, piped_rt = _measure(
+        lambda: fetch_summary(rc, TENANT, days), rc, args.repeat
+    )
+    legacy = legacy_summary(rc, TENANT, d0, d1)
+    piped = fetch_summary(rc, TENANT, days)
+
+    # 閉じた週・月をロールアップしてから計画に沿って読む
+    today = d1 + dt.timedelta(days=1)
+    settings.report_rollup_lookback_days = args.days + 31
+    rc.rtt = 0.0
+    rollup_tenant(rc, TENANT, today=today)
+    rc.rtt = args.rtt_ms / 1000.0
+    rolled_t, rolled_rt = _measure(
+        lambda: fetch_summary(rc, TENANT, plan_buckets(rc, TENANT, d0, d1, today)),
+        rc,
+        args.repeat,
+    )
+    plan = plan_buckets(rc, TENANT, d0, d1, today)
+    rolled = fetch_summary(rc, TENANT, plan)
+
+    print(f"days={args.days} rtt={args.rtt_ms}ms repeat={args.repeat}")
+    print(
+        f"legacy  : round_trips={legacy_rt:5d} "
+        f"median={statistics.median(legacy_t):8.2f}ms"
+    )
+    print(
+        f"pipeline: round_trips={piped_rt:5d} "
+        f"median={statistics.median(piped_t):8.2f}ms"
+    )
+    print(
+        f"rollup  : round_trips={rolled_rt:5d} "
+        f"median={statistics.median(rolled_t):8.2f}ms buckets={len(plan)}"
+    )
+    print(
+        f"questions legacy={legacy['questions']} pipeline={piped['questions']} / "
+        f"unique_users legacy(sum of daily)={legacy['unique_users']} "
+        f"pipeline(PFCOUNT union)={piped['unique_users']} "
+        f"rollup={rolled['unique_users']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+ベクトルバックエンドの検索遅延・再現率の比較
+
+合成データ（クラスタ構造を持つ正規分布）を1テナント分投入し、
+Chroma（HNSW）と flat（float32 / float16 のメモリマップ全件探索）で
+同じクエリを検索して p50/p95 遅延と recall@k（厳密解との一致率）を出力する。
+
+実行例:
+    cd backend
+    python -m benchmarks.bench_vector_backends --rows 20000 --dim 256 --queries 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+
+from app.core.services.flat_index import FlatVectorBackend
+from app.core.services.vector_backend import ChromaVectorBackend, VectorBackend
+
+TENANT = "bench"
+
+
+def synthetic_corpus(
+    rows: int, dim: int, queries: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """埋め込みらしい偏りを持たせるため、クラスタ中心の周辺に点を生成"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, rows // 500), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=rows + queries)
+    points = centers[labels] + 0.35 * rng.normal(size=(rows + queries, dim))
+    points /= np.linalg.norm(points, axis=1, keepdims=True)
+    points = points.astype(np.float32)
+    return points[:rows], points[rows:]
+
+
+def exact_topk(corpus: np.ndarray, queries: np.ndarray, k: int) -> list[set[int]]:
+    dists = (
+        (corpus**2).sum(axis=1)[None, :]
+        - 2.0 * queries @ corpus.T
+        + (queries**2).sum(axis=1)[:, None]
+    )
+    return [set(np.argsort(row)[:k].tolist()) for row in dists]
+
+
+def load(backend: VectorBackend, corpus: np.ndarray, batch: int = 2000) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch):
+        block = corpus[offset : offset + batch]
+        ids = [str(offset + i) for i in range(len(block))]
+        backend.add(
+            TENANT,
+            ids,
+            [f"chunk {i}" for i in ids],
+            block.tolist(),
+            [{"tenant": TENANT, "row": int(i)} for i in ids],
+        )
+    return time.perf_counter() - start
+
+
+def measure(
+    backend: VectorBackend, queries: np.ndarray, truth: list[set[int]], k: int
+) -> dict[str, float]:
+    backend.search(TENANT, queries[0].tolist(), k)  # ウォームアップ
+    latencies: list[float] = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = backend.search(TENANT, query.tolist(), k)
+        latencies.append(time.perf_counter() - start)
+        hits += len({doc.metadata["row"] for doc, _ in results} & expected)
+    lat = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "recall": hits / (len(truth) * k),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(args.rows, args.dim, args.queries)
+    truth = exact_topk(corpus, queries, args.k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(
+            path=str(Path(tmp) / "chroma"),
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+        backends: list[tuple[str, VectorBackend]] = [
+            ("chroma(hnsw)", ChromaVectorBackend(client.create_collection("bench"))),
+            ("flat(float32)", FlatVectorBackend(Path(tmp) / "flat32", "float32")),
+            ("flat(float16)", FlatVectorBackend(Path(tmp) / "flat16", "float16")),
+        ]
+        print(
+            f"rows={args.rows} dim={args.dim} queries={args.queries} k={args.k}\n"
+            f"{'backend':15s} {'load_s':>8s} {'p50_ms':>8s} {'p95_ms':>8s} {'recall':>7s}"
+        )
+        for name, backend in backends:
+            load_s = load(backend, corpus)
+            r = measure(backend, queries, truth, args.k)
+            print(
+                f"{name:15s} {load_s:8.2f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+                f"{r['recall']:7.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+pytest-benchmark の結果（--benchmark-json）を比較し、遅くなったベンチマークを報告する
+
+基準からの変化率が閾値を超えて遅くなったものを REGRESSION として表示し、
+1件でもあれば終了コード 1 を返す（CI で使う）。片方にしかないベンチマークは表示のみ。
+
+実行例:
+    cd backend
+    python -m benchmarks.compare bench-results/base.json bench-results/new.json
+    python -m benchmarks.compare base.json new.json --metric min --threshold 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = ["min", "median", "mean", "max"]
+
+
+def load_stats(path: Path, metric: str) -> dict[str, float]:
+    """ベンチマーク名（fullname）→ 指定統計量（秒）"""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        bench.get("fullname") or bench["name"]: float(bench["stats"][metric])
+        for bench in data.get("benchmarks", [])
+    }
+
+
+def compare(
+    base: dict[str, float], new: dict[str, float], threshold: float
+) -> tuple[list[tuple[str, float, float, float, str]], int]:
+    """(名前, 基準, 今回, 変化率, 判定) の一覧と回帰件数"""
+    rows = []
+    regressions = 0
+    for name in sorted(base.keys() | new.keys()):
+        if name not in base or name not in new:
+            status = "new" if name not in base else "removed"
+            rows.append((name, base.get(name, 0.0), new.get(name, 0.0), 0.0, status))
+            continue
+        change = (new[name] - base[name]) / base[name] if base[name] else 0.0
+        if change > threshold:
+            status = "REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, base[name], new[name], change, status))
+    return rows, regressions
+
+
+def _format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.3f}s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.3f}ms"
+    return f"{value * 1e6:.1f}us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base", type=Path, help="基準の結果 JSON")
+    parser.add_argument("new", type=Path, help="比較する結果 JSON")
+    parser.add_argument("--metric", choices=METRICS, default="median")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="回帰とみなす変化率（0.10 = 10%% 遅化）",
+    )
+    args = parser.parse_args()
+
+    rows, regressions = compare(
+        load_stats(args.base, args.metric),
+        load_stats(args.new, args.metric),
+        args.threshold,
+    )
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'benchmark':<{width}}  {'base':>10}  {'new':>10}  {'change':>8}  status")
+    for name, base, new, change, status in rows:
+        print(
+            f"{name:<{width}}  {_format_seconds(base):>10}  {_format_seconds(new):>10}"
+            f"  {change:>+8.1%}  {status}"
+        )
+    print(
+        f"\n{regressions} regression(s) over {args.threshold:.0%}"
+        f" ({args.metric}, {len(rows)} benchmarks)"
+    )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
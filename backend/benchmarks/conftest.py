@@ -0,0 +1,244 @@
+"""
+リクエスト処理のホットパスのマイクロベンチマーク（pytest-benchmark）
+
+OpenAI API を使わないよう、ローカルの代替モデル（EMBEDDING_PROVIDER=local /
+CHAT_PROVIDER=fake）で実際の RAGEngine を組み立てる。抽出系のフィクスチャ文書は
+固定の内容から毎回同じものを生成する。
+
+実行例（通常のテストとは別に明示的に実行する）:
+    cd backend
+    python -m pytest benchmarks --benchmark-json=bench-results/base.json
+    python -m pytest benchmarks --benchmark-json=bench-results/new.json
+    python -m benchmarks.compare bench-results/base.json bench-results/new.json
+
+検索対象のチャンク数は BENCH_SEARCH_SIZES（既定 "1000,10000,100000"）、
+埋め込み次元数は BENCH_EMBEDDING_DIM（既定 256）で変えられる。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from app.core import config
+from app.core.services.rag_engine import RAGEngine
+
+SEARCH_SIZES = [
+    int(size)
+    for size in os.environ.get("BENCH_SEARCH_SIZES", "1000,10000,100000").split(",")
+    if size
+]
+EMBEDDING_DIM = int(os.environ.get("BENCH_EMBEDDING_DIM", "256"))
+BACKENDS = ["flat", "chroma"]
+CHUNKS_PER_FILE = 100
+
+SAMPLE_PARAGRAPH = (
+    "返品・交換は商品到着後30日以内に受け付けます。未使用かつタグが付いた状態に限ります。\n"
+    "送料は全国一律660円です。5,000円以上のご注文で送料無料になります。\n"
+    "お問い合わせは平日10時から18時まで、メールまたはお電話で承ります。\n\n"
+)
+
+
+def sample_text(chars: int) -> str:
+    repeats = chars // len(SAMPLE_PARAGRAPH) + 1
+    return (SAMPLE_PARAGRAPH * repeats)[:chars]
+
+
+def sample_html(chars: int) -> str:
+    body = "".join(
+        f"<div class='item'><h2>見出し {i}</h2><p>{SAMPLE_PARAGRAPH}</p>"
+        f"<script>var x{i} = {{a: {i}}};</script><style>.c{i}{{color:red}}</style>"
+        f"<noscript>JavaScript を有効にしてください</noscript></div>\n"
+        for i in range(chars // 400 + 1)
+    )
+    return f"<html><head><title>FAQ</title></head><body>{body}</body></html>"
+
+
+def _pdf_bytes(pages: int, lines_per_page: int = 40) -> bytes:
+    """テキストを含む最小構成の PDF（Helvetica・ASCII のみ）"""
+    objects: list[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # Pages（ページ数が決まってから埋める）
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = [
+            f"({'Page %d line %d: returns are accepted within 30 days.' % (page, i)}) Tj"
+            for i in range(lines_per_page)
+        ]
+        stream = ("BT /F1 10 Tf 50 780 Td 12 TL " + " T* ".join(lines) + " ET").encode()
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def _docx_bytes(paragraphs: int) -> bytes:
+    docx = pytest.importorskip("docx")
+
+    doc = docx.Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"{i}: {SAMPLE_PARAGRAPH.strip()}")
+    table = doc.add_table(rows=20, cols=4)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f"セル {r}-{c}"
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _pptx_bytes(slides: int) -> bytes:
+    pptx = pytest.importorskip("pptx")
+    from pptx.util import Inches
+
+    prs = pptx.Presentation()
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = f"スライド {i}"
+        box = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(8), Inches(4))
+        for line in SAMPLE_PARAGRAPH.strip().splitlines():
+            box.text_frame.add_paragraph().text = line
+        slide.notes_slide.notes_text_frame.text = f"ノート {i}"
+    buf = io.BytesIO()
+    prs.save(buf)
+    return buf.getvalue()
+
+
+def _xlsx_bytes(rows: int) -> bytes:
+    openpyxl = pytest.importorskip("openpyxl")
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "FAQ"
+    for i in range(rows):
+        ws.append([i, f"質問 {i}", SAMPLE_PARAGRAPH.strip()[:60], i * 1.5])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+_FIXTURE_BUILDERS = {
+    "pdf": lambda: _pdf_bytes(pages=20),
+    "txt": lambda: sample_text(200_000).encode("utf-8"),
+    "docx": lambda: _docx_bytes(paragraphs=300),
+    "pptx": lambda: _pptx_bytes(slides=30),
+    "xlsx": lambda: _xlsx_bytes(rows=2000),
+}
+FIXTURE_KINDS = list(_FIXTURE_BUILDERS)
+_fixture_cache: dict[str, bytes] = {}
+
+
+def fixture_file(kind: str) -> bytes:
+    """抽出ベンチマーク用の文書（内容は固定。生成用ライブラリがなければ skip）"""
+    if kind not in _fixture_cache:
+        _fixture_cache[kind] = _FIXTURE_BUILDERS[kind]()
+    return _fixture_cache[kind]
+
+
+@pytest.fixture(scope="session")
+def event_loop_for_bench():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def bench_engine(tmp_path_factory, event_loop_for_bench):
+    """ローカルの代替モデルで初期化した RAGEngine（テナントごとにバックエンドを割り当て）"""
+    root: Path = tmp_path_factory.mktemp("bench")
+    patch = pytest.MonkeyPatch()
+    overrides: dict[str, Any] = {
+        "persist_directory": str(root / "chroma"),
+        "flat_index_directory": str(root / "flat"),
+        "embedding_provider": "local",
+        "local_embedding_dimensions": EMBEDDING_DIM,
+        "embedding_cache_enabled": False,
+        "chat_provider": "fake",
+        "fake_chat_latency_ms": 0,
+        "fake_chat_tokens_per_second": 0,
+        "similarity_score_threshold": 1e9,
+        "vector_backend_tenants": ",".join(
+            f"{tenant_name(backend, size)}:{backend}"
+            for backend in BACKENDS
+            for size in SEARCH_SIZES
+        ),
+    }
+    for name, value in overrides.items():
+        patch.setattr(config.settings, name, value)
+    engine = RAGEngine()
+    event_loop_for_bench.run_until_complete(engine.initialize())
+    yield engine
+    event_loop_for_bench.run_until_complete(engine.close())
+    patch.undo()
+
+
+def tenant_name(backend: str, size: int) -> str:
+    return f"bench-{backend}-{size}"
+
+
+_populated: set[str] = set()
+
+
+def populate(engine: RAGEngine, backend_name: str, size: int) -> str:
+    """合成チャンクを直接バックエンドに投入したテナント（セッション中1回だけ作る）"""
+    tenant = tenant_name(backend_name, size)
+    if tenant in _populated:
+        return tenant
+    backend, key = engine._route(tenant)
+    rng = np.random.default_rng(size)
+    batch = 5000
+    for offset in range(0, size, batch):
+        n = min(batch, size - offset)
+        vectors = rng.normal(size=(n, EMBEDDING_DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        rows = range(offset, offset + n)
+        backend.add(
+            key,
+            [f"{tenant}-{i}" for i in rows],
+            [f"チャンク {i}: {SAMPLE_PARAGRAPH[: 80 + i % 200]}" for i in rows],
+            vectors.tolist(),
+            [
+                {
+                    "tenant": tenant,
+                    "file_id": f"file-{i // CHUNKS_PER_FILE}",
+                    "filename": f"doc-{i // CHUNKS_PER_FILE}.pdf",
+                    "chunk_index": i % CHUNKS_PER_FILE,
+                    "upload_time": "2025-01-01T00:00:00",
+                    "file_size": 123456,
+                }
+                for i in rows
+            ],
+        )
+    _populated.add(tenant)
+    return tenant
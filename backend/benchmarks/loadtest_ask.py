@@ -0,0 +1,531 @@
+"""
+/embed/docs/ask・/embed/docs/search のエンドツーエンド負荷試験
+
+実際の FastAPI アプリに並行リクエストを送り、操作別（JSON 回答・SSE 回答・検索）の
+スループット、p50/p95/p99 遅延、SSE の最初のバイトまでの時間（TTFB）、
+エラー・429・402 の割合を JSON で出力する。
+
+- 既定ではアプリをプロセス内で起動し、ASGI を直接呼ぶ（ネットワークを介さない）。
+  埋め込みはローカルのハッシュ埋め込み、LLM は遅延を再現する偽モデルを使うため
+  OpenAI API には接続しない。テナントごとに合成の FAQ 文書を /upload で投入する
+- --base-url を指定すると起動済みのサーバーに送る（--keys でテナントのキーを渡す）
+
+実行例:
+    cd backend
+    python -m benchmarks.loadtest_ask --concurrency 32 --duration 30 --tenants 8
+    python -m benchmarks.loadtest_ask --mix ask=1 --stream-ratio 1 --llm-latency-ms 800
+    python -m benchmarks.loadtest_ask --base-url http://localhost:8000 \\
+        --keys client-a:key-a,client-b:key-b --skip-seed --output result.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+import httpx
+
+API_PREFIX = "/api/v1/embed/docs"
+
+QUESTIONS = [
+    "返品の送料はどのくらいかかりますか",
+    "注文をキャンセルしたいのですが",
+    "営業時間を教えてください",
+    "支払い方法は何が使えますか",
+    "ポイントの有効期限はいつまでですか",
+    "配送日時を指定できますか",
+    "領収書を発行してもらえますか",
+    "会員登録のメールが届きません",
+]
+
+FAQ_TEMPLATES = [
+    "返品・交換は商品到着後{days}日以内に受け付けます。返品の送料は{fee}円です。",
+    "ご注文のキャンセルはマイページから発送準備前まで可能です（{tenant}）。",
+    "営業時間は平日{open}時から18時までです。土日祝日は休業です。",
+    "お支払いはクレジットカード、コンビニ払い、銀行振込に対応しています。",
+    "ポイントの有効期限は最終購入日から{days}か月です。",
+    "配送日時はご注文時に{days}日先まで指定できます。",
+    "領収書は発送完了メールのリンクから{tenant}名義で発行できます。",
+    "会員登録メールが届かない場合は迷惑メールフォルダをご確認ください。",
+]
+
+
+def _configure_env(args: argparse.Namespace, data_dir: str) -> dict[str, str]:
+    """プロセス内起動用の環境変数（app を import する前に設定する）"""
+    keys = {f"load-{i}": f"load-key-{i:04d}" for i in range(args.tenants)}
+    os.environ.update(
+        {
+            "DEBUG": "true",
+            "EMBED_ALLOWED_ORIGINS": "http://localhost",
+            "PERSIST_DIRECTORY": str(Path(data_dir) / "vectorstore"),
+            "FLAT_INDEX_DIRECTORY": str(Path(data_dir) / "flat_index"),
+            "UPLOAD_DIRECTORY": str(Path(data_dir) / "uploads"),
+            "EMBEDDING_CACHE_FILE": str(Path(data_dir) / "embeddings.sqlite3"),
+            "VECTOR_BACKEND": args.vector_backend,
+            "EMBEDDING_PROVIDER": "local",
+            "LOCAL_EMBEDDING_DIMENSIONS": str(args.embedding_dim),
+            "CHAT_PROVIDER": "fake",
+            "FAKE_CHAT_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_CHAT_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+            "FAKE_CHAT_ANSWER_TOKENS": str(args.llm_answer_tokens),
+            "EMBED_API_KEYS": ",".join(f"{t}:{k}" for t, k in keys.items()),
+            "RATE_LIMIT_RPM": str(args.rate_limit_rpm),
+            "DAILY_BUDGET_JPY": str(args.daily_budget_jpy),
+            # 接続を即座に拒否されるアドレスにして、集計はメモリ内のフォールバックで行う
+            "REDIS_URL": args.redis_url or "redis://127.0.0.1:1/0",
+            "MAINTENANCE_INTERVAL_SECONDS": "0",
+            "REPORT_ROLLUP_INTERVAL_SECONDS": "0",
+        }
+    )
+    return keys
+
+
+class _ASGIResponseStream(httpx.AsyncByteStream):
+    def __init__(self, queue: asyncio.Queue, task: asyncio.Task, disconnected):
+        self._queue = queue
+        self._task = task
+        self._disconnected = disconnected
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            message = await self._queue.get()
+            if message is None or message["type"] != "http.response.body":
+                return
+            if message.get("body"):
+                yield message["body"]
+            if not message.get("more_body", False):
+                return
+
+    async def aclose(self) -> None:
+        self._disconnected.set()
+        if not self._task.done():
+            self._task.cancel()
+        with contextlib.suppress(BaseException):
+            await self._task
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """本文をチャンク単位で返す ASGI トランスポート
+
+    httpx.ASGITransport は応答本文を最後まで溜めてから返すため、SSE の TTFB を測れない。
+    """
+
+    def __init__(self, app: Any, client: tuple[str, int] = ("127.0.0.1", 50000)):
+        self.app = app
+        self.client = client
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(k.lower(), v) for k, v in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port or 80),
+            "client": self.client,
+            "root_path": "",
+        }
+        queue: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+        request_sent = False
+
+        async def receive() -> dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def run() -> None:
+            try:
+                await self.app(scope, receive, queue.put)
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(run())
+        start = await queue.get()
+        if start is None:
+            # 応答を返す前にアプリが例外で終了した
+            await task
+            raise RuntimeError("アプリが応答を返しませんでした")
+        return httpx.Response(
+            start["status"],
+            headers=start.get("headers", []),
+            stream=_ASGIResponseStream(queue, task, disconnected),
+            request=request,
+        )
+
+
+@dataclass
+class Sample:
+    operation: str
+    status: int  # 例外（接続失敗・タイムアウト等）は 0
+    latency: float
+    ttfb: float | None = None
+
+
+def _faq_document(tenant: str, doc: int, chars: int) -> str:
+    rnd = random.Random(f"{tenant}-{doc}")
+    lines: list[str] = []
+    size = 0
+    while size < chars:
+        template = rnd.choice(FAQ_TEMPLATES)
+        lines.append(
+            template.format(
+                tenant=tenant,
+                days=rnd.randint(7, 60),
+                fee=rnd.choice([550, 660, 880]),
+                open=rnd.randint(8, 11),
+            )
+        )
+        size += len(lines[-1])
+    return "\n".join(lines)
+
+
+async def seed_corpus(
+    client: httpx.AsyncClient, keys: dict[str, str], docs: int, chars: int
+) -> int:
+    """テナントごとに合成の FAQ 文書をアップロードし、総チャンク数を返す"""
+
+    async def upload(tenant: str, key: str, doc: int) -> int:
+        text = _faq_document(tenant, doc, chars)
+        r = await client.post(
+            f"{API_PREFIX}/upload",
+            headers={"X-Embed-Key": key},
+            files={"file": (f"faq-{doc}.txt", text.encode("utf-8"), "text/plain")},
+        )
+        r.raise_for_status()
+        return int(r.json().get("chunks_count", 0))
+
+    counts = await asyncio.gather(
+        *(
+            upload(tenant, key, doc)
+            for tenant, key in keys.items()
+            for doc in range(docs)
+        )
+    )
+    return sum(counts)
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """--mix の文字列（例: ask=7,search=3）を操作ごとの重みにする"""
+    mix: dict[str, float] = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("ask", "search"):
+            raise ValueError(f"未知の操作です: {name}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("--mix には1つ以上の操作を指定してください")
+    return mix
+
+
+async def _request(
+    client: httpx.AsyncClient,
+    operation: str,
+    key: str,
+    question: str,
+    top_k: int,
+    test_environment: bool,
+) -> Sample:
+    headers = {"X-Embed-Key": key}
+    if test_environment:
+        headers["X-Test-Environment"] = "true"
+    path = "/search" if operation == "search" else "/ask"
+    if operation == "ask_stream":
+        headers["Accept"] = "text/event-stream"
+    payload = {"question": question, "top_k": top_k}
+
+    start = time.perf_counter()
+    ttfb = None
+    try:
+        async with client.stream(
+            "POST", f"{API_PREFIX}{path}", json=payload, headers=headers
+        ) as r:
+            async for chunk in r.aiter_raw():
+                if ttfb is None and chunk:
+                    ttfb = time.perf_counter() - start
+            status = r.status_code
+    except Exception:
+        status = 0
+    return Sample(
+        operation=operation,
+        status=status,
+        latency=time.perf_counter() - start,
+        ttfb=ttfb if operation == "ask_stream" else None,
+    )
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    keys: dict[str, str],
+    questions: list[str],
+    mix: dict[str, float],
+    stream_ratio: float,
+    concurrency: int,
+    duration: float,
+    max_requests: int,
+    top_k: int,
+    test_environment: bool,
+    seed: int = 0,
+) -> tuple[list[Sample], float]:
+    """並行クライアントで時間（または件数）いっぱいリクエストを送り続ける"""
+    samples: list[Sample] = []
+    tenants = list(keys.items())
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker(idx: int) -> None:
+        nonlocal issued
+        rnd = random.Random(seed * 1000 + idx)
+        while time.perf_counter() < deadline:
+            if max_requests and issued >= max_requests:
+                return
+            issued += 1
+            operation = rnd.choices(operations, weights)[0]
+            if operation == "ask":
+                stream = rnd.random() < stream_ratio
+                operation = "ask_stream" if stream else "ask_json"
+            _, key = rnd.choice(tenants)
+            samples.append(
+                await _request(
+                    client,
+                    operation,
+                    key,
+                    rnd.choice(questions),
+                    top_k,
+                    test_environment,
+                )
+            )
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict[str, Any]:
+    """操作別・全体の集計（遅延は成功したリクエストのみ、単位はミリ秒）"""
+
+    def stats(group: list[Sample]) -> dict[str, Any]:
+        count = len(group)
+        ok = [s for s in group if 200 <= s.status < 300]
+        status_counts: dict[str, int] = {}
+        for s in group:
+            status_counts[str(s.status)] = status_counts.get(str(s.status), 0) + 1
+        errors = sum(
+            1 for s in group if not 200 <= s.status < 300 and s.status not in (402, 429)
+        )
+        result: dict[str, Any] = {
+            "count": count,
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": _percentiles([s.latency for s in ok]),
+            "status_counts": status_counts,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "rate_429": round(status_counts.get("429", 0) / count, 4) if count else 0.0,
+            "rate_402": round(status_counts.get("402", 0) / count, 4) if count else 0.0,
+        }
+        ttfb = [s.ttfb for s in ok if s.ttfb is not None]
+        if ttfb:
+            result["ttfb_ms"] = _percentiles(ttfb)
+        return result
+
+    by_operation: dict[str, list[Sample]] = {}
+    for s in samples:
+        by_operation.setdefault(s.operation, []).append(s)
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "overall": stats(samples),
+        "by_operation": {
+            op: stats(group) for op, group in sorted(by_operation.items())
+        },
+    }
+
+
+def _load_questions(path: str | None) -> list[str]:
+    if not path:
+        return QUESTIONS
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    questions = [line.strip() for line in lines if line.strip()]
+    if not questions:
+        raise ValueError(f"{path} に質問がありません")
+    return questions
+
+
+def _parse_keys(text: str) -> dict[str, str]:
+    keys = {}
+    for pair in text.split(","):
+        tenant, _, key = pair.partition(":")
+        if tenant.strip() and key.strip():
+            keys[tenant.strip()] = key.strip()
+    return keys
+
+
+async def _run(args: argparse.Namespace, keys: dict[str, str]) -> dict[str, Any]:
+    mix = parse_mix(args.mix)
+    questions = _load_questions(args.questions)
+    timeout = httpx.Timeout(args.timeout)
+
+    async def drive(client: httpx.AsyncClient) -> dict[str, Any]:
+        chunks = None
+        if not args.skip_seed:
+            chunks = await seed_corpus(
+                client, keys, args.docs_per_tenant, args.doc_chars
+            )
+        samples, elapsed = await run_load(
+            client,
+            keys,
+            questions,
+            mix,
+            args.stream_ratio,
+            args.concurrency,
+            args.duration,
+            args.requests,
+            args.top_k,
+            args.test_environment,
+            seed=args.seed,
+        )
+        report = summarize(samples, elapsed)
+        report["config"] = {
+            "target": args.base_url or "in-process",
+            "tenants": len(keys),
+            "seeded_chunks": chunks,
+            "mix": mix,
+            "stream_ratio": args.stream_ratio,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "requests": args.requests,
+            "top_k": args.top_k,
+        }
+        if not args.base_url:
+            report["config"].update(
+                {
+                    "vector_backend": args.vector_backend,
+                    "llm_latency_ms": args.llm_latency_ms,
+                    "llm_tokens_per_second": args.llm_tokens_per_second,
+                    "llm_answer_tokens": args.llm_answer_tokens,
+                    "rate_limit_rpm": args.rate_limit_rpm,
+                    "daily_budget_jpy": args.daily_budget_jpy,
+                }
+            )
+        return report
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+            return await drive(client)
+
+    import logging
+
+    from app.main import app
+
+    # アプリのデバッグログは負荷試験の妨げになるため抑える
+    logging.getLogger().setLevel(logging.WARNING)
+    transport = StreamingASGITransport(app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://localhost", timeout=timeout
+        ) as client:
+            return await drive(client)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--base-url", help="起動済みサーバー（未指定でプロセス内起動）")
+    parser.add_argument("--keys", help="--base-url 用のテナントキー（t1:k1,t2:k2）")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--requests", type=int, default=0, help="総リクエスト数の上限")
+    parser.add_argument("--mix", default="ask=7,search=3", help="操作の重み")
+    parser.add_argument(
+        "--stream-ratio", type=float, default=0.5, help="/ask のうち SSE で受ける割合"
+    )
+    parser.add_argument("--questions", help="質問ファイル（1行1問）")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--test-environment",
+        action="store_true",
+        help="X-Test-Environment: true を付けてコスト計上・Redis 集計を省く",
+    )
+    parser.add_argument("--skip-seed", action="store_true", help="文書を投入しない")
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--docs-per-tenant", type=int, default=5)
+    parser.add_argument("--doc-chars", type=int, default=20_000)
+    parser.add_argument(
+        "--vector-backend", choices=["chroma", "flat"], default="chroma"
+    )
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--llm-latency-ms", type=int, default=300)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=200)
+    parser.add_argument("--rate-limit-rpm", type=int, default=1_000_000)
+    parser.add_argument(
+        "--daily-budget-jpy", type=float, default=0.0, help="0で予算チェックなし"
+    )
+    parser.add_argument("--redis-url", help="プロセス内起動で集計に使う Redis")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果 JSON の出力先（未指定で標準出力）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.base_url:
+            keys = _parse_keys(args.keys or os.environ.get("EMBED_API_KEYS", ""))
+            if not keys:
+                parser.error(
+                    "--base-url には --keys（または EMBED_API_KEYS）が必要です"
+                )
+            report = asyncio.run(_run(args, keys))
+        else:
+            keys = _configure_env(args, data_dir)
+            # アプリの標準出力（リクエストごとのログ）で結果の JSON が崩れないよう退避する
+            with contextlib.redirect_stdout(sys.stderr):
+                report = asyncio.run(_run(args, keys))
+
+    body = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(body + "\n", encoding="utf-8")
+    print(body)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+複数ワーカー × Chroma サーバーモードの負荷試験
+
+ローカルに Chroma サーバー（`chroma run`）を起動し、CHROMA_MODE=http の RAGEngine を
+複数プロセスから同時に動かして検索・追記を行う。最後に総チャンク数が
+（初期投入 + 全ワーカーの追記）と一致することを確認し、同時書き込みで
+インデックスが壊れないことを検証する。埋め込みは決定的な偽モデルを使い、
+OpenAI API には接続しない。
+
+実行例:
+    cd backend
+    python -m benchmarks.loadtest_multiworker --workers 4 --duration 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+TENANTS = [f"tenant-{i}" for i in range(4)]
+EMBED_DIM = 256
+CHUNKS_PER_WRITE = 2
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _configure_env(port: int) -> None:
+    os.environ.update(
+        {
+            "DEBUG": "true",
+            "EMBED_ALLOWED_ORIGINS": "http://localhost",
+            "CHROMA_MODE": "http",
+            "CHROMA_HOST": "127.0.0.1",
+            "CHROMA_PORT": str(port),
+            # ChatOpenAI の生成に必要なだけで、API 呼び出しは行わない
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-loadtest"),
+        }
+    )
+
+
+def _make_engine() -> Any:
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from app.core.services.rag_engine import RAGEngine
+
+    class LoadTestEngine(RAGEngine):
+        def _create_embeddings(self) -> Any:
+            return DeterministicFakeEmbedding(size=EMBED_DIM)
+
+    return LoadTestEngine()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _run_worker(
+    idx: int, duration: float, concurrency: int, write_ratio: float
+) -> dict[str, Any]:
+    engine = _make_engine()
+    await engine.initialize()
+    deadline = time.monotonic() + duration
+    search_ms: list[float] = []
+    write_ms: list[float] = []
+    errors = 0
+    writes = 0
+
+    async def client(cid: int) -> None:
+        nonlocal errors, writes
+        rnd = random.Random(idx * 1000 + cid)
+        n = 0
+        while time.monotonic() < deadline:
+            tenant = rnd.choice(TENANTS)
+            t0 = time.perf_counter()
+            try:
+                if rnd.random() < write_ratio:
+                    chunks = [
+                        f"worker {idx} client {cid} doc {n} part {p}"
+                        for p in range(CHUNKS_PER_WRITE)
+                    ]
+                    await engine.create_vectorstore_from_chunks(
+                        chunks, filename=f"w{idx}-c{cid}-{n}.txt", tenant=tenant
+                    )
+                    writes += 1
+                    write_ms.append((time.perf_counter() - t0) * 1000)
+                else:
+                    await engine.search_documents(
+                        f"question {rnd.randint(0, 100)}", top_k=5, tenant=tenant
+                    )
+                    search_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception:
+                errors += 1
+            n += 1
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(client(c) for c in range(concurrency)))
+    await engine.close()
+    return {
+        "worker": idx,
+        "searches": len(search_ms),
+        "writes": writes,
+        "errors": errors,
+        "search_p50_ms": round(statistics.median(search_ms), 2) if search_ms else 0,
+        "search_p95_ms": round(_percentile(search_ms, 0.95), 2),
+        "write_p50_ms": round(statistics.median(write_ms), 2) if write_ms else 0,
+    }
+
+
+def _worker_main(
+    idx: int,
+    port: int,
+    duration: float,
+    concurrency: int,
+    write_ratio: float,
+    results: Any,
+) -> None:
+    _configure_env(port)
+    # 検索のデバッグ出力を抑制
+    sys.stdout = open(os.devnull, "w")
+    results.put(asyncio.run(_run_worker(idx, duration, concurrency, write_ratio)))
+
+
+def _wait_for_server(port: int, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            r = httpx.get(f"http://127.0.0.1:{port}/api/v1/heartbeat", timeout=1.0)
+            if r.status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("Chroma サーバーが起動しませんでした")
+
+
+async def _seed(count: int) -> int:
+    engine = _make_engine()
+    await engine.initialize()
+    for tenant in TENANTS:
+        chunks = [f"{tenant} seed chunk {i}" for i in range(count)]
+        await engine.create_vectorstore_from_chunks(
+            chunks, filename=f"{tenant}-seed.txt", tenant=tenant
+        )
+    total = engine.vectorstore._collection.count()
+    await engine.close()
+    return total
+
+
+async def _final_count() -> int:
+    engine = _make_engine()
+    await engine.initialize()
+    total = engine.vectorstore._collection.count()
+    await engine.close()
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed-chunks", type=int, default=200)
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    port = args.port or _free_port()
+    _configure_env(port)
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = subprocess.Popen(
+            ["chroma", "run", "--path", data_dir, "--host", "127.0.0.1"]
+            + ["--port", str(port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for_server(port)
+            seeded = asyncio.run(_seed(args.seed_chunks))
+
+            ctx = mp.get_context("spawn")
+            results = ctx.Queue()
+            procs = [
+                ctx.Process(
+                    target=_worker_main,
+                    args=(
+                        i,
+                        port,
+                        args.duration,
+                        args.concurrency,
+                        args.write_ratio,
+                        results,
+                    ),
+                )
+                for i in range(args.workers)
+            ]
+            t0 = time.perf_counter()
+            for p in procs:
+                p.start()
+            per_worker = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            elapsed = time.perf_counter() - t0
+
+            final = asyncio.run(_final_count())
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    writes = sum(r["writes"] for r in per_worker)
+    expected = seeded + writes * CHUNKS_PER_WRITE
+    report = {
+        "workers": args.workers,
+        "concurrency_per_worker": args.concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "searches_per_s": round(sum(r["searches"] for r in per_worker) / elapsed, 1),
+        "writes_per_s": round(writes / elapsed, 1),
+        "errors": sum(r["errors"] for r in per_worker),
+        "final_count": final,
+        "expected_count": expected,
+        "consistent": final == expected,
+        "per_worker": sorted(per_worker, key=lambda r: r["worker"]),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+コンテキスト詰め込み（トークン予算内への文書の選択・切り詰め）のベンチマーク
+"""
+
+from __future__ import annotations
+
+import pytest
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.core.services.rag_engine import _encoding_for
+
+from .conftest import sample_text
+
+
+@pytest.mark.parametrize("top_k", [10, 50])
+@pytest.mark.parametrize("budget", [2_000, 7_000])
+def test_select_context_parts(benchmark, bench_engine, top_k, budget):
+    enc = _encoding_for(settings.default_model)
+    # オフライン環境では概算トークナイザになるため、比較時に区別できるよう記録する
+    benchmark.extra_info["encoding"] = enc.name
+    documents = [
+        Document(page_content=f"{i}: " + sample_text(500 + 37 * i))
+        for i in range(top_k)
+    ]
+    parts = benchmark(bench_engine._select_context_parts, documents, enc, budget)
+    assert parts
@@ -0,0 +1,45 @@
+"""
+検索・文書一覧のベンチマーク（合成チャンク 1k / 10k / 100k 件、バックエンド別）
+
+チャンクはバックエンドに直接投入し、検索はクエリの埋め込み（ローカルのハッシュ埋め込み）を
+含む search_documents 全体を測る。
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from .conftest import BACKENDS, SEARCH_SIZES, populate
+
+QUERY = "返品の送料はどのくらいかかりますか"
+
+
+@pytest.mark.parametrize("size", SEARCH_SIZES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_search_documents(benchmark, bench_engine, event_loop_for_bench, backend, size):
+    tenant = populate(bench_engine, backend, size)
+
+    def search():
+        return event_loop_for_bench.run_until_complete(
+            bench_engine.search_documents(QUERY, 10, tenant)
+        )
+
+    documents = benchmark(search)
+    assert len(documents) == 10
+
+
+@pytest.mark.parametrize("size", SEARCH_SIZES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_get_document_list(
+    benchmark, bench_engine, event_loop_for_bench, backend, size
+):
+    tenant = populate(bench_engine, backend, size)
+
+    def document_list():
+        return event_loop_for_bench.run_until_complete(
+            bench_engine.get_document_list(tenant)
+        )
+
+    # 全チャンクのメタデータを走査するため、大きいコレクションは回数を絞る
+    result = benchmark.pedantic(document_list, rounds=3 if size >= 100_000 else 10)
+    assert len(result["files"]) == -(-size // 100)
@@ -0,0 +1,54 @@
+"""
+テキスト処理のベンチマーク（URL 取り込みの正規化・タグ除去、チャンク分割、形式別の抽出）
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from app.api.embed_ingest import _normalize, _strip_tags
+from app.core.services.document_processor import DocumentProcessor
+
+from .conftest import FIXTURE_KINDS, fixture_file, sample_html, sample_text
+
+SIZES = [10_000, 200_000]
+
+
+@pytest.fixture(scope="module")
+def processor() -> DocumentProcessor:
+    return DocumentProcessor()
+
+
+@pytest.mark.parametrize("chars", SIZES)
+def test_normalize(benchmark, chars):
+    text = sample_text(chars)
+    result = benchmark(_normalize, text)
+    assert result
+
+
+@pytest.mark.parametrize("chars", SIZES)
+def test_strip_tags(benchmark, chars):
+    html = sample_html(chars)
+    result = benchmark(_strip_tags, html)
+    assert "<" not in result
+
+
+@pytest.mark.parametrize("chars", SIZES)
+def test_split_text(benchmark, processor, chars):
+    text = sample_text(chars)
+    chunks = benchmark(processor.split_text, text)
+    assert chunks
+
+
+@pytest.mark.parametrize("kind", FIXTURE_KINDS)
+def test_extract_text(benchmark, processor, kind):
+    data = fixture_file(kind)
+    extract = {
+        "pdf": processor.extract_text_from_pdf,
+        "txt": processor.extract_text_from_txt_bytes,
+        "docx": processor.extract_text_from_docx_bytes,
+        "pptx": processor.extract_text_from_pptx_bytes,
+        "xlsx": processor.extract_text_from_xlsx_bytes,
+    }[kind]
+    text = benchmark(extract, data)
+    assert text.strip()
@@ -20,6 +20,9 @@ class FakeDocument:
 class FakeRAGEngine:
     """外部依存(OpenAI/Chroma)を使わないテスト用スタブ"""
 
+    def prefetch(self, tenant: str | None) -> None:
+        return None
+
     async def create_vectorstore_from_chunks(
         self,
         chunks: list[str],
@@ -52,7 +55,10 @@ class FakeRAGEngine:
         temperature: float | None = None,
         tenant: str | None = None,
         max_output_tokens: int | None = None,
+        precheck: Any = None,
     ) -> dict[str, Any]:
+        if precheck is not None:
+            await precheck
         return {
             "answer": f"answer to: {question}",
             "documents": [
@@ -62,6 +68,9 @@ class FakeRAGEngine:
             "llm_model": model or "fake-llm",
         }
 
+    def memory_usage(self, counter: Any) -> dict[str, Any]:
+        return {"tables": []}
+
     async def get_system_info(self) -> dict[str, Any]:
         return {
             "status": "initialized",
@@ -86,6 +95,23 @@ class FakeRAGEngine:
             "total_chunks": 1,
         }
 
+    async def get_chunks_by_file_and_index(
+        self,
+        pairs: list[tuple[str, int]],
+        tenant: str | None = None,
+    ) -> list[dict[str, Any]]:
+        return [
+            {
+                "content": f"chunk {file_id}#{chunk_index}。",
+                "metadata": {
+                    "filename": "sample.txt",
+                    "file_id": file_id,
+                    "chunk_index": chunk_index,
+                },
+            }
+            for file_id, chunk_index in pairs
+        ]
+
     async def delete_document_by_file_id(
         self,
         file_id: str | None = None,
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.core import config
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+
+BASE = "/api/v1/embed/docs"
+# 代替処理に入れる人工的な待ち時間（予算確認・文書の有無の確認・検索それぞれ）
+LATENCY = 0.15
+
+
+async def _engine(tmp_path, monkeypatch) -> RAGEngine:
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 64)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(config.settings, "fake_chat_latency_ms", 0)
+    monkeypatch.setattr(config.settings, "fake_chat_tokens_per_second", 0)
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+    await engine.create_vectorstore_from_chunks(["返品は30日以内"], "faq.txt", "t")
+    return engine
+
+
+def _slow_steps(engine: RAGEngine, monkeypatch, search_delay: float = LATENCY):
+    """文書の有無の確認と検索に待ち時間を入れ、検索の取り消しを記録する"""
+    state = {"search_cancelled": False}
+    get_document_list = engine.get_document_list
+    search_documents = engine.search_documents
+
+    async def slow_document_list(tenant=None):
+        await asyncio.sleep(LATENCY)
+        return await get_document_list(tenant=tenant)
+
+    async def slow_search(query, top_k=None, tenant=None):
+        try:
+            await asyncio.sleep(search_delay)
+        except asyncio.CancelledError:
+            state["search_cancelled"] = True
+            raise
+        return await search_documents(query, top_k, tenant=tenant)
+
+    monkeypatch.setattr(engine, "get_document_list", slow_document_list)
+    monkeypatch.setattr(engine, "search_documents", slow_search)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_budget_corpus_and_retrieval_run_concurrently(tmp_path, monkeypatch):
+    engine = await _engine(tmp_path, monkeypatch)
+    _slow_steps(engine, monkeypatch)
+
+    start = time.perf_counter()
+    result = await engine.generate_answer(
+        "返品は?", 1, tenant="t", precheck=asyncio.sleep(LATENCY)
+    )
+    elapsed = time.perf_counter() - start
+
+    assert result["documents"]
+    saving = 3 * LATENCY - elapsed
+    # 3つの待ち時間が重なり、少なくとも2つ分は短縮される（LLM 等の処理時間を許容）
+    assert saving >= 2 * LATENCY - 0.1
+    await engine.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_precheck_cancels_in_flight_work(tmp_path, monkeypatch):
+    engine = await _engine(tmp_path, monkeypatch)
+    state = _slow_steps(engine, monkeypatch, search_delay=5.0)
+    chains = []
+    get_chain = engine._get_chain
+    monkeypatch.setattr(
+        engine, "_get_chain", lambda *a: chains.append(a) or get_chain(*a)
+    )
+
+    async def over_budget():
+        await asyncio.sleep(0.01)
+        raise HTTPException(402, "本日の使用上限に達しました")
+
+    start = time.perf_counter()
+    with pytest.raises(HTTPException) as excinfo:
+        await engine.generate_answer("返品は?", 1, tenant="t", precheck=over_budget())
+    await asyncio.sleep(0)
+
+    assert excinfo.value.status_code == 402
+    assert time.perf_counter() - start < 1.0
+    assert state["search_cancelled"]
+    assert chains == []
+    await engine.close()
+
+
+@pytest.mark.asyncio
+async def test_empty_corpus_cancels_retrieval(tmp_path, monkeypatch):
+    engine = await _engine(tmp_path, monkeypatch)
+    state = _slow_steps(engine, monkeypatch, search_delay=5.0)
+
+    start = time.perf_counter()
+    result = await engine.generate_answer(
+        "返品は?", 1, tenant="empty", precheck=asyncio.sleep(0)
+    )
+    await asyncio.sleep(0)
+
+    assert result["answer"].startswith("まずはドキュメントをアップロード")
+    assert time.perf_counter() - start < 1.0
+    assert state["search_cancelled"]
+    await engine.close()
+
+
+@pytest.mark.asyncio
+async def test_empty_corpus_still_reports_failed_precheck(tmp_path, monkeypatch):
+    engine = await _engine(tmp_path, monkeypatch)
+    state = _slow_steps(engine, monkeypatch, search_delay=5.0)
+
+    async def over_budget():
+        # 文書の有無の確認（LATENCY）より後に失敗する
+        await asyncio.sleep(2 * LATENCY)
+        raise HTTPException(402, "本日の使用上限に達しました")
+
+    with pytest.raises(HTTPException) as excinfo:
+        await engine.generate_answer(
+            "返品は?", 1, tenant="empty", precheck=over_budget()
+        )
+    await asyncio.sleep(0)
+
+    assert excinfo.value.status_code == 402
+    assert state["search_cancelled"]
+    await engine.close()
+
+
+def test_ask_over_budget_returns_402(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "daily_budget_jpy", 1e-9)
+    monkeypatch.setattr(config.settings, "redis_url", "redis://127.0.0.1:1/0")
+    r = client.post(
+        f"{BASE}/ask", headers={"x-embed-key": "demo123"}, json={"question": "返品は?"}
+    )
+    assert r.status_code == 402
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.services.flat_index import FlatVectorBackend
+from app.core.services.ingest_writer import CollectionWriter, WriteRequest, coalesce
+
+
+class CountingBackend(FlatVectorBackend):
+    def __init__(self, root):
+        super().__init__(root)
+        self.calls: list[tuple[str, int]] = []
+        self.fail_on: str | None = None
+
+    def add(self, tenant, ids, texts, embeddings, metadatas):
+        self.calls.append(("add", len(ids)))
+        if self.fail_on and self.fail_on in ids:
+            raise ValueError("boom")
+        super().add(tenant, ids, texts, embeddings, metadatas)
+
+    def delete(self, tenant, ids):
+        self.calls.append(("delete", len(ids)))
+        super().delete(tenant, ids)
+
+
+def _upload(writer, name, n=3):
+    ids = [f"{name}-{i}" for i in range(n)]
+    return writer.add(
+        ids,
+        [f"{name} chunk" for _ in ids],
+        [[float(i), 1.0] for i in range(n)],
+        [{"tenant": "a", "file_id": name} for _ in ids],
+    )
+
+
+def test_coalesce_keeps_order_across_kinds():
+    kinds = ["add", "add", "delete", "delete", "add"]
+    groups = coalesce([WriteRequest(k, [str(i)]) for i, k in enumerate(kinds)])
+    assert [(g[0].kind, len(g)) for g in groups] == [
+        ("add", 2),
+        ("delete", 2),
+        ("add", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_uploads_are_merged_into_one_write(tmp_path):
+    backend = CountingBackend(tmp_path)
+    writer = CollectionWriter(backend, "a", linger_seconds=0.01)
+
+    await asyncio.gather(*(_upload(writer, f"f{i}") for i in range(20)))
+
+    assert backend.count("a") == 60
+    # 先頭の1件以降は待機中にまとめられる
+    assert len(backend.calls) <= 2
+    assert writer.stats()["requests"] == 20
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_delete_after_add_is_applied_in_order(tmp_path):
+    backend = CountingBackend(tmp_path)
+    writer = CollectionWriter(backend, "a", linger_seconds=0.01)
+
+    await asyncio.gather(
+        _upload(writer, "x"),
+        writer.delete(["x-0", "x-1"]),
+        _upload(writer, "y"),
+    )
+
+    assert [kind for kind, _ in backend.calls] == ["add", "delete", "add"]
+    assert sorted(backend.get("a", include_documents=False)["ids"]) == [
+        "x-2",
+        "y-0",
+        "y-1",
+        "y-2",
+    ]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_reported_to_its_callers_only(tmp_path):
+    backend = CountingBackend(tmp_path)
+    backend.fail_on = "bad-0"
+    writer = CollectionWriter(backend, "a", linger_seconds=0.01)
+
+    results = await asyncio.gather(
+        _upload(writer, "bad"),
+        writer.delete(["nothing"]),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], ValueError)
+    assert results[1] is None
+    # 失敗後も書き込みタスクは動き続ける
+    await _upload(writer, "ok")
+    assert backend.count("a") == 3
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_writer_releases_waiting_callers(tmp_path):
+    backend = CountingBackend(tmp_path)
+    writer = CollectionWriter(backend, "a", linger_seconds=0)
+    started = threading.Event()
+    release = threading.Event()
+    add = backend.add
+
+    def slow_add(*args):
+        started.set()
+        release.wait(5)
+        add(*args)
+
+    backend.add = slow_add
+    in_flight = asyncio.ensure_future(_upload(writer, "x"))
+    while not started.is_set():
+        await asyncio.sleep(0.01)
+    queued = asyncio.ensure_future(_upload(writer, "y"))
+    await asyncio.sleep(0)
+
+    writer._task.cancel()
+    results = await asyncio.wait_for(
+        asyncio.gather(in_flight, queued, return_exceptions=True), timeout=1.0
+    )
+    release.set()
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    # 次の要求で書き込みタスクは再開する
+    backend.add = add
+    await _upload(writer, "z")
+    assert "z-0" in backend.get("a", include_documents=False)["ids"]
+    await writer.close()
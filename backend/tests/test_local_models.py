@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.core import config
+from app.core.services.local_models import FakeChatModel, HashingEmbeddings
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+
+
+def test_hashing_embeddings_are_deterministic_and_similar_for_similar_text():
+    embedder = HashingEmbeddings(dimensions=256)
+    a, b, c = np.array(
+        embedder.embed_documents(
+            [
+                "返品は30日以内に受け付けます",
+                "返品は30日以内なら受け付けます",
+                "配送料金の一覧",
+            ]
+        )
+    )
+    assert a.shape == (256,)
+    assert np.linalg.norm(a) == pytest.approx(1.0, rel=1e-5)
+    assert embedder.embed_query("返品は30日以内に受け付けます") == pytest.approx(
+        a.tolist()
+    )
+    assert a @ b > a @ c
+
+
+@pytest.mark.asyncio
+async def test_fake_chat_model_simulates_latency_and_streaming():
+    llm = FakeChatModel(
+        model="m", latency_seconds=0.05, tokens_per_second=200, answer_tokens=10
+    )
+    start = time.perf_counter()
+    msg = await llm.ainvoke("東京の天気は晴れです")
+    assert time.perf_counter() - start >= 0.05 + 9 / 200
+    assert len(msg.content.split()) == 10
+    assert msg.response_metadata["model_name"] == "m"
+    assert msg.usage_metadata["output_tokens"] == 10
+    assert (await llm.ainvoke("東京の天気は晴れです")).content == msg.content
+
+    start = time.perf_counter()
+    chunks = []
+    first_at = None
+    async for chunk in llm.astream("東京の天気は晴れです"):
+        first_at = first_at or time.perf_counter() - start
+        chunks.append(chunk)
+    assert 0.05 <= first_at < 0.05 + 5 / 200
+    assert "".join(c.content for c in chunks) == msg.content
+
+
+@pytest.mark.asyncio
+async def test_engine_runs_offline_with_local_providers(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 128)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(config.settings, "fake_chat_latency_ms", 1)
+    monkeypatch.setattr(config.settings, "fake_chat_tokens_per_second", 0)
+    monkeypatch.setattr(config.settings, "openai_api_key", None)
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+
+    await engine.create_vectorstore_from_chunks(
+        ["返品は30日以内に受け付けます", "配送料金は全国一律です"],
+        "faq.txt",
+        tenant="t",
+    )
+    result = await engine.generate_answer("返品は何日以内ですか", top_k=2, tenant="t")
+    assert result["documents"][0]["content"] == "返品は30日以内に受け付けます"
+    assert result["answer"]
+    assert result["llm_model"] == config.settings.default_model
+    await engine.close()
+
+
+def test_count_tokens_reuses_loaded_encoding(monkeypatch):
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    model = config.settings.default_model
+
+    assert rag_engine.count_tokens(model, "") == 0
+    assert rag_engine.count_tokens(model, "返品は30日以内です") > 0
+    assert list(rag_engine._encodings) == [model]
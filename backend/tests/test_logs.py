@@ -0,0 +1,86 @@
+import io
+import json
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import config, logs
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+
+BASE = "/api/v1/embed/docs"
+
+
+@pytest.fixture()
+def json_output(monkeypatch):
+    monkeypatch.setattr(config.settings, "log_format", "json")
+    stream = io.StringIO()
+    logs.configure_logging(logging.INFO, stream)
+    yield stream
+    logs.configure_logging()
+
+
+def test_records_are_written_as_json_by_listener_thread(json_output):
+    logging.getLogger("tuukaa.test").info(
+        "hello %s", "world", extra={"fields": {"tenant": "t", "tokens": 3}}
+    )
+    logs.shutdown_logging()
+
+    [line] = json_output.getvalue().splitlines()
+    data = json.loads(line)
+    assert data["message"] == "hello world"
+    assert data["logger"] == "tuukaa.test"
+    assert data["level"] == "INFO"
+    assert data["tenant"] == "t" and data["tokens"] == 3
+
+
+def test_sampled_bounds():
+    assert logs.sampled(1.0)
+    assert not logs.sampled(0.0)
+
+
+def test_ask_access_log_hashes_question(client: TestClient, caplog):
+    caplog.set_level(logging.INFO, logger="tuukaa.access")
+    question = "機密情報を含む質問：パスワードは12345"
+    headers = {"x-embed-key": "demo123", "x-test-environment": "true"}
+    r = client.post(f"{BASE}/ask", headers=headers, json={"question": question})
+    assert r.status_code == 200
+
+    [record] = [r for r in caplog.records if r.name == "tuukaa.access"]
+    assert record.fields["tenant"] == "acme"
+    assert len(record.fields["ip_hash"]) == 16
+    assert question not in json.dumps(record.fields, ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_retrieval_debug_log_is_sampled_and_omits_content(
+    tmp_path, monkeypatch, caplog
+):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 64)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+    await engine.create_vectorstore_from_chunks(["返品は30日以内"], "faq.txt", "t")
+    caplog.set_level(logging.DEBUG, logger=rag_engine.logger.name)
+
+    def retrieval_records():
+        return [r for r in caplog.records if r.getMessage() == "検索結果の内訳"]
+
+    monkeypatch.setattr(config.settings, "retrieval_log_sample_rate", 1.0)
+    await engine.search_documents("返品は?", 1, tenant="t")
+    [record] = retrieval_records()
+    assert record.fields["results"][0]["chunk_index"] == 0
+    assert "返品" not in json.dumps(record.fields, ensure_ascii=False)
+
+    caplog.clear()
+    monkeypatch.setattr(config.settings, "retrieval_log_sample_rate", 0.0)
+    await engine.search_documents("返品は?", 1, tenant="t")
+    monkeypatch.setattr(config.settings, "retrieval_log_sample_rate", 1.0)
+    monkeypatch.setattr(config.settings, "retrieval_debug_log", False)
+    await engine.search_documents("返品は?", 1, tenant="t")
+    assert retrieval_records() == []
+    await engine.close()
@@ -0,0 +1,204 @@
+import asyncio
+import datetime as dt
+import os
+import time
+
+import fakeredis
+import httpx
+import pytest
+
+from app.api import embed_ingest, reports
+from app.core import config, metrics
+from app.core.loop_monitor import LoopMonitor
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+from app.core.web.dependencies import get_rag_engine
+
+BASE = "/api/v1/embed/docs"
+# リクエスト処理がイベントループを止めてよい上限（CI の遅いマシン向けに上書き可）
+BLOCK_BUDGET_MS = float(os.environ.get("LOOP_BLOCK_BUDGET_MS", "200"))
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+class _Slow:
+    """呼び出しごとに同期的に待つ代替（イベントループ上で呼ぶとループが止まる）
+
+    パイプラインへのコマンドの積み込みは待たず、execute などの実行だけ待つ。
+    """
+
+    def __init__(self, target, delay: float):
+        self._target = target
+        self._delay = delay
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if name == "pipeline":
+                return _Slow(result, self._delay)
+            if result is self._target:
+                return self
+            time.sleep(self._delay)
+            return result
+
+        return call
+
+
+def _jst_day() -> str:
+    jst = dt.timezone(dt.timedelta(hours=9))
+    return dt.datetime.now(jst).strftime("%Y-%m-%d")
+
+
+def _format_blocked(monitor: LoopMonitor) -> str:
+    return "\n\n".join(
+        f"blocked {b['blocked_ms']}ms:\n" + "".join(b["stack"]) for b in monitor.blocked
+    )
+
+
+@pytest.mark.asyncio
+async def test_monitor_records_lag_and_captures_blocking_stack():
+    metrics.LOOP_LAG_SECONDS.clear()
+    monitor = LoopMonitor(interval=0.01, block_threshold=0.05)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    _block_the_loop(0.2)
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    assert monitor.max_lag >= 0.15
+    assert metrics.LOOP_LAG_SECONDS.count() > 0
+    [blocked] = monitor.blocked
+    assert blocked["blocked_ms"] >= 50
+    assert any("_block_the_loop" in line for line in blocked["stack"])
+
+
+@pytest.mark.asyncio
+async def test_request_handlers_do_not_block_the_loop(app, monkeypatch):
+    # 接続できない Redis（すぐに失敗させ、インメモリの計上に切り替える）
+    monkeypatch.setattr(config.settings, "redis_url", "redis://127.0.0.1:1/0")
+    transport = httpx.ASGITransport(app=app)
+    headers = {"x-embed-key": "demo123"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+
+        async def ask(stream: bool = False):
+            extra = {"accept": "text/event-stream"} if stream else {}
+            r = await c.post(
+                f"{BASE}/ask",
+                headers={**headers, **extra},
+                json={"question": "返品は?"},
+            )
+            assert r.status_code == 200
+
+        async def search():
+            r = await c.post(
+                f"{BASE}/search", headers=headers, json={"question": "返品は?"}
+            )
+            assert r.status_code == 200
+
+        async def upload():
+            files = {"file": ("faq.txt", "返品は30日以内です。\n".encode() * 500)}
+            r = await c.post(f"{BASE}/upload", headers=headers, files=files)
+            assert r.status_code == 200
+
+        # 初回のみの import などを除くため一巡させてから計測する
+        await asyncio.gather(ask(), ask(stream=True), search(), upload())
+
+        monitor = LoopMonitor(interval=0.01, block_threshold=BLOCK_BUDGET_MS / 1000)
+        monitor.start()
+        try:
+            for _ in range(3):
+                await asyncio.gather(
+                    *(ask() for _ in range(5)),
+                    *(ask(stream=True) for _ in range(3)),
+                    *(search() for _ in range(5)),
+                    *(upload() for _ in range(2)),
+                )
+        finally:
+            await monitor.stop()
+
+    assert not monitor.blocked, _format_blocked(monitor)
+
+
+@pytest.mark.asyncio
+async def test_feedback_delete_and_reports_do_not_block_the_loop(
+    app, tmp_path, monkeypatch
+):
+    # Redis・ベクトルバックエンドの各呼び出しが許容時間より長くかかる環境を再現する
+    delay = BLOCK_BUDGET_MS / 1000 * 1.5
+    redis = _Slow(fakeredis.FakeRedis(decode_responses=True), delay)
+
+    def slow_get_redis():
+        time.sleep(delay)
+        return redis
+
+    monkeypatch.setattr(embed_ingest, "_get_redis", slow_get_redis)
+    monkeypatch.setattr(reports, "_get_redis", slow_get_redis)
+    monkeypatch.setattr(config.settings, "admin_api_secret", "loop-secret")
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "c"))
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path / "f"))
+    monkeypatch.setattr(config.settings, "vector_backend", "flat")
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 64)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+    for i in range(3):
+        await engine.create_vectorstore_from_chunks(
+            [f"返品は{i + 30}日以内"], f"faq{i}.txt", "acme"
+        )
+    files = (await engine.get_document_list(tenant="acme"))["files"]
+    backend, _ = engine._route("acme")
+    monkeypatch.setattr(backend, "get", _Slow(backend, delay).get)
+    monkeypatch.setattr(backend, "count", _Slow(backend, delay).count)
+    app.dependency_overrides[get_rag_engine] = lambda: engine
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"x-embed-key": "demo123"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+
+        async def feedback(i: int):
+            r = await c.post(
+                f"{BASE}/feedback",
+                headers=headers,
+                json={"message_id": f"m{i}", "resolved": i % 2 == 0},
+            )
+            assert r.status_code == 200
+
+        async def delete(f: dict):
+            r = await c.request(
+                "DELETE",
+                f"{BASE}/documents",
+                headers=headers,
+                json={"file_id": f["file_id"], "filename": f["filename"]},
+            )
+            assert r.status_code == 200
+
+        async def summary():
+            r = await c.get(
+                "/api/v1/admin/reports/summary",
+                headers={"x-admin-api-secret": "loop-secret"},
+                params={"tenant": "acme", "start": "2024-01-01", "end": "2024-01-03"},
+            )
+            assert r.status_code == 200
+
+        monitor = LoopMonitor(interval=0.01, block_threshold=BLOCK_BUDGET_MS / 1000)
+        monitor.start()
+        try:
+            await asyncio.gather(
+                *(feedback(i) for i in range(3)),
+                *(delete(f) for f in files),
+                *(summary() for _ in range(2)),
+            )
+        finally:
+            await monitor.stop()
+            await engine.close()
+
+    assert not monitor.blocked, _format_blocked(monitor)
+    assert redis.hget(f"feedback:{_jst_day()}:acme", "yes") == "2"
@@ -0,0 +1,84 @@
+import os
+import uuid
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+
+from app.core import config
+from app.core.services import maintenance
+from app.core.services.flat_index import FlatVectorBackend
+from app.core.services.rag_engine import RAGEngine
+
+
+def _age(path, seconds=3600):
+    old = os.stat(path).st_mtime - seconds
+    os.utime(path, (old, old))
+
+
+def test_flat_orphans_and_compaction(tmp_path):
+    rng = np.random.default_rng(0)
+    backend = FlatVectorBackend(tmp_path)
+    for batch in range(3):
+        ids = [f"{batch}-{i}" for i in range(4)]
+        backend.add(
+            "a",
+            ids,
+            ids,
+            rng.normal(size=(4, 8)).tolist(),
+            [{"tenant": "a"} for _ in ids],
+        )
+    tenant_dir = tmp_path / "a"
+    orphan = tenant_dir / "seg-deadbeef.npy"
+    orphan.write_bytes(b"x")
+    fresh_tmp = tenant_dir / "manifest.json.123.tmp"
+    fresh_tmp.write_bytes(b"x")
+    _age(orphan)
+
+    result = maintenance.cleanup_flat_orphans(tmp_path, grace_seconds=60)
+    assert result["removed_files"] == 1
+    assert not orphan.exists() and fresh_tmp.exists()  # 猶予内のファイルは残す
+
+    result = maintenance.compact_flat(backend, min_segments=3)
+    assert result["compacted"] == {"a": (3, 1)}
+    assert len(list(tenant_dir.glob("seg-*.json"))) == 1
+    assert backend.count("a") == 12
+    assert FlatVectorBackend(tmp_path).get("a", ids=["1-2"])["documents"] == ["1-2"]
+
+
+def test_chroma_orphan_cleanup_keeps_live_segments(tmp_path):
+    client = chromadb.PersistentClient(
+        path=str(tmp_path), settings=ChromaSettings(anonymized_telemetry=False)
+    )
+    collection = client.create_collection("langchain")
+    collection.add(ids=["1", "2"], embeddings=[[0.1, 0.2], [0.3, 0.4]])
+    orphan = tmp_path / str(uuid.uuid4())
+    orphan.mkdir()
+    (orphan / "data_level0.bin").write_bytes(b"0" * 128)
+    _age(orphan)
+
+    result = maintenance.cleanup_chroma_orphans(tmp_path, grace_seconds=60)
+    assert result == {"removed": [orphan.name], "freed_bytes": 128}
+
+    optimized = maintenance.optimize_chroma_sqlite(client, tmp_path, vacuum_timeout=1)
+    assert optimized["collections"] == 1
+    assert collection.count() == 2
+
+
+def test_run_maintenance_is_exclusive_and_timed(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "vs"))
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path / "flat"))
+    engine = RAGEngine()
+
+    lock = maintenance.NodeLock(config.settings.persist_path / maintenance.LOCK_FILE)
+    assert lock.acquire()
+    try:
+        assert maintenance.run_maintenance(engine) is None
+    finally:
+        lock.release()
+
+    report = maintenance.run_maintenance(engine, ["flat_orphans", "chroma_sqlite"])
+    assert set(report["tasks"]) == {"flat_orphans", "chroma_sqlite"}
+    assert "skipped" in report["tasks"]["chroma_sqlite"]  # 未初期化（Chroma 未接続）
+    assert report["tasks"]["flat_orphans"]["duration_ms"] >= 0
+    assert maintenance.history[-1] is report
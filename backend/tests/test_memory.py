@@ -0,0 +1,81 @@
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import config, memory
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+
+BASE = "/api/v1/embed/docs"
+SECRET = "memory-secret"
+ADMIN = {"x-admin-api-secret": SECRET}
+
+
+@pytest.fixture(autouse=True)
+def _stop_tracemalloc():
+    yield
+    memory.stop_tracing()
+
+
+def test_size_counter_counts_shared_objects_once():
+    payload = [str(i) * 1000 for i in range(10)]
+    counter = memory.SizeCounter()
+    first = counter.sizeof({"a": payload})
+    assert first > sum(sys.getsizeof(s) for s in payload)
+    assert counter.sizeof({"b": payload}) < first
+
+    array = np.zeros(10_000, dtype=np.float32)
+    assert memory.SizeCounter().sizeof([array]) >= array.nbytes
+
+    small = memory.SizeCounter(max_objects=5)
+    small.sizeof(list(range(100)))
+    assert small.truncated
+
+
+def test_admin_memory_reports_limiters_and_tracemalloc(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "admin_api_secret", SECRET)
+    headers = {"x-embed-key": "demo123", "x-test-environment": "true"}
+    client.post(f"{BASE}/ask", headers=headers, json={"question": "返品は?"})
+
+    assert client.get("/api/v1/admin/memory").status_code == 401
+    body = client.get("/api/v1/admin/memory", headers=ADMIN).json()
+    limiters = {t["name"]: t for t in body["limiters"]}
+    assert limiters["rpm"]["entries"] >= 1
+    assert limiters["rpm"]["approx_bytes"] > 0
+    assert body["tracemalloc"] == {"tracing": False}
+
+    r = client.post("/api/v1/admin/memory/tracemalloc/start", headers=ADMIN)
+    assert r.json()["tracing"] is True
+    retained = [bytearray(4096) for _ in range(100)]  # noqa: F841
+    body = client.get("/api/v1/admin/memory", headers=ADMIN, params={"limit": 5}).json()
+    top = body["tracemalloc"]["top"]
+    assert 0 < len(top) <= 5
+    assert any("test_memory.py" in line for t in top for line in t["traceback"])
+
+    r = client.post("/api/v1/admin/memory/tracemalloc/stop", headers=ADMIN)
+    assert r.json() == {"tracing": False}
+
+
+@pytest.mark.asyncio
+async def test_engine_memory_usage_lists_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "c"))
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path / "f"))
+    monkeypatch.setattr(config.settings, "vector_backend", "flat")
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 64)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+    await engine.create_vectorstore_from_chunks(["返品は30日以内"], "faq.txt", "t")
+    await engine.search_documents("返品は?", 1, tenant="t")
+
+    usage = engine.memory_usage(memory.SizeCounter())
+    tables = {t["name"]: t for t in usage["tables"]}
+    assert tables["llm_cache"]["entries"] == 1
+    assert tables["llm_cache"]["approx_bytes"] > 0
+    assert usage["flat_index"]["loaded_tenants"] == 1
+    assert usage["flat_index"]["resident_bytes"] > 0
+    await engine.close()
@@ -0,0 +1,143 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import config, metrics
+from app.core.metrics import Counter, Histogram, Registry
+from app.core.services import rag_engine
+from app.core.services.rag_engine import RAGEngine
+
+BASE = "/api/v1/embed/docs"
+
+
+@pytest.fixture(autouse=True)
+def _clear_metrics():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def test_prometheus_text_format(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    hist = Histogram("t_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    counter = Counter("t_total", "Test.", ("tenant",))
+    hist.observe(0.05, stage="llm")
+    hist.observe(0.5, stage="llm")
+    hist.observe(5.0, stage="llm")
+    counter.inc(2, tenant='a"b')
+
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="llm",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="llm"} 3' in text
+    assert 't_total{tenant="a\\"b"} 2' in text
+    with pytest.raises(ValueError):
+        counter.inc(model="x")
+
+
+def test_ask_records_stages_tokens_and_cost(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "metrics_enabled", True)
+    headers = {"x-embed-key": "demo123", "x-test-environment": "true"}
+    r = client.post(f"{BASE}/ask", headers=headers, json={"question": "返品は?"})
+    assert r.status_code == 200
+
+    model = config.settings.default_model
+    assert metrics.STAGE_SECONDS.count(stage="auth", tenant=None, model=None) == 1
+    for stage in ("rate_limit", "budget_check", "token_count", "accounting"):
+        assert metrics.STAGE_SECONDS.count(stage=stage, tenant="acme", model=model) == 1
+    assert metrics.REQUEST_SECONDS.count(endpoint="ask", tenant="acme") == 1
+    assert metrics.TOKENS.value(tenant="acme", model=model, direction="output") >= 1
+    assert metrics.COST_JPY.value(tenant="acme", model=model) > 0
+
+    text = client.get("/metrics").text
+    assert (
+        'tuukaa_request_duration_seconds_count{endpoint="ask",tenant="acme"} 1' in text
+    )
+    assert "tuukaa_llm_tokens_total{" in text
+
+
+def test_unknown_models_share_one_series(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "metrics_enabled", True)
+    headers = {"x-embed-key": "demo123", "x-test-environment": "true"}
+
+    def ask(model: str) -> int:
+        body = {"question": "返品は?", "model": model}
+        assert client.post(f"{BASE}/ask", headers=headers, json=body).status_code == 200
+        return len(client.get("/metrics").text.splitlines())
+
+    baseline = ask("junk-0")
+    assert [ask(f"junk-{i}") for i in range(1, 10)] == [baseline] * 9
+    assert metrics.TOKENS.value(tenant="acme", model="other", direction="output") > 0
+    assert metrics.model_label(config.settings.default_model) == (
+        config.settings.default_model
+    )
+
+
+def test_metrics_endpoint_auth_and_disable(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "metrics_enabled", True)
+    monkeypatch.setattr(config.settings, "metrics_auth_token", "tok")
+    assert client.get("/metrics").status_code == 401
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer x"}).status_code == 401
+    )
+    r = client.get("/metrics", headers={"Authorization": "Bearer tok"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    monkeypatch.setattr(config.settings, "metrics_enabled", False)
+    assert client.get("/metrics").status_code == 404
+
+
+def _production_settings(**overrides) -> config.Settings:
+    values = {
+        "debug": False,
+        "openai_api_key": "sk-test",
+        "admin_api_secret": "s" * 32,
+        "embed_allowed_origins": "https://example.com",
+    }
+    return config.Settings(**{**values, **overrides})
+
+
+def test_metrics_are_not_public_in_production(client: TestClient, monkeypatch):
+    production = _production_settings()
+    assert production.metrics_enabled is False
+    with pytest.raises(ValueError, match="METRICS_AUTH_TOKEN"):
+        _production_settings(metrics_enabled=True)
+    assert _production_settings(metrics_enabled=True, metrics_auth_token="tok")
+
+    # 既定の本番設定ではトークンなしで取得できない
+    monkeypatch.setattr("app.main.settings", production)
+    assert client.get("/metrics").status_code == 404
+    # 検証を経ずに有効化されても、本番ではトークンなしで公開しない
+    monkeypatch.setattr(production, "metrics_enabled", True)
+    assert client.get("/metrics").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_engine_records_retrieval_and_generation_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 64)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(config.settings, "fake_chat_latency_ms", 1)
+    monkeypatch.setattr(config.settings, "fake_chat_tokens_per_second", 0)
+    monkeypatch.setattr(rag_engine, "_encodings", {})
+    engine = RAGEngine()
+    await engine.initialize()
+    await engine.create_vectorstore_from_chunks(["返品は30日以内"], "faq.txt", "t")
+
+    await engine.generate_answer("返品は?", top_k=1, tenant="t")
+    await engine.generate_answer("返品は?", top_k=1, tenant="t")
+
+    chat = config.settings.default_model
+    embed = config.settings.embedding_model
+    for stage in ("corpus_check", "context_packing", "llm"):
+        assert metrics.STAGE_SECONDS.count(stage=stage, tenant="t", model=chat) == 2
+    for stage in ("query_embedding", "vector_search"):
+        assert metrics.STAGE_SECONDS.count(stage=stage, tenant="t", model=embed) == 2
+    # 初期化時に既定の LLM を作り、以降の回答生成はキャッシュから取得する
+    assert metrics.CACHE_MISSES.value(cache="llm") == 1
+    assert metrics.CACHE_HITS.value(cache="llm") == 2
+    await engine.close()
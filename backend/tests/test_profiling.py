@@ -0,0 +1,70 @@
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import config
+
+BASE = "/api/v1/embed/docs"
+SECRET = "profile-secret"
+ASK_HEADERS = {"x-embed-key": "demo123", "x-test-environment": "true"}
+ADMIN = {"x-admin-api-secret": SECRET}
+
+
+@pytest.fixture(autouse=True)
+def _profile_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "admin_api_secret", SECRET)
+    monkeypatch.setattr(config.settings, "profile_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "profile_max_files", 20)
+
+
+def _ask(client: TestClient, **headers: str):
+    return client.post(
+        f"{BASE}/ask", headers={**ASK_HEADERS, **headers}, json={"question": "返品は?"}
+    )
+
+
+def test_profile_requires_admin_secret(client: TestClient, tmp_path):
+    r = _ask(client, **{"x-profile": "1"})
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+    r = _ask(client, **{"x-profile": "1", "x-admin-api-secret": "wrong"})
+    assert "x-profile-id" not in r.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiled_request_is_stored_and_fetchable(client: TestClient, tmp_path):
+    r = _ask(client, **{"x-profile": "1"}, **ADMIN)
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+
+    assert client.get("/api/v1/admin/profiles").status_code == 401
+    [meta] = client.get("/api/v1/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert meta["id"] == profile_id
+    assert meta["path"] == f"{BASE}/ask" and meta["status"] == 200
+
+    r = client.get(f"/api/v1/admin/profiles/{profile_id}", headers=ADMIN)
+    assert r.status_code == 200
+    assert "function calls" in r.text and "docs_ask" in r.text
+
+    r = client.get(
+        f"/api/v1/admin/profiles/{profile_id}", headers=ADMIN, params={"format": "raw"}
+    )
+    raw = tmp_path / "raw.prof"
+    raw.write_bytes(r.content)
+    functions = {name for _, _, name in pstats.Stats(str(raw)).stats}
+    assert "generate_answer" in functions
+
+    r = client.get("/api/v1/admin/profiles/..%2F..%2Fetc", headers=ADMIN)
+    assert r.status_code == 404
+
+
+def test_profile_directory_is_bounded(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "profile_max_files", 2)
+    ids = [
+        _ask(client, **{"x-profile": "1"}, **ADMIN).headers["x-profile-id"]
+        for _ in range(3)
+    ]
+
+    profiles = client.get("/api/v1/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert sorted(p["id"] for p in profiles) == sorted(ids[1:])
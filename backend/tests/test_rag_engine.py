@@ -20,3 +20,36 @@ async def test_search_documents_requires_vectorstore():
     engine = RAGEngine()
     with pytest.raises(RuntimeError):
         await engine.search_documents("hello")
+
+
+def _fake_llm_engine(monkeypatch, cache_size: int = 2) -> RAGEngine:
+    from langchain_core.language_models import FakeListChatModel
+
+    monkeypatch.setattr(config.settings, "llm_cache_size", cache_size)
+    engine = RAGEngine()
+    monkeypatch.setattr(
+        engine,
+        "_create_llm",
+        lambda model, temperature, max_tokens: FakeListChatModel(responses=["ok"]),
+    )
+    return engine
+
+
+def test_llm_cache_buckets_temperature(monkeypatch):
+    engine = _fake_llm_engine(monkeypatch)
+    llm_a, _ = engine._get_llm("m", 0.201, 100)
+    llm_b, _ = engine._get_llm("m", 0.199, 100)
+    assert llm_a is llm_b
+    chain_a, _ = engine._get_chain("m", 0.2, 100)
+    chain_b, _ = engine._get_chain("m", 0.2, 100)
+    assert chain_a is chain_b
+
+
+def test_llm_cache_is_bounded_lru(monkeypatch):
+    engine = _fake_llm_engine(monkeypatch, cache_size=2)
+    engine._get_chain("a", 0.0, 10)
+    engine._get_chain("b", 0.0, 10)
+    engine._get_chain("a", 0.0, 10)
+    engine._get_chain("c", 0.0, 10)
+    assert [k[0] for k in engine._llm_cache] == ["a", "c"]
+    assert set(engine._chain_cache) == set(engine._llm_cache)
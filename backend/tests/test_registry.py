@@ -0,0 +1,46 @@
+import pytest
+
+from app.core import registry
+from app.core.config import settings
+
+
+@pytest.fixture()
+def configured(monkeypatch):
+    monkeypatch.setattr(settings, "embed_api_keys", "acme:demo123,beta:key-b")
+    monkeypatch.setattr(
+        settings, "model_pricing", "gpt-4o:in=2.50:out=10.00,legacy:0.000002"
+    )
+    monkeypatch.setattr(settings, "usd_jpy_rate", 100.0)
+
+
+def test_tenant_lookup(configured):
+    assert registry.tenant_from_key("demo123") == "acme"
+    assert registry.tenant_from_key("key-b") == "beta"
+    assert registry.tenant_from_key("unknown") is None
+    assert registry.tenant_from_key(None) is None
+    assert registry.has_tenant("acme")
+    assert not registry.has_tenant("gamma")
+
+
+def test_pricing_table(configured):
+    jpy_in, jpy_out = registry.jpy_per_token("gpt-4o")
+    assert jpy_in == pytest.approx(2.50 / 1_000_000 * 100.0)
+    assert jpy_out == pytest.approx(10.00 / 1_000_000 * 100.0)
+    assert registry.jpy_per_token("legacy") == pytest.approx((0.0002, 0.0002))
+    # 未登録モデルは既定単価（gpt-4o-mini）
+    assert registry.jpy_per_token("other") == pytest.approx(
+        (0.15 / 1_000_000 * 100.0, 0.60 / 1_000_000 * 100.0)
+    )
+
+
+def test_registry_is_compiled_once(configured):
+    first = registry.get_registry()
+    assert registry.get_registry() is first
+
+
+def test_reload_reads_environment(configured, monkeypatch):
+    monkeypatch.setenv("EMBED_API_KEYS", "acme:rotated-key")
+    counts = registry.reload_registry()
+    assert counts["tenants"] == 1
+    assert registry.tenant_from_key("rotated-key") == "acme"
+    assert registry.tenant_from_key("demo123") is None
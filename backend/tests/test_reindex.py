@@ -0,0 +1,194 @@
+import asyncio
+import time
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
+
+from app.core import config
+from app.core.services import migration, reindex
+from app.core.services.embedding_cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    shorten,
+)
+from app.core.services.embedding_throttle import EmbeddingRateLimiter
+from app.core.services.index_registry import IndexRegistry, IndexSpec
+from app.core.services.rag_engine import RAGEngine
+
+
+class ShortenedFake(Embeddings):
+    """先頭次元の切り詰めで低次元版が得られる（text-embedding-3 と同じ性質の）偽埋め込み"""
+
+    def __init__(self, dimensions: int | None = None, full: int = 32):
+        self.dimensions = dimensions
+        self.base = DeterministicFakeEmbedding(size=full)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return shorten(self.base.embed_query(text), self.dimensions or self.base.size)
+
+
+def test_cache_shortens_larger_vectors(tmp_path):
+    cache = EmbeddingCache(tmp_path / "e.sqlite3")
+    inner = ShortenedFake()
+    full = CachedEmbeddings(inner, cache, "text-embedding-3-small")
+    vectors = full.embed_documents(["a", "b"])
+    assert inner.calls == 2
+
+    # 既定次元の要求は保存済みの値そのもの
+    assert full.embed_documents(["a"]) == [pytest.approx(vectors[0])]
+    # 低次元の要求は保存済みの値の短縮で、API を呼ばない
+    short = CachedEmbeddings(ShortenedFake(8), cache, "text-embedding-3-small", 8)
+    got = short.embed_documents(["a", "c"])
+    assert short.inner.calls == 1
+    assert got[0] == pytest.approx(ShortenedFake(8).embed_query("a"), abs=1e-6)
+    # 短縮に非対応のモデルは別次元の保存値を使わない
+    assert cache.get_many("text-embedding-ada-002", ["a"], 8) == [None]
+    assert cache.stats()["shortened"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_counts_async_hits(tmp_path):
+    cache = EmbeddingCache(tmp_path / "e.sqlite3")
+    cached = CachedEmbeddings(ShortenedFake(), cache, "text-embedding-3-small")
+    _, from_cache = await cached.aembed_documents_counted(["a", "b"])
+    assert from_cache == 0
+    _, from_cache = await cached.aembed_documents_counted(["a", "b", "c"])
+    assert from_cache == 2
+
+
+def test_registry_is_shared_between_instances(tmp_path):
+    path = tmp_path / "index_registry.json"
+    first, second = IndexRegistry(path), IndexRegistry(path)
+    default = IndexSpec("text-embedding-3-small")
+    first.ensure_baseline(default)
+    # 設定が変わっても基準は初回の条件のまま
+    assert second.ensure_baseline(IndexSpec("other")) == default
+
+    first.set_spec("t", IndexSpec("text-embedding-3-small", 256, 1))
+    assert second.spec_for("t", default) == IndexSpec("text-embedding-3-small", 256, 1)
+    assert second.spec_for("u", IndexSpec("other")) == default
+
+    second.reset(IndexSpec("other"))
+    assert first.tenants() == {}
+    assert first.spec_for("t", default) == IndexSpec("other")
+
+
+@pytest.mark.asyncio
+async def test_reindex_switches_flat_tenant_to_fewer_dimensions(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "vs"))
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path / "flat"))
+    monkeypatch.setattr(config.settings, "vector_backend", "flat")
+    monkeypatch.setattr(config.settings, "similarity_score_threshold", 1e9)
+    monkeypatch.setattr(config.settings, "reindex_batch_size", 2)
+    monkeypatch.setattr(config.settings, "reindex_cutover_grace_seconds", 0)
+    engine = RAGEngine()
+    engine.embeddings = ShortenedFake()
+    created = []
+    engine._create_embeddings = lambda model=None, dimensions=None, **_: created.append(
+        dimensions
+    ) or ShortenedFake(dimensions)
+
+    texts = ["alpha", "beta", "gamma", "delta", "epsilon"]
+    await engine.create_vectorstore_from_chunks(texts, "doc.txt", tenant="t")
+    ids_before = (await engine.get_document_list(tenant="t"))["files"]
+
+    with pytest.raises(ValueError):
+        reindex.start_reindex(engine, "t", model="text-embedding-ada-002", dimensions=8)
+    status = reindex.start_reindex(engine, "t", dimensions=8)
+    with pytest.raises(reindex.ReindexConflict):
+        reindex.start_reindex(engine, "t", dimensions=8)
+    await reindex.wait("t")
+
+    assert status["state"] == "completed", status.get("error")
+    assert status["copied"] == status["total"] == 5
+    # 同じモデルの次元削減は格納済みベクトルの短縮で済み、埋め込み API を呼ばない
+    assert status["reused_vectors"] == 5 and status["embedded"] == 0
+    assert engine.index_spec("t") == IndexSpec("text-embedding-3-small", 8, 1)
+    assert not (tmp_path / "flat" / "t").exists()
+
+    backend, key = engine._route("t")
+    assert key == "t@g1"
+    vector = backend.get_embeddings(key, backend.get(key)["ids"][:1])
+    assert len(next(iter(vector.values()))) == 8
+    # 検索クエリは新しい次元数で埋め込まれる
+    docs = await engine.search_documents("gamma", top_k=1, tenant="t")
+    assert docs[0].page_content == "gamma" and created == [8]
+    assert (await engine.get_document_list(tenant="t"))["files"] == ids_before
+
+    # 切り替え後のアップロードは新しい世代に入る
+    await engine.create_vectorstore_from_chunks(["zeta"], "new.txt", tenant="t")
+    assert backend.count(key) == 6
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_paces_background_embeddings():
+    limiter = EmbeddingRateLimiter(tokens_per_minute=60_000)  # 1000 トークン/秒
+    start = time.perf_counter()
+    for _ in range(3):
+        await limiter.acquire(100)
+    assert time.perf_counter() - start >= 0.19
+    assert limiter.waited_seconds >= 0.19
+
+
+@pytest.mark.asyncio
+async def test_migration_keeps_reads_on_old_model_until_cutover(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "vs"))
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path / "flat"))
+    monkeypatch.setattr(config.settings, "vector_backend", "flat")
+    monkeypatch.setattr(config.settings, "similarity_score_threshold", 1e9)
+    monkeypatch.setattr(config.settings, "reindex_cutover_grace_seconds", 0)
+    monkeypatch.setattr(config.settings, "reindex_embedding_tokens_per_minute", 0)
+    gate = asyncio.Event()
+
+    class NewModel(ShortenedFake):
+        async def aembed_documents(self, texts):
+            await gate.wait()
+            return self.embed_documents(texts)
+
+    engine = RAGEngine()
+    engine.embeddings = ShortenedFake()
+    engine._embeddings_key = ("text-embedding-3-small", None)
+    models = []
+    engine._create_embeddings = lambda model=None, dimensions=None, **_: models.append(
+        model
+    ) or NewModel(dimensions, full=48)
+
+    await engine.create_vectorstore_from_chunks(["alpha", "beta"], "a.txt", tenant="a")
+    await engine.create_vectorstore_from_chunks(["gamma"], "b.txt", tenant="b")
+
+    state = await migration.start_migration(engine, model="text-embedding-3-large")
+    assert set(state["tenants"]) == {"a", "b"}
+    with pytest.raises(reindex.ReindexConflict):
+        reindex.start_reindex(engine, "a", dimensions=8)
+    await asyncio.sleep(0.05)
+
+    # 作成中は旧モデルのインデックスで検索・アップロードできる
+    docs = await engine.search_documents("beta", top_k=1, tenant="a")
+    assert docs[0].page_content == "beta"
+    await engine.create_vectorstore_from_chunks(["delta"], "late.txt", tenant="a")
+    assert state["tenants"]["a"]["state"] == "copying"
+
+    gate.set()
+    await migration.wait()
+
+    saved = migration.load_state()
+    assert saved["state"] == "completed", saved.get("error")
+    assert saved["tenants"]["a"]["copied"] == 3
+    assert {t["state"] for t in saved["tenants"].values()} == {"completed"}
+    new_spec = IndexSpec("text-embedding-3-large", None, 1)
+    assert engine.index_spec("a") == engine.index_spec("b") == new_spec
+    assert engine.index_registry.baseline(IndexSpec("x")) == new_spec
+    assert not (tmp_path / "flat" / "a").exists()
+
+    docs = await engine.search_documents("delta", top_k=1, tenant="a")
+    assert docs[0].page_content == "delta"
+    assert set(models) == {"text-embedding-3-large"}
+    # 移行後に初めてアップロードしたテナントは新しい基準で格納される
+    await engine.create_vectorstore_from_chunks(["epsilon"], "c.txt", tenant="c")
+    assert engine._route("c")[1] == "c@g1"
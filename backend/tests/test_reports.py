@@ -0,0 +1,313 @@
+import datetime as dt
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+BASE = "/api/v1/admin/reports"
+SECRET = "test_admin_secret"
+
+
+@pytest.fixture()
+def redis_client(monkeypatch):
+    from app.api import reports
+    from app.core.config import settings
+
+    rc = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(reports, "_get_redis", lambda: rc)
+    monkeypatch.setattr(settings, "admin_api_secret", SECRET)
+    return rc
+
+
+def _seed_day(rc, day: str, count: int, tokens: float, clients: list[str]):
+    rc.set(f"metrics:{day}:acme:count", count)
+    rc.set(f"tokens:{day}:acme", tokens)
+    rc.set(f"cost:{day}:acme", 1.5)
+    rc.hset(f"docs:{day}:acme", mapping={"hit": count - 1, "zero_hit": 1})
+    rc.hset(f"feedback:{day}:acme", mapping={"yes": 3, "no": 1})
+    rc.pfadd(f"hll:{day}:acme:clients", *clients)
+    rc.zincrby(f"docs_rank:{day}:acme", count, "file-1")
+    rc.zincrby(f"chunks_rank:{day}:acme", count, "file-1:0")
+
+
+def test_summary_aggregates_range(client: TestClient, redis_client):
+    _seed_day(redis_client, "2024-01-01", 4, 100.0, ["a", "b"])
+    _seed_day(redis_client, "2024-01-02", 6, 250.0, ["b", "c"])
+
+    r = client.get(
+        f"{BASE}/summary",
+        params={"tenant": "acme", "start": "2024-01-01", "end": "2024-01-03"},
+        headers={"x-admin-api-secret": SECRET},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert data["questions"] == 10
+    # トークンは期間で累積される
+    assert data["tokens"] == 350.0
+    assert data["cost_jpy"] == 3.0
+    # 日次HLLの単純合計(4)ではなく和集合(a,b,c)
+    assert data["unique_users"] == 3
+    assert data["resolved_rate"] == 0.75
+    assert data["zero_hit_rate"] == 0.2
+    assert data["top_docs"] == [{"id": "file-1", "count": 10}]
+
+
+def _count_pipelines(rc) -> list[int]:
+    calls: list[int] = []
+    original = rc.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    rc.pipeline = counting_pipeline
+    return calls
+
+
+def test_summary_without_rollups_uses_single_fetch(redis_client):
+    from app.core.services.report_rollup import Bucket, fetch_summary
+
+    calls = _count_pipelines(redis_client)
+    days = [dt.date(2024, 1, 1) + dt.timedelta(days=i) for i in range(90)]
+    agg = fetch_summary(redis_client, "acme", [Bucket("day", d, d) for d in days])
+    assert len(calls) == 1
+    assert agg["questions"] == 0
+    assert agg["unique_users"] == 0
+
+
+def test_rollup_plans_coarsest_buckets(redis_client):
+    from app.core.services.report_rollup import (
+        fetch_summary,
+        plan_buckets,
+        rollup_tenant,
+    )
+
+    d0, d1 = dt.date(2024, 1, 1), dt.date(2024, 2, 29)
+    for i in range((d1 - d0).days + 1):
+        day = (d0 + dt.timedelta(days=i)).strftime("%Y-%m-%d")
+        _seed_day(redis_client, day, 2, 10.0, [f"user-{i % 7}"])
+    today = dt.date(2024, 3, 5)
+    before = fetch_summary(
+        redis_client, "acme", plan_buckets(redis_client, "acme", d0, d1, today)
+    )
+
+    built = rollup_tenant(redis_client, "acme", today=today)
+    assert "M2024-01" in built and "M2024-02" in built
+
+    calls = _count_pipelines(redis_client)
+    plan = plan_buckets(redis_client, "acme", d0, d1, today)
+    assert [b.kind for b in plan] == ["month", "month"]
+    after = fetch_summary(redis_client, "acme", plan)
+    assert len(calls) == 2
+    assert after == before
+    assert after["unique_users"] == 7
+    # 月次ロールアップ済みの日次キーには失効期限が付く
+    assert redis_client.ttl("metrics:2024-01-15:acme:count") > 0
+    # 構築済みのバケットは再構築しない
+    assert rollup_tenant(redis_client, "acme", today=today) == []
+
+
+def test_summary_clamps_mid_month_start_past_retention(
+    client: TestClient, redis_client, monkeypatch
+):
+    from app.core.config import settings
+    from app.core.services import report_rollup
+
+    d0, d1 = dt.date(2024, 1, 1), dt.date(2024, 3, 31)
+    for i in range((d1 - d0).days + 1):
+        _seed_day(redis_client, f"{d0 + dt.timedelta(days=i)}", 2, 10.0, ["a"])
+    monkeypatch.setattr(settings, "report_rollup_lookback_days", 120)
+    report_rollup.rollup_tenant(redis_client, "acme", today=dt.date(2024, 4, 5))
+    # 保持期間（90日）を過ぎた日次キーの失効を再現する
+    today = dt.date(2024, 6, 1)
+    monkeypatch.setattr(settings, "report_daily_retention_days", 90)
+    monkeypatch.setattr(report_rollup, "today_jst", lambda: today)
+    first_retained = dt.date(2024, 3, 4)
+    for i in range((first_retained - d0).days):
+        day = f"{d0 + dt.timedelta(days=i)}"
+        redis_client.delete(*report_rollup.day_keys(day, "acme").values())
+
+    headers = {"x-admin-api-secret": SECRET}
+    r = client.get(
+        f"{BASE}/summary",
+        params={"tenant": "acme", "start": "2024-01-15", "end": "2024-03-31"},
+        headers=headers,
+    )
+    data = r.json()
+    # 1月は途中からのため集計できず、2月・3月の月次ロールアップだけを数える
+    assert data["clamped"] is True
+    assert data["period"] == {"from": "2024-02-01", "to": "2024-03-31"}
+    assert data["requested_period"] == {"from": "2024-01-15", "to": "2024-03-31"}
+    assert data["questions"] == 2 * (29 + 31)
+
+    # 失効していない日は日次キーで数える
+    r = client.get(
+        f"{BASE}/summary",
+        params={"tenant": "acme", "start": "2024-03-10", "end": "2024-03-20"},
+        headers=headers,
+    )
+    assert r.json()["clamped"] is False and r.json()["questions"] == 22
+    r = client.get(
+        f"{BASE}/summary/evidence",
+        params={"tenant": "acme", "start": "2024-01-15", "end": "2024-01-20"},
+        headers=headers,
+    )
+    assert r.status_code == 400
+
+
+def test_rollup_migrates_legacy_hashes_and_trims(redis_client, monkeypatch):
+    from app.core.config import settings
+    from app.core.services.report_rollup import (
+        Bucket,
+        fetch_chunks_top,
+        rollup_tenant,
+    )
+
+    monkeypatch.setattr(settings, "report_top_n", 3)
+    day = dt.date(2024, 3, 4)
+    label = day.strftime("%Y-%m-%d")
+    for i in range(10):
+        redis_client.hincrby(f"chunks_top:{label}:acme", f"file-{i}:0", i + 1)
+
+    rollup_tenant(redis_client, "acme", today=day)
+
+    assert not redis_client.exists(f"chunks_top:{label}:acme")
+    assert redis_client.zcard(f"chunks_rank:{label}:acme") == 3
+    top = fetch_chunks_top(redis_client, "acme", [Bucket("day", day, day)], top_n=2)
+    assert top == [("file-9:0", 10), ("file-8:0", 9)]
+
+
+@pytest.mark.asyncio
+async def test_legacy_hashes_outside_rollup_window_still_reported(
+    app, redis_client, monkeypatch
+):
+    import httpx
+
+    from app.api import reports
+    from app.core.services.report_rollup import today_jst
+    from app.core.web import dependencies
+    from tests.conftest import FakeRAGEngine
+
+    monkeypatch.setattr(dependencies, "get_rag_engine", lambda: FakeRAGEngine())
+    day = (today_jst() - dt.timedelta(days=100)).strftime("%Y-%m-%d")
+    redis_client.set(f"metrics:{day}:acme:count", 5)
+    redis_client.hset(f"docs_top:{day}:acme", mapping={"file-1": 4, "file-2": 1})
+    redis_client.hset(f"chunks_top:{day}:acme", mapping={"file-1:0": 4})
+    redis_client.expire(f"docs_top:{day}:acme", 3600)
+    # ロールアップの対象期間より古い日も、ロールアップを待たずに移行される
+    await reports.migrate_legacy_reports()
+
+    assert not redis_client.exists(f"docs_top:{day}:acme")
+    assert 0 < redis_client.ttl(f"docs_rank:{day}:acme") <= 3600
+    params = {"tenant": "acme", "start": day, "end": day}
+    headers = {"x-admin-api-secret": SECRET}
+    monkeypatch.setattr(reports, "_infer_questions", _fake_infer)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        summary = await c.get(f"{BASE}/summary", params=params, headers=headers)
+        evidence = await c.get(
+            f"{BASE}/summary/evidence", params=params, headers=headers
+        )
+    assert summary.json()["top_docs"] == [
+        {"id": "file-1", "count": 4},
+        {"id": "file-2", "count": 1},
+    ]
+    [card] = evidence.json()["evidences"]
+    assert card["source"]["file_id"] == "file-1" and card["hit_count"] == 4
+    # 移行済みなら再実行しても二重に加算しない
+    await reports.migrate_legacy_reports()
+    assert redis_client.zscore(f"docs_rank:{day}:acme", "file-1") == 4
+
+
+def test_legacy_scan_runs_until_marked_done(redis_client):
+    from app.api import reports
+    from app.core.services.report_rollup import LEGACY_MIGRATED_KEY
+
+    scans = []
+    scan_iter = redis_client.scan_iter
+    redis_client.scan_iter = lambda **kw: scans.append(kw) or scan_iter(**kw)
+    redis_client.hset("docs_top:2020-01-01:acme", mapping={"file-1": 1})
+
+    # 定期実行のロールアップは全件を走査しない
+    reports._rollup_all(["acme"])
+    assert scans == [] and redis_client.exists("docs_top:2020-01-01:acme")
+
+    assert reports._migrate_legacy() == 1
+    assert redis_client.exists(LEGACY_MIGRATED_KEY)
+    scans.clear()
+    assert reports._migrate_legacy() == 0
+    reports._rollup_all(["acme"], migrate=True)
+    assert scans == []
+
+
+async def _fake_infer(evidences):
+    return ["q1", "q2", "q3"]
+
+
+def test_evidence_caches_inferred_questions(
+    client: TestClient, redis_client, monkeypatch
+):
+    from app.api import reports
+    from app.core.web import dependencies
+    from tests.conftest import FakeRAGEngine
+
+    monkeypatch.setattr(dependencies, "get_rag_engine", lambda: FakeRAGEngine())
+    calls = []
+
+    async def fake_infer(evidences):
+        calls.append(len(evidences))
+        return ["q1", "q2", "q3"]
+
+    monkeypatch.setattr(reports, "_infer_questions", fake_infer)
+    _seed_day(redis_client, "2024-01-01", 4, 100.0, ["a"])
+    params = {"tenant": "acme", "start": "2024-01-01", "end": "2024-01-01"}
+    headers = {"x-admin-api-secret": SECRET}
+
+    first = client.get(f"{BASE}/summary/evidence", params=params, headers=headers)
+    second = client.get(f"{BASE}/summary/evidence", params=params, headers=headers)
+    assert first.json()["inference_status"] == "computed"
+    assert second.json()["inference_status"] == "cached"
+    assert second.json()["inferred_question"] == ["q1", "q2", "q3"]
+    assert calls == [1]
+
+    # 上位チャンクが変わると再計算される
+    redis_client.zincrby("chunks_rank:2024-01-01:acme", 10, "file-2:3")
+    third = client.get(f"{BASE}/summary/evidence", params=params, headers=headers)
+    assert third.json()["inference_status"] == "computed"
+    assert calls == [1, 2]
+
+
+def test_ask_keeps_daily_rank_sets_bounded_without_rollups(
+    app, redis_client, monkeypatch
+):
+    from app.api import embed_ingest
+    from app.core.config import settings
+    from app.core.services.report_rollup import day_keys, today_jst
+    from app.core.web.dependencies import get_rag_engine
+    from tests.conftest import FakeRAGEngine
+
+    class DistinctDocsEngine(FakeRAGEngine):
+        async def generate_answer(self, question, *args, **kwargs):
+            result = await super().generate_answer(question, *args, **kwargs)
+            for d in result["documents"]:
+                d["metadata"].update(file_id=question, chunk_index=0)
+            return result
+
+    monkeypatch.setattr(embed_ingest, "_get_redis", lambda: redis_client)
+    monkeypatch.setattr(settings, "report_rollup_interval_seconds", 0)
+    monkeypatch.setattr(settings, "report_top_n", 3)
+    monkeypatch.setattr(settings, "report_top_trim_sample_rate", 1.0)
+    app.dependency_overrides[get_rag_engine] = lambda: DistinctDocsEngine()
+    client = TestClient(app)
+
+    for i in range(10):
+        r = client.post(
+            "/api/v1/embed/docs/ask",
+            headers={"x-embed-key": "demo123"},
+            json={"question": f"質問{i}"},
+        )
+        assert r.status_code == 200
+
+    keys = day_keys(today_jst().strftime("%Y-%m-%d"), "acme")
+    assert redis_client.zcard(keys["docs_top"]) == 3
+    assert redis_client.zcard(keys["chunks_top"]) == 3
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.core import config, tracing
+from app.core.metrics import stage_timer
+
+BASE = "/api/v1/embed/docs"
+SECRET = "trace-secret"
+
+
+@pytest.fixture(autouse=True)
+def _clear_traces(monkeypatch):
+    monkeypatch.setattr(config.settings, "trace_sample_rate", 0.0)
+    monkeypatch.setattr(config.settings, "trace_slow_ms", 1000.0)
+    tracing.buffer.clear()
+    yield
+    tracing.buffer.clear()
+
+
+def test_spans_nest_and_follow_tasks(monkeypatch):
+    monkeypatch.setattr(config.settings, "trace_sample_rate", 1.0)
+
+    async def handler():
+        with stage_timer("retrieval") as span:
+            span.set(documents=3)
+            await asyncio.gather(child("a"), child("b"))
+        tracing.set_attributes(model="m")
+
+    async def child(name: str):
+        with tracing.span(name):
+            await asyncio.sleep(0)
+
+    with tracing.trace("ask", tenant="t"):
+        asyncio.run(handler())
+
+    [trace] = tracing.slowest(10)
+    assert trace["name"] == "ask"
+    assert trace["attributes"] == {"tenant": "t", "model": "m"}
+    [retrieval] = trace["children"]
+    assert retrieval["attributes"] == {"documents": 3}
+    assert sorted(c["name"] for c in retrieval["children"]) == ["a", "b"]
+
+
+def test_spans_outside_trace_are_noops():
+    with tracing.span("orphan") as span:
+        span.set(x=1)
+    tracing.set_attributes(y=2)
+    assert len(tracing.buffer) == 0
+
+
+def test_tail_sampling_keeps_slow_and_failed(monkeypatch):
+    with tracing.trace("fast"):
+        pass
+    monkeypatch.setattr(config.settings, "trace_slow_ms", 0.0)
+    with tracing.trace("slow"):
+        pass
+    monkeypatch.setattr(config.settings, "trace_slow_ms", 1000.0)
+    with pytest.raises(RuntimeError):
+        with tracing.trace("broken"):
+            raise RuntimeError("boom")
+    with pytest.raises(HTTPException):
+        with tracing.trace("limited"):
+            raise HTTPException(429, "rate limit exceeded")
+
+    kept = {t["name"]: t for t in tracing.slowest(10)}
+    assert set(kept) == {"slow", "broken"}
+    assert kept["broken"]["failed"] is True
+    assert kept["broken"]["error"] == "RuntimeError: boom"
+    assert tracing.buffer.seen == 4
+
+
+def test_buffer_is_bounded(monkeypatch):
+    monkeypatch.setattr(config.settings, "trace_sample_rate", 1.0)
+    buffer = tracing.TraceBuffer(2)
+    for name in ("a", "b", "c"):
+        buffer.offer(tracing.Trace(name, {}))
+    assert len(buffer) == 2
+    assert buffer.seen == 3
+
+
+def test_admin_traces_returns_ask_breakdown(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config.settings, "admin_api_secret", SECRET)
+    monkeypatch.setattr(config.settings, "trace_slow_ms", 0.0)
+    headers = {"x-embed-key": "demo123", "x-test-environment": "true"}
+    r = client.post(f"{BASE}/ask", headers=headers, json={"question": "返品は?"})
+    assert r.status_code == 200
+
+    assert client.get("/api/v1/admin/traces").status_code == 401
+    r = client.get("/api/v1/admin/traces", headers={"x-admin-api-secret": SECRET})
+    assert r.status_code == 200
+    body = r.json()
+    [trace] = [t for t in body["traces"] if t["name"] == "ask"]
+    assert trace["attributes"]["tenant"] == "acme"
+    stages = [c["name"] for c in trace["children"]]
+    for stage in ("auth", "rate_limit", "budget_check", "generate", "accounting"):
+        assert stage in stages
+    token_count = next(c for c in trace["children"] if c["name"] == "token_count")
+    assert token_count["attributes"]["output_tokens"] >= 1
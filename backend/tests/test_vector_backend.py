@@ -0,0 +1,299 @@
+import chromadb
+import numpy as np
+import pytest
+from chromadb.config import Settings as ChromaSettings
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.core import config
+from app.core.services.flat_index import FlatVectorBackend, tenant_dirname
+from app.core.services.rag_engine import RAGEngine
+from app.core.services.vector_backend import ChromaVectorBackend, matches_where
+
+
+def _add(backend, tenant, vectors, file_id="f1"):
+    ids = [f"{file_id}-{i}" for i in range(len(vectors))]
+    metadatas = [
+        {"tenant": tenant, "file_id": file_id, "chunk_index": i}
+        for i in range(len(vectors))
+    ]
+    texts = [f"{file_id} chunk {i}" for i in range(len(vectors))]
+    backend.add(tenant, ids, texts, vectors, metadatas)
+    return ids
+
+
+def test_matches_where_operators():
+    md = {"tenant": "a", "file_id": "f", "chunk_index": 2}
+    assert matches_where(md, {"tenant": "a"})
+    assert matches_where(
+        md, {"$and": [{"file_id": {"$eq": "f"}}, {"chunk_index": {"$in": [1, 2]}}]}
+    )
+    assert not matches_where(
+        md, {"$or": [{"tenant": {"$ne": "a"}}, {"chunk_index": 3}]}
+    )
+
+
+def test_flat_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    backend = FlatVectorBackend(tmp_path)
+    _add(backend, "a", vectors.tolist())
+    query = rng.normal(size=16).astype(np.float32)
+
+    results = backend.search("a", query.tolist(), 5)
+
+    expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+    assert [doc.metadata["chunk_index"] for doc, _ in results] == expected.tolist()
+    scores = [score for _, score in results]
+    assert scores == sorted(scores)
+    assert scores[0] == pytest.approx(
+        float(((vectors[expected[0]] - query) ** 2).sum()), rel=1e-4
+    )
+
+
+def test_flat_filter_delete_and_reload(tmp_path):
+    rng = np.random.default_rng(1)
+    backend = FlatVectorBackend(tmp_path, dtype="float16")
+    ids_a = _add(backend, "a", rng.normal(size=(10, 8)).tolist(), file_id="fa")
+    _add(backend, "a", rng.normal(size=(5, 8)).tolist(), file_id="fb")
+    _add(backend, "b", rng.normal(size=(3, 8)).tolist(), file_id="fc")
+
+    hits = backend.search("a", [0.0] * 8, 20, where={"file_id": {"$eq": "fb"}})
+    assert len(hits) == 5
+    assert {doc.metadata["file_id"] for doc, _ in hits} == {"fb"}
+    assert backend.count("a") == 15 and backend.count() == 18
+
+    backend.delete("a", ids_a[:4])
+    reopened = FlatVectorBackend(tmp_path, dtype="float16")
+    assert reopened.count("a") == 11
+    got = reopened.get("a", ids=[ids_a[5]])
+    assert got["documents"] == ["fa chunk 5"]
+    assert reopened.get("b", include_documents=False)["documents"] == []
+
+
+@pytest.mark.parametrize("tenant", ["..", ".", "../x", "a/../..", "%2E%2E"])
+def test_flat_tenant_directory_stays_inside_root(tmp_path, tenant):
+    root = tmp_path / "flat"
+    path = (root / tenant_dirname(tenant)).resolve()
+    assert path.parent == root.resolve()
+
+    backend = FlatVectorBackend(root)
+    _add(backend, tenant, [[1.0, 0.0]], file_id="f")
+    _add(backend, "other", [[0.0, 1.0]], file_id="g")
+    assert backend.tenants() == sorted([tenant, "other"])
+    backend.drop(tenant)
+    assert root.is_dir() and backend.count("other") == 1
+
+
+@pytest.mark.asyncio
+async def test_engine_routes_tenant_to_flat_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(
+        config.settings, "vector_backend_tenants", "flatco:flat,other:flat"
+    )
+    monkeypatch.setattr(config.settings, "similarity_score_threshold", 1e9)
+    engine = RAGEngine()
+    engine.embeddings = DeterministicFakeEmbedding(size=32)
+
+    res = await engine.create_vectorstore_from_chunks(
+        ["alpha", "beta", "gamma"], "doc.txt", tenant="flatco"
+    )
+    assert res["collection_id"] == "flat:flatco"
+
+    docs = await engine.search_documents("beta", top_k=1, tenant="flatco")
+    assert docs[0].page_content == "beta"
+
+    listing = await engine.get_document_list(tenant="flatco")
+    assert listing["total_chunks"] == 3
+    file_id = listing["files"][0]["file_id"]
+    chunks = await engine.get_chunks_by_file_and_index([(file_id, 2)], tenant="flatco")
+    assert chunks[0]["content"] == "gamma"
+
+    await engine.create_vectorstore_from_chunks(["delta"], "other.txt", tenant="other")
+    deleted = await engine.delete_document_by_file_id(file_id, tenant="flatco")
+    assert deleted["deleted_chunks"] == 3
+    assert deleted["remaining_chunks"] == 0  # 他テナントのチャンクは数えない
+    assert (await engine.get_document_list(tenant="flatco"))["total_chunks"] == 0
+
+
+def test_flat_segments_are_shared_between_workers(tmp_path):
+    rng = np.random.default_rng(2)
+    writer = FlatVectorBackend(tmp_path)
+    reader = FlatVectorBackend(tmp_path)  # 別ワーカー相当（同じディレクトリを参照）
+    first = _add(writer, "a", rng.normal(size=(4, 8)).tolist(), file_id="f1")
+    assert reader.count("a") == 4
+    seg_files = sorted(p.name for p in (tmp_path / "a").glob("seg-*.npy"))
+
+    # 追加は新しいセグメントを公開するだけで、既存セグメントは書き換えない
+    _add(writer, "a", rng.normal(size=(3, 8)).tolist(), file_id="f2")
+    assert set(seg_files) <= {p.name for p in (tmp_path / "a").glob("seg-*.npy")}
+    assert reader.count("a") == 7
+
+    # 別インスタンスからの削除も再起動なしで取り込まれる
+    reader.delete("a", first[:2])
+    assert writer.count("a") == 5
+    assert {
+        doc.metadata["file_id"] for doc, _ in writer.search("a", [0.0] * 8, 10)
+    } == {"f1", "f2"}
+
+
+def test_flat_lru_evicts_cold_tenants(tmp_path):
+    rng = np.random.default_rng(3)
+    seed = FlatVectorBackend(tmp_path)
+    for tenant in ("a", "b", "c"):
+        _add(seed, tenant, rng.normal(size=(4, 8)).tolist())
+
+    backend = FlatVectorBackend(tmp_path, max_tenants=2)
+    assert not backend.is_resident("a")
+    backend.search("a", [0.0] * 8, 1)
+    backend.search("b", [0.0] * 8, 1)
+    backend.search("a", [0.0] * 8, 1)  # a を最近使用に
+    backend.search("c", [0.0] * 8, 1)  # 上限超過 → 最も古い b を退避
+
+    assert backend.is_resident("a") and backend.is_resident("c")
+    assert not backend.is_resident("b")
+    info = backend.info()
+    assert [t["tenant"] for t in info["tenants"]] == ["a", "c"]
+    assert [(e["event"], e["tenant"]) for e in info["events"]][-2:] == [
+        ("load", "c"),
+        ("evict", "b"),
+    ]
+    # 退避後も次回アクセスで再読み込みされる
+    assert backend.count("b") == 4
+
+
+@pytest.mark.asyncio
+async def test_engine_warms_flat_tenant_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "flat_index_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "vector_backend", "flat")
+    _add(FlatVectorBackend(tmp_path), "cold", [[0.1] * 8, [0.2] * 8])
+    engine = RAGEngine()
+
+    task = engine.prefetch("cold")
+    assert task is not None and engine.prefetch("cold") is task
+    await task
+    assert engine._flat_backend.is_resident("cold")
+    assert engine.prefetch("cold") is None
+    info = await engine.get_system_info()
+    assert info["flat_index"]["tenants"][0]["tenant"] == "cold"
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+def test_flat_distances_match_chroma_space(tmp_path, space):
+    rng = np.random.default_rng(4)
+    vectors = rng.normal(size=(50, 8)).astype(np.float32)
+    query = rng.normal(size=8).astype(np.float32).tolist()
+    client = chromadb.PersistentClient(
+        path=str(tmp_path / "chroma"),
+        settings=ChromaSettings(anonymized_telemetry=False),
+    )
+    chroma = ChromaVectorBackend(
+        client.create_collection(
+            "cmp", metadata={"hnsw:space": space, "hnsw:search_ef": 100}
+        )
+    )
+    flat = FlatVectorBackend(tmp_path / "flat", space=space)
+    _add(chroma, "a", vectors.tolist())
+    _add(flat, "a", vectors.tolist())
+
+    assert chroma.space_for("a") == flat.space_for("a") == space
+    expected = [(d.metadata["chunk_index"], s) for d, s in chroma.search("a", query, 5)]
+    actual = [(d.metadata["chunk_index"], s) for d, s in flat.search("a", query, 5)]
+    assert [i for i, _ in actual] == [i for i, _ in expected]
+    assert [s for _, s in actual] == pytest.approx([s for _, s in expected], abs=1e-4)
+
+
+def test_hnsw_settings_per_tenant(monkeypatch):
+    s = config.settings
+    monkeypatch.setattr(s, "hnsw_search_ef", 40)
+    monkeypatch.setattr(
+        s, "hnsw_tenants", "a:space=cosine,m=32; b:search_ef=x,construction_ef=200"
+    )
+    assert s.hnsw_params_for("a") == {
+        "space": "cosine",
+        "construction_ef": 100,
+        "search_ef": 40,
+        "m": 32,
+    }
+    assert s.hnsw_collection_metadata("b")["hnsw:construction_ef"] == 200
+    assert s.hnsw_collection_metadata("b")["hnsw:search_ef"] == 40
+    monkeypatch.setattr(s, "similarity_score_threshold", 1.8)
+    assert s.score_threshold_for("l2") == 1.8
+    assert s.score_threshold_for("cosine") == pytest.approx(0.9)
+    monkeypatch.setattr(s, "cosine_score_threshold", 0.5)
+    assert s.score_threshold_for("ip") == 0.5
+
+
+@pytest.mark.asyncio
+async def test_engine_uses_dedicated_collection_for_tenant_hnsw(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path))
+    monkeypatch.setattr(config.settings, "hnsw_tenants", "cos:space=cosine")
+    monkeypatch.setattr(config.settings, "cosine_score_threshold", 0.05)
+    engine = RAGEngine()
+    engine.embeddings = DeterministicFakeEmbedding(size=32)
+    engine._chroma_client = chromadb.PersistentClient(
+        path=str(tmp_path), settings=ChromaSettings(anonymized_telemetry=False)
+    )
+    assert await engine._load_existing_vectorstore()
+
+    await engine.create_vectorstore_from_chunks(
+        ["alpha", "beta"], "d.txt", tenant="cos"
+    )
+    await engine.create_vectorstore_from_chunks(["gamma"], "e.txt", tenant="other")
+
+    backend, _ = engine._route("cos")
+    assert backend.collection.name != engine.vectorstore._collection.name
+    assert backend.hnsw_params["space"] == "cosine"
+    assert engine._route("other")[0].space_for("other") == "l2"
+    # cosine 距離の閾値で絞り込まれる（完全一致のみ残る）
+    docs = await engine.search_documents("beta", top_k=2, tenant="cos")
+    assert [d.page_content for d in docs] == ["beta"]
+    info = await engine.get_system_info()
+    assert info["tenant_collections"][backend.collection.name]["hnsw"]["space"] == (
+        "cosine"
+    )
+
+
+def test_multiple_workers_require_chroma_server():
+    with pytest.raises(ValueError, match="CHROMA_MODE=http"):
+        config.Settings(workers=2, chroma_mode="embedded", vector_backend="chroma")
+    served = config.Settings(
+        workers=2, chroma_mode="http", chroma_host="chroma", vector_backend="chroma"
+    )
+    assert served.chroma_host == "chroma"
+    # flat バックエンドだけならワーカー間でファイルを共有できる
+    assert config.Settings(workers=2, chroma_mode="embedded", vector_backend="flat")
+
+
+@pytest.mark.asyncio
+async def test_engine_connects_to_chroma_server_in_http_mode(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_http_client(**kwargs):
+        calls.append(kwargs)
+        return chromadb.PersistentClient(
+            path=str(tmp_path / "server"),
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+
+    monkeypatch.setattr(chromadb, "HttpClient", fake_http_client)
+    monkeypatch.setattr(config.settings, "persist_directory", str(tmp_path / "local"))
+    monkeypatch.setattr(config.settings, "embedding_provider", "local")
+    monkeypatch.setattr(config.settings, "local_embedding_dimensions", 32)
+    monkeypatch.setattr(config.settings, "chat_provider", "fake")
+    monkeypatch.setattr(config.settings, "chroma_mode", "http")
+    monkeypatch.setattr(config.settings, "chroma_host", "chroma.internal")
+    monkeypatch.setattr(config.settings, "chroma_port", 8001)
+    monkeypatch.setattr(config.settings, "chroma_auth_token", "tok")
+    engine = RAGEngine()
+    await engine.initialize()
+
+    assert len(calls) == 1
+    assert calls[0]["host"] == "chroma.internal"
+    assert calls[0]["port"] == 8001
+    assert calls[0]["headers"] == {"Authorization": "Bearer tok"}
+    assert engine.vectorstore is not None
+    info = await engine.get_system_info()
+    assert info["chroma_mode"] == "http"
+    assert info["chroma_server"] == "chroma.internal:8001"
+    # 埋め込みモードのローカル永続化ディレクトリには何も作らない
+    assert not (tmp_path / "local" / "chroma.sqlite3").exists()